@@ -0,0 +1,54 @@
+"""Move the replays that are not looked at anymore to a compressed pack per map, or get one back
+
+python archive.py                         # every replay that isn't the PB of its player
+python archive.py --older-than 90         # and every replay older than 90 days, PBs included
+python archive.py --older-than 90 --keep-non-pbs
+python archive.py --extract <digest> out/ # copy of an archived replay (digest from the export), under its original name
+Run it while the app is not watching: both write the map data."""
+
+import argparse
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent / "code_folder"))
+
+from cold_archive import archive_all, extract_replay
+from data_handler import load
+from storage import map_folder_path
+
+data_file = Path(__file__).resolve().parent / "code_folder/data.pkl"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Cold archive of the replay files")
+    parser.add_argument("--older-than", type=float, metavar="DAYS", help="Also archive the replays older than this, PBs included")
+    parser.add_argument("--keep-non-pbs", action="store_true", help="Don't archive replays only because they aren't a PB")
+    parser.add_argument("--extract", nargs=2, metavar=("DIGEST", "OUTPUT"), help="Write a copy of an archived replay")
+    args = parser.parse_args()
+
+    if not data_file.exists():
+        print("Nothing to archive, data file is not created yet.")
+        sys.exit(1)
+    _, destination, data = load(data_file)
+    destination = Path(destination)
+
+    if args.extract:
+        file_digest = bytes.fromhex(args.extract[0])
+        for map_uid in data["map_uids"]:
+            map_folder = map_folder_path(destination, map_uid)
+            map_data = load(map_folder / "data.pkl")
+            if file_digest in map_data["runs"]:
+                print(f"Extracted to {extract_replay(map_folder, map_data, file_digest, Path(args.extract[1]))}")
+                return
+        print(f"No run with the digest {args.extract[0]}")
+        sys.exit(1)
+
+    if args.keep_non_pbs and args.older_than is None:
+        print("Nothing to archive: give --older-than when keeping the non-PB replays.")
+        sys.exit(1)
+    archived, freed = archive_all(destination, data, args.older_than, not args.keep_non_pbs)
+    print(f"Archived {archived} replays, {freed / 1024 ** 2:.1f} MB freed")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,250 @@
+"""Benchmark suite for the replay ingest and map stats hot paths
+
+Usage:
+    python benchmarks/bench.py                          # every benchmark at 1k, 10k and 100k
+    python benchmarks/bench.py --scales 1000 --only map_stats plot_data
+    python benchmarks/bench.py --save my_baseline       # store the results in benchmarks/baselines/
+    python benchmarks/bench.py --compare my_baseline    # show the ratio against a stored baseline
+
+Everything runs on synthetic replays from gbx_generator.py in a temporary
+folder, the xaseco lookup is replaced by the generator map table so no
+network access is needed."""
+
+import argparse
+import contextlib
+import json
+import os
+import platform
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime
+from pathlib import Path
+
+BENCH_DIR = Path(__file__).resolve().parent
+sys.path.insert(0, str(BENCH_DIR.parent / "code_folder"))
+os.environ.setdefault("MPLBACKEND", "Agg")
+
+import treat_files
+from php_like import GBXReplayFetcher
+from data_handler import save, load
+from run_record import make_run
+from players import PlayerTable
+from metrics import METRICS
+from sessions import update_analysis
+from leaderboards import new_leaderboards
+from gbx_generator import ReplaySet
+
+BASELINE_DIR = BENCH_DIR / "baselines"
+DEFAULT_SCALES = (1_000, 10_000, 100_000)
+INGEST_BATCH = 100  # Files ingested per treat_new_file measurement
+RUNS_PER_MAP = 100  # Map density used to lay out the sanitise benchmark
+
+
+@contextlib.contextmanager
+def quiet():
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        yield
+
+
+def build_runs(replay_set: ReplaySet, count: int, players: PlayerTable) -> dict:
+    """Runs in the layout written by treat_new_file, without touching the disk"""
+    rng = replay_set.rng
+    runs = {}
+    start = int(datetime(2024, 1, 1).timestamp())
+    map_uid = replay_set.map_uids[0]
+    for i in range(count):
+        login = rng.choice(replay_set.logins)
+        runs[rng.randbytes(16)] = make_run(
+            players.get_id(login, login),
+            replay_set.base_times[map_uid] + int(rng.expovariate(1 / 2000)),
+            rng.choice((0, 0, 0, 1, 2)),
+            rng.randint(0, 50),
+            start + i * 60,
+            f"synthetic_{i:06d}.Replay.Gbx",
+        )
+    return runs
+
+
+def build_map_data(replay_set: ReplaySet, count: int, players: PlayerTable) -> dict:
+    map_data = replay_set.map_info(replay_set.map_uids[0])
+    map_data["uid"] = replay_set.map_uids[0]
+    map_data["runs"] = build_runs(replay_set, count, players)
+    return map_data
+
+
+def bench_process_gbx(scale: int, workdir: Path) -> float:
+    replay_set = ReplaySet(maps=10, players=20, seed=scale)
+    replays = [replay_set.replay()[1] for _ in range(scale)]
+
+    start = time.perf_counter()
+    for data in replays:
+        fetcher = GBXReplayFetcher()
+        fetcher.storeGBXdata(data)
+        fetcher.processGBX()
+    return time.perf_counter() - start
+
+
+def bench_treat_new_file(scale: int, workdir: Path) -> float:
+    """Ingest INGEST_BATCH replays into a map that already holds `scale` runs"""
+    replay_set = ReplaySet(maps=1, players=20, seed=scale)
+    map_uid = replay_set.map_uids[0]
+    source = workdir / "source"
+    destination = workdir / "destination"
+
+    players = PlayerTable()
+    map_data = build_map_data(replay_set, scale, players)
+    map_folder = destination / map_uid
+    map_folder.mkdir(parents=True)
+    save(map_data, map_folder / "data.pkl")
+    data_dict = {"map_uids": {map_uid: map_data["name"]}, "map_names": {map_data["name"]: [map_uid]}, "players": players,
+                 "leaderboards": new_leaderboards(), "map_index": {}}
+
+    files = replay_set.write(source, INGEST_BATCH, map_uid)
+
+    start = time.perf_counter()
+    for file in files:
+        treat_files.treat_new_file(file, destination, data_dict)
+    return time.perf_counter() - start
+
+
+def bench_map_stats(scale: int, workdir: Path) -> float:
+    players = PlayerTable()
+    map_data = build_map_data(ReplaySet(maps=1, players=20, seed=scale), scale, players)
+
+    start = time.perf_counter()
+    treat_files.get_map_stats_from_data(map_data, players)
+    return time.perf_counter() - start
+
+
+def bench_plot_data(scale: int, workdir: Path) -> float:
+    players = PlayerTable()
+    runs = build_map_data(ReplaySet(maps=1, players=20, seed=scale), scale, players)["runs"]
+
+    start = time.perf_counter()
+    treat_files.get_plot_data(runs, players)
+    return time.perf_counter() - start
+
+
+def bench_map_load(scale: int, workdir: Path) -> float:
+    data_file = workdir / "data.pkl"
+    save(build_map_data(ReplaySet(maps=1, players=20, seed=scale), scale, PlayerTable()), data_file)
+
+    start = time.perf_counter()
+    load(data_file)
+    return time.perf_counter() - start
+
+
+def bench_map_load_analysis(scale: int, workdir: Path) -> float:
+    """map_load of a map saved with its sessions analysis, as ingest writes it"""
+    data_file = workdir / "data.pkl"
+    map_data = build_map_data(ReplaySet(maps=1, players=20, seed=scale), scale, PlayerTable())
+    update_analysis(map_data)
+    save(map_data, data_file)
+
+    start = time.perf_counter()
+    load(data_file)
+    return time.perf_counter() - start
+
+
+def bench_sanitise_replays(scale: int, workdir: Path) -> float:
+    """Rebuild an archive of `scale` replays spread over maps of RUNS_PER_MAP runs"""
+    replay_set = ReplaySet(maps=max(1, scale // RUNS_PER_MAP), players=20, seed=scale)
+    destination = workdir / "destination"
+    for i in range(scale):
+        map_uid = replay_set.map_uids[i % len(replay_set.map_uids)]
+        folder = destination / replay_set.map_names[map_uid]
+        folder.mkdir(parents=True, exist_ok=True)
+        (folder / f"synthetic_{i:06d}.Replay.Gbx").write_bytes(replay_set.replay(map_uid)[1])
+
+    lookup = treat_files.get_tmnf_map_info
+    treat_files.get_tmnf_map_info = replay_set.map_info
+    try:
+        start = time.perf_counter()
+        treat_files.sanitise_replays(destination, {"map_uids": {}})
+        return time.perf_counter() - start
+    finally:
+        treat_files.get_tmnf_map_info = lookup
+
+
+BENCHMARKS = {
+    "process_gbx": bench_process_gbx,
+    "treat_new_file": bench_treat_new_file,
+    "map_stats": bench_map_stats,
+    "plot_data": bench_plot_data,
+    "map_load": bench_map_load,
+    "map_load_analysis": bench_map_load_analysis,
+    "sanitise_replays": bench_sanitise_replays,
+}
+
+
+def run_benchmark(func, scale: int, repeat: int) -> dict:
+    timings = []
+    for _ in range(repeat):
+        workdir = Path(tempfile.mkdtemp(prefix="tmnf_bench_"))
+        try:
+            with quiet():
+                timings.append(func(scale, workdir))
+        finally:
+            shutil.rmtree(workdir, ignore_errors=True)
+    return {"best": min(timings), "median": statistics.median(timings), "repeat": repeat}
+
+
+def load_baseline(name: str) -> dict:
+    with open(BASELINE_DIR / f"{name}.json", "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def save_baseline(name: str, results: dict) -> Path:
+    BASELINE_DIR.mkdir(exist_ok=True)
+    path = BASELINE_DIR / f"{name}.json"
+    baseline = {
+        "created": datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "results": results,
+    }
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(baseline, f, indent=2)
+    return path
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the replay ingest and stats hot paths")
+    parser.add_argument("--scales", type=int, nargs="+", default=DEFAULT_SCALES)
+    parser.add_argument("--only", nargs="+", choices=BENCHMARKS.keys(), default=list(BENCHMARKS))
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--save", metavar="NAME", help="save the results as a named baseline")
+    parser.add_argument("--compare", metavar="NAME", help="compare against a named baseline")
+    parser.add_argument("--metrics", action="store_true", help="print the ingest stage metrics of each benchmark")
+    args = parser.parse_args()
+
+    if args.metrics:
+        METRICS.enable()
+
+    reference = load_baseline(args.compare)["results"] if args.compare else {}
+
+    results = {}
+    for name in args.only:
+        results[name] = {}
+        for scale in args.scales:
+            result = run_benchmark(BENCHMARKS[name], scale, args.repeat)
+            results[name][str(scale)] = result
+
+            line = f"{name:<18} {scale:>7}  best {result['best']:9.4f}s  median {result['median']:9.4f}s"
+            previous = reference.get(name, {}).get(str(scale))
+            if previous:
+                line += f"  x{previous['best'] / result['best']:.2f} vs {args.compare}"
+            print(line, flush=True)
+            if args.metrics:
+                print(METRICS.summary(), flush=True)
+                METRICS.reset()
+
+    if args.save:
+        print(f"Saved baseline to {save_baseline(args.save, results)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,379 @@
+"""Synthetic TMNF replay generator used by the benchmark suite
+
+Writes GBX files that go through the same parsing path as real replays
+(GBXReplayFetcher and parse_replay.parse_header_xml), with control over the
+header size, the nickname encoding, the lookback strings and the body size."""
+
+import math
+import random
+import string
+import struct
+import zlib
+from pathlib import Path
+
+GBX_AUTOSAVE_TMF = 0x03093000
+
+CHUNK_STRING = 0x03093000
+CHUNK_XML = 0x03093001
+CHUNK_PADDING = 0x03093003  # Not known by the fetcher, only used to grow the header
+CHUNK_GHOST_CHECKPOINTS = 0x0309200B
+CHUNK_BODY_FILLER = 0x03093018  # Skippable chunk standing for the rest of the replay body
+CHUNK_GHOST_DATA = 0x0303F005
+CHUNK_GHOST_DATA_REPLAYING = 0x0303F006
+VEHICLE_CAR_CLASS = 0x0A02B000
+END_OF_NODE = 0xFACADE01
+
+UID_ALPHABET = string.ascii_letters + string.digits + "_"
+
+NICKNAME_ENCODINGS = ("plain", "formatted", "unicode", "bom")
+LOOKBACK_MODES = ("builtin", "inline")
+
+
+def random_uid(rng: random.Random) -> str:
+    return "".join(rng.choice(UID_ALPHABET) for _ in range(27))
+
+
+def make_nickname(login: str, encoding: str = "plain") -> str:
+    if encoding == "plain":
+        return login
+    if encoding == "formatted":
+        return f"$o$f00{login[:1]}$fff{login[1:]}$z$i [syn]"
+    if encoding == "unicode":
+        return f"{login}ωØ «»"
+    if encoding == "bom":
+        return "\ufeff" + login
+    raise ValueError(f"Unknown nickname encoding: {encoding}")
+
+
+def pack_int32(value: int) -> bytes:
+    return struct.pack("<l", value)
+
+
+def pack_uint32(value: int) -> bytes:
+    return struct.pack("<L", value)
+
+
+def pack_string(value: str) -> bytes:
+    data = value.encode("utf-8")
+    return pack_uint32(len(data)) + data
+
+
+class LookbackWriter:
+    """Mirror of GBXBaseFetcher.readLookbackString for the writing side"""
+    BUILTIN = {"Stadium": 26, "Valley": 11, "Canyon": 12, "Lagoon": 13}
+
+    def __init__(self, mode: str = "builtin"):
+        if mode not in LOOKBACK_MODES:
+            raise ValueError(f"Unknown lookback mode: {mode}")
+        self.mode = mode
+        self.strings = []
+        self.started = False
+
+    def write(self, value: str) -> bytes:
+        out = b""
+        if not self.started:
+            out += pack_int32(3)
+            self.started = True
+        if value == "":
+            return out + pack_int32(-1)
+        if self.mode == "builtin" and value in self.BUILTIN:
+            return out + pack_uint32(self.BUILTIN[value])
+        if value in self.strings:
+            return out + pack_uint32(0x40000000 | (self.strings.index(value) + 1))
+        self.strings.append(value)
+        return out + pack_uint32(0x40000000) + pack_string(value)
+
+
+def build_string_chunk(map_uid: str, environment: str, author: str, time_ms: int,
+                       nickname: str, login: str, version: int = 6, lookbacks: str = "builtin") -> bytes:
+    writer = LookbackWriter(lookbacks)
+    data = pack_int32(version)
+    data += writer.write(map_uid)
+    data += writer.write(environment)
+    data += writer.write(author)
+    data += pack_int32(time_ms)
+    data += pack_string(nickname)
+    if version >= 6:
+        data += pack_string(login)
+        if version >= 8:
+            data += b"\x00"
+            data += writer.write("TMUF")
+    return data
+
+
+def build_xml(map_uid: str, time_ms: int, respawns: int, stunt_score: int, validable: bool,
+              checkpoints: int = 5, vehicle: str = "StadiumCar") -> str:
+    return (
+        '<header type="replay" exever="2.11.26" exebuild="2011-02-21_22-56" title="TMUF">'
+        f'<challenge uid="{map_uid}"/>'
+        f'<times best="{time_ms}" respawns="{respawns}" stuntscore="{stunt_score}" validable="{int(validable)}"/>'
+        f'<checkpoints cur="{checkpoints}" onelap="{checkpoints}"/>'
+        f'<playermodel id="{vehicle}"/>'
+        '</header>'
+    )
+
+
+def build_skippable_chunk(chunk_id: int, data: bytes) -> bytes:
+    return pack_uint32(chunk_id) + b"PIKS" + pack_uint32(len(data)) + data
+
+
+def pack_car_sample(x: float, y: float, z: float, speed: float, size: int = 22) -> bytes:
+    """Start of a CSceneVehicleCar sample (position and log speed), zero padded to size"""
+    raw_speed = -0x8000 if speed <= 0 else max(-0x7FFF, min(0x7FFF, round(math.log(speed) * 1000)))
+    data = struct.pack("<3fHhhhbb", x, y, z, 0, 0, 0, raw_speed, 0, 0)
+    return data + bytes(size - len(data))
+
+
+def build_ghost_data(samples: list[tuple], sample_period_ms: int = 100, times: list[int] | None = None,
+                     sample_sizes: list[int] | None = None, replaying: bool = False) -> bytes:
+    """Ghost samples chunk of (x, y, z, speed) samples, speed 0 for a stopped car.
+
+    times stores explicit sample times instead of one every sample_period_ms,
+    sample_sizes gives each sample its own size (variable size samples),
+    replaying writes the 0x0303F006 variant with its leading flag."""
+    sizes = sample_sizes or [22] * len(samples)
+    data = b"".join(pack_car_sample(*sample, size=size) for sample, size in zip(samples, sizes))
+    stream = pack_uint32(VEHICLE_CAR_CLASS) + pack_int32(times is None) + pack_int32(0)
+    stream += pack_int32(sample_period_ms) + pack_int32(0) + pack_int32(len(data)) + data
+    stream += pack_int32(len(samples))
+    if samples:
+        stream += pack_int32(0)  # Offset of the first sample
+        if len(samples) > 1:
+            if sample_sizes is None:
+                stream += pack_int32(22)
+            else:
+                stream += pack_int32(-1) + b"".join(pack_int32(size) for size in sizes[:-1])
+    if times is not None:
+        stream += pack_int32(len(times)) + b"".join(pack_int32(time) for time in times)
+
+    compressed = zlib.compress(stream)
+    chunk = pack_int32(len(stream)) + pack_int32(len(compressed)) + compressed
+    if replaying:
+        return build_skippable_chunk(CHUNK_GHOST_DATA_REPLAYING, pack_int32(1) + chunk)
+    return build_skippable_chunk(CHUNK_GHOST_DATA, chunk)
+
+
+def build_body(checkpoints: list[int] | None = None, filler_size: int = 0,
+               rng: random.Random | None = None, ghost: bytes | None = None) -> bytes:
+    """Replay body chunks: filler bytes, the ghost samples and checkpoint times and the end of node marker"""
+    rng = rng or random.Random()
+    body = b""
+    if filler_size > 0:
+        body += build_skippable_chunk(CHUNK_BODY_FILLER, rng.randbytes(filler_size))
+    if ghost is not None:
+        body += ghost
+    if checkpoints is not None:
+        data = pack_uint32(len(checkpoints)) + b"".join(pack_uint32(time) + pack_uint32(0) for time in checkpoints)
+        body += build_skippable_chunk(CHUNK_GHOST_CHECKPOINTS, data)
+    return body + pack_uint32(END_OF_NODE)
+
+
+def _lzo_length(out: bytearray, value: int, base: int) -> int:
+    """Length field of an instruction: returned if it fits in base, else zero bytes (255 each) and a last byte"""
+    if value <= base:
+        return value
+    rest = value - base
+    while rest > 255:
+        out.append(0)
+        rest -= 255
+    out.append(rest)
+    return 0
+
+
+def lzo_compress(data: bytes) -> bytes:
+    """LZO1X stream with greedy matches (M2, M3 and M4 instructions), to exercise the decoder match paths"""
+    out = bytearray()
+    flag = None  # Index of the byte of the last match holding the number of literals after it
+    last = {}
+    pos = lit_start = 0
+
+    def literals(end: int):
+        nonlocal flag
+        run = data[lit_start:end]
+        if not run:
+            return
+        if not out and len(run) <= 238:
+            out.append(17 + len(run))
+        elif flag is not None and len(run) <= 3:
+            out[flag] |= len(run)
+        else:
+            inst_index = len(out)
+            out.append(0)
+            out[inst_index] = _lzo_length(out, len(run) - 3, 15)
+        out.extend(run)
+
+    while pos + 3 <= len(data):
+        key = data[pos:pos + 3]
+        candidate = last.get(key)
+        last[key] = pos
+        distance = pos - candidate if candidate is not None else 0
+        if candidate is None or distance > 49151:
+            pos += 1
+            continue
+        length = 3
+        while pos + length < len(data) and data[candidate + length] == data[pos + length]:
+            length += 1
+        literals(pos)
+
+        if length <= 8 and distance <= 2048:
+            out.append(((length - 1) << 5) | (((distance - 1) & 7) << 2))
+            flag = len(out) - 1
+            out.append((distance - 1) >> 3)
+        elif distance <= 16384:
+            inst_index = len(out)
+            out.append(0)
+            out[inst_index] = 32 | _lzo_length(out, length - 2, 31)
+            flag = len(out)
+            out += bytes([((distance - 1) & 63) << 2, (distance - 1) >> 6])
+        else:
+            far = distance - 16384
+            inst_index = len(out)
+            out.append(0)
+            out[inst_index] = 16 | ((far >> 11) & 8) | _lzo_length(out, length - 2, 7)
+            flag = len(out)
+            out += bytes([(far & 63) << 2, (far >> 6) & 255])
+        pos += length
+        lit_start = pos
+    literals(len(data))
+    return bytes(out) + b"\x11\x00\x00"
+
+
+def make_checkpoints(time_ms: int, count: int, rng: random.Random) -> list[int]:
+    cuts = sorted(rng.randint(1, time_ms - 1) for _ in range(count - 1))
+    return cuts + [time_ms]
+
+
+def build_replay(map_uid: str, login: str, time_ms: int, respawns: int = 0, stunt_score: int = 0,
+                 nickname: str | None = None, nickname_encoding: str = "plain",
+                 environment: str = "Stadium", author: str = "Nadeo", validable: bool = True,
+                 header_padding: int = 0, lookbacks: str = "builtin", string_version: int = 6,
+                 body_size: int = 0, body: bytes | None = None, checkpoints: list[int] | None = None,
+                 body_compression: str = "U", ghost: bytes | None = None,
+                 rng: random.Random | None = None) -> bytes:
+    """Build the bytes of a replay file.
+
+    header_padding adds an unknown header chunk of that many bytes, body_size
+    appends random body bytes unless an explicit body is given. With
+    checkpoints or a ghost chunk (see build_ghost_data), the body holds them
+    after the random bytes. body_compression "C" stores the body as an LZO1X compressed stream."""
+    if nickname is None:
+        nickname = make_nickname(login, nickname_encoding)
+
+    chunks = []
+    if header_padding > 0:
+        chunks.append((CHUNK_PADDING, bytes(header_padding)))
+    chunks.append((CHUNK_STRING, build_string_chunk(
+        map_uid, environment, author, time_ms, nickname, login, string_version, lookbacks
+    )))
+    chunks.append((CHUNK_XML, pack_string(build_xml(map_uid, time_ms, respawns, stunt_score, validable))))
+
+    chunk_list = b"".join(pack_uint32(chunk_id) + pack_uint32(len(data)) for chunk_id, data in chunks)
+    header = pack_int32(len(chunks)) + chunk_list + b"".join(data for _, data in chunks)
+
+    if body is None:
+        rng = rng or random.Random()
+        if checkpoints is not None or ghost is not None:
+            body = build_body(checkpoints, body_size, rng, ghost)
+        else:
+            body = rng.randbytes(body_size) if body_size > 0 else b""
+    if body_compression == "C":
+        compressed = lzo_compress(body)
+        body = pack_int32(len(body)) + pack_int32(len(compressed)) + compressed
+    elif body_compression != "U":
+        raise ValueError(f"Unknown body compression: {body_compression}")
+
+    return (
+        b"GBX" + struct.pack("<h", 6) + b"BU" + body_compression.encode() + b"R"
+        + pack_uint32(GBX_AUTOSAVE_TMF) + pack_int32(len(header)) + header
+        + pack_int32(1) + pack_int32(0)  # Number of nodes, number of external nodes
+        + body
+    )
+
+
+class ReplaySet:
+    """Deterministic population of maps and players to draw replays from"""
+
+    def __init__(self, maps: int = 10, players: int = 5, seed: int = 0,
+                 nickname_encoding: str = "plain", lookbacks: str = "builtin",
+                 header_padding: int = 0, body_size: int = 0, string_version: int = 6,
+                 checkpoints: int = 0, body_compression: str = "U"):
+        self.rng = random.Random(seed)
+        self.map_uids = [random_uid(self.rng) for _ in range(maps)]
+        self.map_names = {uid: f"Synthetic {i:04d}" for i, uid in enumerate(self.map_uids)}
+        self.base_times = {uid: self.rng.randint(20_000, 180_000) for uid in self.map_uids}
+        self.logins = [f"player{i:03d}" for i in range(players)]
+        self.nickname_encoding = nickname_encoding
+        self.lookbacks = lookbacks
+        self.header_padding = header_padding
+        self.body_size = body_size
+        self.string_version = string_version
+        self.checkpoints = checkpoints
+        self.body_compression = body_compression
+
+    def map_info(self, map_uid: str) -> dict:
+        """Same layout as track_name.get_tmnf_map_info"""
+        return {
+            "name": self.map_names[map_uid],
+            "section": "Synthetic",
+            "author": "Nadeo",
+            "environment": "Stadium",
+            "type": "Race",
+            "mood": "Day",
+        }
+
+    def replay(self, map_uid: str | None = None) -> tuple[str, bytes]:
+        rng = self.rng
+        map_uid = map_uid or rng.choice(self.map_uids)
+        login = rng.choice(self.logins)
+        time_ms = self.base_times[map_uid] + int(rng.expovariate(1 / 2000))
+        data = build_replay(
+            map_uid, login, time_ms,
+            respawns=rng.choice((0, 0, 0, 1, 2)),
+            stunt_score=rng.randint(0, 50),
+            nickname_encoding=self.nickname_encoding,
+            header_padding=self.header_padding,
+            lookbacks=self.lookbacks,
+            string_version=self.string_version,
+            body_size=self.body_size,
+            checkpoints=make_checkpoints(time_ms, self.checkpoints, rng) if self.checkpoints else None,
+            body_compression=self.body_compression,
+            rng=rng,
+        )
+        return map_uid, data
+
+    def write(self, folder: Path, count: int, map_uid: str | None = None) -> list[Path]:
+        folder.mkdir(parents=True, exist_ok=True)
+        paths = []
+        for i in range(count):
+            _, data = self.replay(map_uid)
+            path = folder / f"synthetic_{i:06d}.Replay.Gbx"
+            path.write_bytes(data)
+            paths.append(path)
+        return paths
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Write synthetic TMNF replay files")
+    parser.add_argument("folder", type=Path)
+    parser.add_argument("--count", type=int, default=100)
+    parser.add_argument("--maps", type=int, default=10)
+    parser.add_argument("--players", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--nickname-encoding", choices=NICKNAME_ENCODINGS, default="plain")
+    parser.add_argument("--lookbacks", choices=LOOKBACK_MODES, default="builtin")
+    parser.add_argument("--header-padding", type=int, default=0)
+    parser.add_argument("--body-size", type=int, default=0)
+    parser.add_argument("--string-version", type=int, choices=(3, 6, 8), default=6)
+    parser.add_argument("--checkpoints", type=int, default=0, help="checkpoint times stored in the body")
+    parser.add_argument("--body-compression", choices=("U", "C"), default="U")
+    args = parser.parse_args()
+
+    replay_set = ReplaySet(
+        args.maps, args.players, args.seed, args.nickname_encoding,
+        args.lookbacks, args.header_padding, args.body_size, args.string_version,
+        args.checkpoints, args.body_compression
+    )
+    written = replay_set.write(args.folder, args.count)
+    print(f"Wrote {len(written)} replays to {args.folder}")
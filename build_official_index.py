@@ -0,0 +1,42 @@
+"""Build code_folder/official_maps.idx from code_folder/official_maps.tsv
+
+python build_official_index.py
+python build_official_index.py --fetch uids.txt   # first adds the maps of these UIDs (one per line) to the TSV, looked up online"""
+
+import argparse
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent / "code_folder"))
+
+from official_maps import read_source, write_source, write_index, INDEX_FILE, SOURCE_FILE
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build the bundled index of the official maps")
+    parser.add_argument("--fetch", type=Path, help="File of UIDs to look up online and add to the TSV source")
+    args = parser.parse_args()
+
+    maps = read_source(SOURCE_FILE)
+    if args.fetch:
+        from track_name import fetch_tmnf_map_info
+
+        uids = [line.strip() for line in args.fetch.read_text(encoding="utf-8").splitlines() if line.strip()]
+        for uid in uids:
+            if uid in maps:
+                continue
+            try:
+                map_info = fetch_tmnf_map_info(uid)
+            except Exception as e:
+                print(f"[!] {uid} not added - {e}")
+                continue
+            maps[uid] = map_info
+            print(f"Added {uid}: {map_info['name']}")
+        write_source(maps, SOURCE_FILE)
+
+    written = write_index(maps, INDEX_FILE)
+    print(f"Wrote {written} maps to {INDEX_FILE}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,252 @@
+"""
+Two-way sync of the runs between two archives (one per PC), only sending what the other side lacks.
+
+Runs are keyed by the MD5 digest of their replay, so two archives hold the same run under the same
+key and a set of runs is summarised by (count, XOR of the digests): two equal summaries mean equal
+sets. The sides compare summaries from the coarsest to the finest, and only go down where they
+differ:
+    maps grouped by the first letter of their UID: (maps, XOR of the map hashes) per group
+    maps of the differing groups: (runs, XOR of the run digests) per map
+    runs of a differing map split by the leading hex digits of their digest, 16 buckets per level,
+    until a bucket is small enough to list its digests
+Then each side exports the runs the other lacks, with the login and nicknames of the player (the
+player ids are per archive) and the replay bytes, and the other imports them, in batches of at most
+BATCH_RUNS runs and about BATCH_BYTES of replays. Importing skips the runs already there, so an
+interrupted sync is finished by the next one.
+
+Peers only talk through _Link, which pickles every call and answer as a network transport would and
+counts the bytes: sync works the same between two local folders (a network share, a USB drive) and
+reports what a remote sync would have exchanged with the other side.
+"""
+import hashlib
+import pickle
+from functools import reduce
+
+from cold_archive import read_replay, ColdArchiveError
+from data_handler import save, load
+from metrics import stage, count
+from migrations import SCHEMA_VERSION, needs_migration
+from run_record import PLAYER, FILE_NAME, replace_field
+from leaderboards import update_leaderboards
+from map_search import update_map_entry
+from sessions import update_analysis
+from storage import map_folder_path, replay_path, index_map_name, link_by_name
+
+LIST_FROM = 32 # runs in a bucket, below that the digests are sent rather than split further
+BATCH_RUNS = 512 # runs asked in one export call
+BATCH_BYTES = 16 * 1024 * 1024 # replay bytes of one export answer, a bigger replay is sent alone
+EMPTY = (0, bytes(16))
+# Derived from the runs or local to one archive, rebuilt by the importing side
+LOCAL_FIELDS = ("runs", "analysis", "time_index", "run_index", "cold")
+
+
+class SyncError(Exception):
+    pass
+
+
+def _xor(digests) -> bytes:
+    return reduce(lambda total, digest: total ^ int.from_bytes(digest, "big"), digests, 0).to_bytes(16, "big")
+
+
+def _summary(digests: list) -> tuple:
+    return len(digests), _xor(digests)
+
+
+class ArchivePeer:
+    """One archive (destination folder and app data) answering the sync calls"""
+    def __init__(self, destination, data_dict: dict):
+        if needs_migration(data_dict) or data_dict.get("schema", 1) > SCHEMA_VERSION:
+            raise SyncError(f"Archive {destination} has the data schema {data_dict.get('schema', 1)}, both sides need {SCHEMA_VERSION}")
+        self.destination = destination
+        self.data_dict = data_dict
+        self._map_data = {}
+        self._map_summaries = None
+
+    def _load_map(self, map_uid: str) -> dict | None:
+        if map_uid not in self._map_data:
+            data_file = map_folder_path(self.destination, map_uid) / "data.pkl"
+            self._map_data[map_uid] = load(data_file) if map_uid in self.data_dict["map_uids"] and data_file.exists() else None
+        return self._map_data[map_uid]
+
+    def _summaries(self) -> dict:
+        if self._map_summaries is None:
+            with stage("sync_summaries"):
+                self._map_summaries = {}
+                for map_uid in self.data_dict["map_uids"]:
+                    map_data = self._load_map(map_uid)
+                    if map_data is not None:
+                        self._map_summaries[map_uid] = _summary(list(map_data["runs"]))
+        return self._map_summaries
+
+    def map_groups(self) -> dict:
+        """{first letter of the UID: (maps, XOR of their hashes)}"""
+        groups = {}
+        for map_uid, (runs, runs_xor) in self._summaries().items():
+            groups.setdefault(map_uid[0], []).append(hashlib.md5(f"{map_uid}:{runs}:".encode() + runs_xor).digest())
+        return {letter: _summary(hashes) for letter, hashes in groups.items()}
+
+    def group_maps(self, letter: str) -> dict:
+        """{map_uid: (runs, XOR of their digests)} of the maps whose UID starts with letter"""
+        return {map_uid: summary for map_uid, summary in self._summaries().items() if map_uid[0] == letter}
+
+    def _digests(self, map_uid: str, prefix: str) -> list:
+        map_data = self._load_map(map_uid)
+        if map_data is None:
+            return []
+        return [file_digest for file_digest in map_data["runs"] if file_digest.hex().startswith(prefix)]
+
+    def buckets(self, map_uid: str, prefix: str) -> dict:
+        """{next hex digit: (runs, XOR)} of the runs of a map whose digest starts with prefix"""
+        buckets = {}
+        for file_digest in self._digests(map_uid, prefix):
+            buckets.setdefault(file_digest.hex()[len(prefix)], []).append(file_digest)
+        return {digit: _summary(digests) for digit, digests in buckets.items()}
+
+    def bucket_digests(self, map_uid: str, prefix: str) -> list:
+        return self._digests(map_uid, prefix)
+
+    def export_runs(self, map_uid: str, digests: list, max_bytes: int = BATCH_BYTES) -> tuple:
+        """
+        (map info, [(digest, run, login, nicknames, replay bytes), ...], number of digests handled) of the
+        first asked runs whose replays fit in max_bytes, the caller asks for the others in the next call.
+        """
+        map_data = self._load_map(map_uid)
+        map_info = {key: value for key, value in map_data.items() if key not in LOCAL_FIELDS}
+        map_folder = map_folder_path(self.destination, map_uid)
+        players = self.data_dict["players"]
+        exported = []
+        size = 0
+        handled = 0
+        for file_digest in digests:
+            run = map_data["runs"][file_digest]
+            try:
+                replay = read_replay(map_folder, map_data, file_digest)
+            except ColdArchiveError as e:
+                print(f"[!] Run not sent - {e}")
+                handled += 1
+                continue
+            if exported and size + len(replay) > max_bytes:
+                break
+            exported.append((file_digest, run, players.login(run[PLAYER]), players.names(run[PLAYER]), replay))
+            size += len(replay)
+            handled += 1
+        return map_info, exported, handled
+
+    def import_runs(self, map_uid: str, map_info: dict, exported: list) -> int:
+        """Add the runs this archive doesn't have yet, return how many were added"""
+        map_folder = map_folder_path(self.destination, map_uid)
+        map_data = self._load_map(map_uid)
+        if map_data is None:
+            map_data = {**map_info, "uid": map_uid, "runs": {}, "schema": SCHEMA_VERSION}
+            map_folder.mkdir(parents=True, exist_ok=True)
+            self.data_dict["map_uids"] = {**self.data_dict["map_uids"], map_uid: map_data["name"]}
+            index_map_name(self.data_dict, map_uid, map_data["name"])
+            self._map_data[map_uid] = map_data
+
+        added = []
+        for file_digest, run, login, nicknames, replay in exported:
+            if file_digest in map_data["runs"]:
+                continue
+            if hashlib.md5(replay).digest() != file_digest:
+                print(f"[!] Replay {file_digest.hex()} of {map_data['name']} was corrupted on the way, not added")
+                continue
+            stored = replay_path(map_folder, file_digest)
+            # The file first: a run is only saved once its replay is in place
+            stored.with_name(stored.name + ".tmp").write_bytes(replay)
+            stored.with_name(stored.name + ".tmp").replace(stored)
+            # Runs of archives from before file names were kept have none (see migrations.py)
+            link_by_name(stored, self.destination, map_data["name"], map_uid, run[FILE_NAME] or stored.name)
+            for nickname in nicknames or [None]:
+                self.data_dict["players"], player = self.data_dict["players"].with_player(login, nickname)
+            map_data["runs"][file_digest] = replace_field(run, PLAYER, player)
+            added.append(file_digest)
+        if not added:
+            return 0
+
+        update_analysis(map_data)
+        save(map_data, map_folder / "data.pkl")
+        update_leaderboards(self.data_dict, map_uid, map_data)
+        update_map_entry(self.data_dict, map_uid, map_data)
+        if self._map_summaries is not None:
+            self._map_summaries[map_uid] = _summary(list(map_data["runs"]))
+        count("runs_synced", len(added))
+        return len(added)
+
+
+class _Link:
+    """Calls on a peer through pickled messages, counting the bytes each way"""
+    def __init__(self, peer: ArchivePeer):
+        self.peer = peer
+        self.sent = 0
+        self.received = 0
+
+    def call(self, method: str, *args):
+        request = pickle.dumps((method, args), protocol=pickle.HIGHEST_PROTOCOL)
+        self.sent += len(request)
+        method, args = pickle.loads(request)
+        answer = pickle.dumps(getattr(self.peer, method)(*args), protocol=pickle.HIGHEST_PROTOCOL)
+        self.received += len(answer)
+        return pickle.loads(answer)
+
+
+def _missing_runs(local: _Link, remote: _Link, map_uid: str, prefix: str = "") -> tuple:
+    """(digests only the local side has, digests only the remote side has) among a map's runs under prefix"""
+    local_buckets = local.call("buckets", map_uid, prefix)
+    remote_buckets = remote.call("buckets", map_uid, prefix)
+    only_local, only_remote = [], []
+    for digit in local_buckets.keys() | remote_buckets.keys():
+        local_summary = local_buckets.get(digit, EMPTY)
+        remote_summary = remote_buckets.get(digit, EMPTY)
+        if local_summary == remote_summary:
+            continue
+        if min(local_summary[0], remote_summary[0]) < LIST_FROM or len(prefix) == 31:
+            local_digests = set(local.call("bucket_digests", map_uid, prefix + digit)) if local_summary[0] else set()
+            remote_digests = set(remote.call("bucket_digests", map_uid, prefix + digit)) if remote_summary[0] else set()
+            only_local += local_digests - remote_digests
+            only_remote += remote_digests - local_digests
+        else:
+            sub_local, sub_remote = _missing_runs(local, remote, map_uid, prefix + digit)
+            only_local += sub_local
+            only_remote += sub_remote
+    return only_local, only_remote
+
+
+def _transfer(source: _Link, target: _Link, map_uid: str, digests: list) -> int:
+    added = 0
+    while digests:
+        map_info, exported, handled = source.call("export_runs", map_uid, digests[:BATCH_RUNS], BATCH_BYTES)
+        added += target.call("import_runs", map_uid, map_info, exported)
+        digests = digests[handled:]
+    return added
+
+
+def sync_archives(local: ArchivePeer, remote: ArchivePeer, push: bool = True, pull: bool = True) -> dict:
+    """Bring both archives (or only the receiving one) to the union of their runs, return what was done"""
+    local_link, remote_link = _Link(local), _Link(remote)
+    result = {"maps": 0, "pulled": 0, "pushed": 0}
+    with stage("sync"):
+        local_groups = local_link.call("map_groups")
+        remote_groups = remote_link.call("map_groups")
+        for letter in sorted(local_groups.keys() | remote_groups.keys()):
+            if local_groups.get(letter) == remote_groups.get(letter):
+                continue
+            local_maps = local_link.call("group_maps", letter) if letter in local_groups else {}
+            remote_maps = remote_link.call("group_maps", letter) if letter in remote_groups else {}
+            for map_uid in sorted(local_maps.keys() | remote_maps.keys()):
+                if local_maps.get(map_uid) == remote_maps.get(map_uid):
+                    continue
+                result["maps"] += 1
+                if map_uid not in remote_maps:
+                    only_local, only_remote = local_link.call("bucket_digests", map_uid, ""), []
+                elif map_uid not in local_maps:
+                    only_local, only_remote = [], remote_link.call("bucket_digests", map_uid, "")
+                else:
+                    only_local, only_remote = _missing_runs(local_link, remote_link, map_uid)
+                if pull:
+                    result["pulled"] += _transfer(remote_link, local_link, map_uid, only_remote)
+                if push:
+                    result["pushed"] += _transfer(local_link, remote_link, map_uid, only_local)
+    # Only the calls on the remote side would cross the network
+    result["bytes_sent"] = remote_link.sent
+    result["bytes_received"] = remote_link.received
+    return result
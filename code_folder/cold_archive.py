@@ -0,0 +1,190 @@
+"""
+Cold tier of the replay files: replays that are not looked at anymore are packed, compressed one by
+one, into a single file per map and removed from the map folder (and from by-name).
+
+destination/<map uid>/cold.pack is a sequence of entries:
+    ENTRY header (digest, size, stored size) then the stored bytes, zlib compressed unless that
+    wasn't smaller (stored size == size)
+map_data["cold"] = {digest: (offset of the stored bytes, stored size)} indexes it, the runs keep
+their digest as key so nothing else changes: read_replay gets the bytes of a run wherever they are.
+
+Entries are only appended and the replay file is removed once the index is saved, an interrupted
+archiving leaves the replay in both places and the next one finishes it.
+"""
+import hashlib
+import os
+import struct
+import time
+import zlib
+from pathlib import Path
+
+from data_handler import save, load
+from metrics import stage, count
+from run_record import PLAYER, REPLAY_TIME_MS, TIMESTAMP, FILE_NAME
+from storage import map_folder_path, replay_path, unlink_by_name
+
+PACK_NAME = "cold.pack"
+ENTRY = struct.Struct("<16sII")
+COMPRESSION_LEVEL = 9
+DAY = 24 * 60 * 60
+
+
+class ColdArchiveError(Exception):
+    pass
+
+
+def select_cold_runs(map_data: dict, older_than_days: float | None = None, non_pbs: bool = True, now: float | None = None) -> list:
+    """Digests of the runs to archive: not the PB of their player, or older than older_than_days"""
+    runs = map_data["runs"]
+    best = {}
+    for run in runs.values():
+        if run[REPLAY_TIME_MS] < best.get(run[PLAYER], float("inf")):
+            best[run[PLAYER]] = run[REPLAY_TIME_MS]
+    limit = None if older_than_days is None else (now or time.time()) - older_than_days * DAY
+    return [
+        file_digest for file_digest, run in runs.items()
+        if (non_pbs and run[REPLAY_TIME_MS] > best[run[PLAYER]]) or (limit is not None and run[TIMESTAMP] < limit)
+    ]
+
+
+def _scan_entries(pack, start: int = 0) -> tuple:
+    """([(digest, offset, stored size), ...] of the complete entries from start, end of the last one)"""
+    entries = []
+    pack.seek(start)
+    end = start
+    while len(header := pack.read(ENTRY.size)) == ENTRY.size:
+        file_digest, _, stored_size = ENTRY.unpack(header)
+        offset = end + ENTRY.size
+        if len(pack.read(stored_size)) != stored_size:
+            break
+        entries.append((file_digest, offset, stored_size))
+        end = offset + stored_size
+    return entries, end
+
+
+def _recover(pack_path: Path, cold: dict) -> int:
+    """Index the entries appended after the indexed ones (interrupted archiving), return the end of the pack"""
+    indexed_end = max((offset + stored_size for offset, stored_size in cold.values()), default=0)
+    if not pack_path.exists():
+        return 0
+    if pack_path.stat().st_size == indexed_end:
+        return indexed_end
+    with open(pack_path, "rb") as pack:
+        entries, end = _scan_entries(pack, indexed_end)
+    for file_digest, offset, stored_size in entries:
+        cold.setdefault(file_digest, (offset, stored_size))
+    if pack_path.stat().st_size != end:
+        # Half written last entry, its replay file is still in the map folder
+        os.truncate(pack_path, end)
+    return end
+
+
+def archive_map(destination: Path, map_uid: str, older_than_days: float | None = None, non_pbs: bool = True) -> tuple:
+    """Move the cold replays of a map to its pack, return (replays archived, bytes freed)"""
+    map_folder = map_folder_path(destination, map_uid)
+    data_file = map_folder / "data.pkl"
+    map_data = load(data_file)
+    cold = dict(map_data.get("cold", {}))
+    pack_path = map_folder / PACK_NAME
+    end = _recover(pack_path, cold)
+
+    to_archive = [
+        file_digest for file_digest in select_cold_runs(map_data, older_than_days, non_pbs)
+        if replay_path(map_folder, file_digest).exists()
+    ]
+    if not to_archive:
+        return 0, 0
+
+    freed = 0
+    pack_start = end
+    with stage("cold_archive"):
+        with open(pack_path, "ab") as pack:
+            for file_digest in to_archive:
+                if file_digest in cold:
+                    continue
+                data = replay_path(map_folder, file_digest).read_bytes()
+                packed = zlib.compress(data, COMPRESSION_LEVEL)
+                if len(packed) >= len(data):
+                    packed = data
+                pack.write(ENTRY.pack(file_digest, len(data), len(packed)))
+                pack.write(packed)
+                cold[file_digest] = (end + ENTRY.size, len(packed))
+                end += ENTRY.size + len(packed)
+            pack.flush()
+            os.fsync(pack.fileno())
+        freed -= end - pack_start
+
+        map_data["cold"] = cold
+        save(map_data, data_file)
+
+        for file_digest in to_archive:
+            stored = replay_path(map_folder, file_digest)
+            freed += stored.stat().st_size
+            unlink_by_name(stored, destination, map_data["name"], map_uid, map_data["runs"][file_digest][FILE_NAME] or stored.name)
+            stored.unlink()
+    count("replays_archived", len(to_archive))
+    return len(to_archive), freed
+
+
+def archive_all(destination: Path, data_dict: dict, older_than_days: float | None = None, non_pbs: bool = True) -> tuple:
+    archived = freed = 0
+    for map_uid in data_dict["map_uids"]:
+        if not (map_folder_path(destination, map_uid) / "data.pkl").exists():
+            continue
+        map_archived, map_freed = archive_map(destination, map_uid, older_than_days, non_pbs)
+        if map_archived:
+            print(f"{data_dict['map_uids'][map_uid]}: {map_archived} replays archived")
+        archived += map_archived
+        freed += map_freed
+    return archived, freed
+
+
+def read_replay(map_folder: Path, map_data: dict, file_digest: bytes) -> bytes:
+    """Bytes of the replay of a run, from its file or from the cold pack"""
+    stored = replay_path(map_folder, file_digest)
+    if stored.exists():
+        return stored.read_bytes()
+    entry = map_data.get("cold", {}).get(file_digest)
+    if entry is None:
+        raise ColdArchiveError(f"Replay {file_digest.hex()} is neither in {map_folder} nor in its cold pack")
+    offset, stored_size = entry
+    with stage("cold_read"), open(map_folder / PACK_NAME, "rb") as pack:
+        pack.seek(offset - ENTRY.size)
+        pack_digest, size, stored_size = ENTRY.unpack(pack.read(ENTRY.size))
+        data = pack.read(stored_size)
+    if stored_size != size:
+        data = zlib.decompress(data)
+    if pack_digest != file_digest or hashlib.md5(data).digest() != file_digest:
+        raise ColdArchiveError(f"Replay {file_digest.hex()} is corrupted in {map_folder / PACK_NAME}")
+    count("cold_reads")
+    return data
+
+
+def extract_replay(map_folder: Path, map_data: dict, file_digest: bytes, output: Path) -> Path:
+    """Write a copy of the replay of a run to output (a folder: under its original file name)"""
+    output = Path(output)
+    if output.is_dir():
+        # Runs of archives from before file names were kept have none (see migrations.py)
+        output = output / (map_data["runs"][file_digest][FILE_NAME] or replay_path(map_folder, file_digest).name)
+    output.write_bytes(read_replay(map_folder, map_data, file_digest))
+    return output
+
+
+def restore_map(map_folder: Path, map_data: dict):
+    """Put every archived replay of a map back in its folder and remove the pack, map_data is saved"""
+    cold = map_data.get("cold")
+    pack_path = map_folder / PACK_NAME
+    if not cold and not pack_path.exists():
+        return
+    cold = dict(cold or {})
+    _recover(pack_path, cold)
+    map_data["cold"] = cold
+    for file_digest in cold:
+        stored = replay_path(map_folder, file_digest)
+        if not stored.exists():
+            data = read_replay(map_folder, map_data, file_digest)
+            stored.with_name(stored.name + ".tmp").write_bytes(data)
+            stored.with_name(stored.name + ".tmp").replace(stored)
+    del map_data["cold"]
+    save(map_data, map_folder / "data.pkl")
+    pack_path.unlink(missing_ok=True)
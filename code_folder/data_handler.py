@@ -1,14 +1,32 @@
+import os
 import pickle
+import time
 from pathlib import Path
 
+from metrics import stage
+
+REPLACE_RETRIES = 5
+
 
 def save(data: dict, file_path: Path | str) -> None:
-    with open(file_path, "wb") as file:
-        pickle.dump(data, file)
+    # Written next to the target then renamed: readers (stats API) never load half a file
+    tmp_path = f"{file_path}.tmp"
+    with stage("pickle_save"):
+        with open(tmp_path, "wb") as file:
+            pickle.dump(data, file)
+        for attempt in range(REPLACE_RETRIES):
+            try:
+                os.replace(tmp_path, file_path)
+                return
+            except PermissionError:
+                # Windows refuses to replace a file another thread is reading
+                if attempt == REPLACE_RETRIES - 1:
+                    raise
+                time.sleep(0.05)
 
 
 def load(file_path: Path | str) -> dict:
-    with open(file_path, "rb") as file:
+    with stage("pickle_load"), open(file_path, "rb") as file:
         data = pickle.load(file)
     return data
 
@@ -0,0 +1,37 @@
+"""
+The app data (data_dict) shared between the GUI, the ingest thread and the stats API.
+
+A single writer at a time works on a draft: a shallow copy of the published dict, where nested
+values are replaced, never changed in place (copy-on-write). The draft is then published by swapping
+one reference, so a reader keeps a consistent snapshot for as long as it holds it, without any lock,
+and the writer never waits for the readers.
+
+    with store.write() as data:
+        data["map_uids"] = {**data["map_uids"], map_uid: name}
+
+    data = store.snapshot() # never changes afterwards
+"""
+import threading
+from contextlib import contextmanager
+
+from metrics import count
+
+
+class DataStore:
+    def __init__(self, data: dict):
+        self._data = data
+        self._write_lock = threading.Lock()
+        self.version = 0
+
+    def snapshot(self) -> dict:
+        return self._data
+
+    @contextmanager
+    def write(self):
+        """Draft of the data, published when the block ends without an exception"""
+        with self._write_lock:
+            draft = dict(self._data)
+            yield draft
+            self._data = draft
+            self.version += 1
+            count("data_versions")
@@ -1,8 +1,11 @@
 import hashlib
 
 def get_file_hash(path, algo='md5', block_size=65536):
+    return get_file_digest(path, algo, block_size).hex()
+
+def get_file_digest(path, algo='md5', block_size=65536) -> bytes:
     hasher = hashlib.new(algo)
     with open(path, 'rb') as f:
         for chunk in iter(lambda: f.read(block_size), b''):
             hasher.update(chunk)
-    return hasher.hexdigest()
\ No newline at end of file
+    return hasher.digest()
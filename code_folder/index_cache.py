@@ -0,0 +1,42 @@
+"""
+Per-map indexes derived from the runs (time_index.py, run_filters.py), kept in memory only.
+
+An index is built from map_data["runs"] the first time a map needs it, then brought up to date with
+the run cursor (run_record.runs_after) like the analysis. Kept in data.pkl, an index holding an entry
+per run grows the file by a sixth or more and each ingest loads and saves it with the runs, when
+building it takes about as long as loading it. The MAX_INDEXES last used indexes are kept.
+
+Index updates change the lists in place: they and the readers hold lock.
+"""
+import threading
+from collections import OrderedDict
+
+MAX_INDEXES = 32
+
+lock = threading.RLock()
+_indexes = OrderedDict() # (kind, map_uid): index
+
+
+def get_index(kind: str, map_data: dict) -> dict | None:
+    """Index of that kind of the map last stored, its cursor tells if it still fits map_data["runs"]"""
+    key = (kind, map_data.get("uid"))
+    with lock:
+        index = _indexes.get(key)
+        if index is not None:
+            _indexes.move_to_end(key)
+        return index
+
+
+def put_index(kind: str, map_data: dict, index: dict):
+    if map_data.get("uid") is None:
+        return
+    with lock:
+        _indexes[(kind, map_data["uid"])] = index
+        _indexes.move_to_end((kind, map_data["uid"]))
+        while len(_indexes) > MAX_INDEXES:
+            _indexes.popitem(last=False)
+
+
+def clear():
+    with lock:
+        _indexes.clear()
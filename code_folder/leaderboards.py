@@ -0,0 +1,195 @@
+"""
+Cross-map leaderboards, kept in data_dict["leaderboards"] and updated on each ingest, so they are
+read without loading any map data.pkl:
+
+leaderboards = {
+    "maps": {
+        map_uid: {
+            "runs": number of runs folded in, "last": digest of the last one (see run_record.runs_after),
+            "players": {player_id: [first timestamp, first time_ms, best timestamp, best time_ms, runs]},
+        },
+        ...
+    },
+    "most_attempted": [(runs, map_uid), ...],
+    "improvement": {player_id: [(first time_ms - best time_ms, map_uid), ...]},
+    "top_players": {map_uid: [(-best time_ms, -best timestamp, player_id), ...]},
+}
+
+Each board is a min-heap of its TOP_K best entries, the worst one on top: a new score only has to
+beat heap[0]. Scores only grow as runs are added, except the improvement when a replay older than
+the first one is found late, that player's board is then rebuilt from the map summaries.
+
+Updates copy what they change and share the rest with the previous version, readers holding it
+are not affected (see data_store).
+"""
+import heapq
+
+from data_handler import load
+from metrics import stage
+from run_record import PLAYER, REPLAY_TIME_MS, TIMESTAMP, runs_after, cursor
+from storage import map_folder_path
+
+TOP_K = 25
+
+FIRST_TIMESTAMP = 0
+FIRST_TIME_MS = 1
+BEST_TIMESTAMP = 2
+BEST_TIME_MS = 3
+RUNS = 4
+
+
+def new_leaderboards() -> dict:
+    return {"maps": {}, "most_attempted": [], "improvement": {}, "top_players": {}}
+
+
+def _fold_run(players: dict, run: tuple) -> bool:
+    """Add a run to the summary of its player, return False if it lowered their improvement"""
+    timestamp, time_ms = run[TIMESTAMP], run[REPLAY_TIME_MS]
+    summary = players.get(run[PLAYER])
+    if summary is None:
+        players[run[PLAYER]] = [timestamp, time_ms, timestamp, time_ms, 1]
+        return True
+    summary = players[run[PLAYER]] = list(summary)
+    before = summary[FIRST_TIME_MS] - summary[BEST_TIME_MS]
+    if timestamp < summary[FIRST_TIMESTAMP]:
+        summary[FIRST_TIMESTAMP], summary[FIRST_TIME_MS] = timestamp, time_ms
+    if (time_ms, timestamp) < (summary[BEST_TIME_MS], summary[BEST_TIMESTAMP]):
+        summary[BEST_TIMESTAMP], summary[BEST_TIME_MS] = timestamp, time_ms
+    summary[RUNS] += 1
+    return summary[FIRST_TIME_MS] - summary[BEST_TIME_MS] >= before
+
+
+def _offer(heap: list, entry: tuple, size: int = TOP_K):
+    """Put entry in the bounded heap, in place of the previous entry of the same item (its last field)"""
+    for position, old in enumerate(heap):
+        if old[-1] == entry[-1]:
+            heap[position] = entry
+            heapq.heapify(heap)
+            return
+    if len(heap) < size:
+        heapq.heappush(heap, entry)
+    elif entry > heap[0]:
+        heapq.heapreplace(heap, entry)
+
+
+def _bounded(entries, size: int = TOP_K) -> list:
+    heap = heapq.nlargest(size, entries)
+    heapq.heapify(heap)
+    return heap
+
+
+def _top_player_entry(player: int, summary: list) -> tuple:
+    return -summary[BEST_TIME_MS], -summary[BEST_TIMESTAMP], player
+
+
+def _rebuild_improvement(leaderboards: dict, player: int):
+    leaderboards["improvement"][player] = _bounded(
+        (players[player][FIRST_TIME_MS] - players[player][BEST_TIME_MS], map_uid)
+        for map_uid, map_summary in leaderboards["maps"].items()
+        if player in (players := map_summary["players"])
+    )
+
+
+def update_leaderboards(data_dict: dict, map_uid: str, map_data: dict) -> dict | None:
+    """
+    Fold the runs added to map_data since the last update into the leaderboards.
+    An archive without leaderboards is left without: build_leaderboards makes them from every map.
+    """
+    previous = data_dict.get("leaderboards")
+    if previous is None:
+        return None
+    runs = map_data["runs"]
+    map_summary = previous["maps"].get(map_uid)
+    new_digests = None if map_summary is None else runs_after(runs, map_summary["runs"], map_summary["last"])
+    if new_digests == []:
+        data_dict["leaderboards"] = previous
+        return previous
+
+    with stage("leaderboards_update"):
+        leaderboards = {
+            "maps": dict(previous["maps"]),
+            "most_attempted": list(previous["most_attempted"]),
+            "improvement": dict(previous["improvement"]),
+            "top_players": dict(previous["top_players"]),
+        }
+        data_dict["leaderboards"] = leaderboards
+        if new_digests is None:
+            # New map, or its runs were rebuilt: everything it took part in is recomputed
+            previous_players = set(map_summary["players"]) if map_summary is not None else set()
+            map_summary = {"players": {}}
+            leaderboards["maps"][map_uid] = map_summary
+            for run in runs.values():
+                _fold_run(map_summary["players"], run)
+            map_summary["runs"], map_summary["last"] = cursor(runs)
+            leaderboards["most_attempted"] = _bounded(
+                (summary["runs"], uid) for uid, summary in leaderboards["maps"].items()
+            )
+            leaderboards["top_players"][map_uid] = _bounded(
+                _top_player_entry(player, summary) for player, summary in map_summary["players"].items()
+            )
+            for player in previous_players | set(map_summary["players"]):
+                _rebuild_improvement(leaderboards, player)
+            return leaderboards
+
+        map_summary = leaderboards["maps"][map_uid] = {**map_summary, "players": dict(map_summary["players"])}
+        players = map_summary["players"]
+        lowered = set()
+        for file_digest in new_digests:
+            run = runs[file_digest]
+            if not _fold_run(players, run):
+                lowered.add(run[PLAYER])
+        map_summary["runs"], map_summary["last"] = cursor(runs)
+
+        _offer(leaderboards["most_attempted"], (map_summary["runs"], map_uid))
+        top_players = leaderboards["top_players"][map_uid] = list(leaderboards["top_players"].get(map_uid, []))
+        for player in {runs[file_digest][PLAYER] for file_digest in new_digests}:
+            summary = players[player]
+            _offer(top_players, _top_player_entry(player, summary))
+            if player in lowered:
+                _rebuild_improvement(leaderboards, player)
+            else:
+                improvement = leaderboards["improvement"][player] = list(leaderboards["improvement"].get(player, []))
+                _offer(improvement, (summary[FIRST_TIME_MS] - summary[BEST_TIME_MS], map_uid))
+    return leaderboards
+
+
+def build_leaderboards(destination, data_dict: dict) -> dict:
+    """Build the leaderboards from every map data.pkl, for archives logged before they existed"""
+    data_dict["leaderboards"] = new_leaderboards()
+    with stage("leaderboards_build"):
+        for map_uid in data_dict["map_uids"]:
+            data_file = map_folder_path(destination, map_uid) / "data.pkl"
+            if not data_file.exists():
+                print(f"[!] Map data {data_file} not found, not in the leaderboards")
+                continue
+            update_leaderboards(data_dict, map_uid, load(data_file))
+    return data_dict["leaderboards"]
+
+
+def _top(heap: list, k: int) -> list:
+    if k > TOP_K:
+        print(f"[!] Only the top {TOP_K} entries are kept")
+    return sorted(heap, reverse=True)[:k]
+
+
+def most_attempted_maps(leaderboards: dict, k: int = 10) -> list:
+    """[(map_uid, runs), ...], most runs first"""
+    return [(map_uid, runs) for runs, map_uid in _top(leaderboards["most_attempted"], k)]
+
+
+def best_improvements(leaderboards: dict, player: int, k: int = 10) -> list:
+    """[(map_uid, first time_ms, best time_ms), ...] of a player, most time gained first"""
+    maps = leaderboards["maps"]
+    return [
+        (map_uid, maps[map_uid]["players"][player][FIRST_TIME_MS], maps[map_uid]["players"][player][BEST_TIME_MS])
+        for _, map_uid in _top(leaderboards["improvement"].get(player, []), k)
+    ]
+
+
+def top_players(leaderboards: dict, map_uid: str, k: int = 10) -> list:
+    """[(player_id, best time_ms, timestamp of the best, runs), ...] of a map, fastest first"""
+    players = leaderboards["maps"].get(map_uid, {"players": {}})["players"]
+    return [
+        (player, players[player][BEST_TIME_MS], players[player][BEST_TIMESTAMP], players[player][RUNS])
+        for _, _, player in _top(leaderboards["top_players"].get(map_uid, []), k)
+    ]
@@ -0,0 +1,212 @@
+"""
+Plot of the times of a map that follows the ingestion while it's open.
+
+The ingest thread hands each new run of the map over through a queue, the Tk thread picks them up
+every POLL_MS. A run is added to the data of its player's artists, but only the new point (and the
+new piece of the PB line) is drawn: over the saved background, then blitted, and the result becomes
+the next background. The whole figure is drawn again only when it has to change: a run out of the
+axes limits (they grow with some headroom so that's rare), a new player (legend) or a run dated
+before the last one of its player (PB line redone).
+"""
+import queue
+from pathlib import Path
+from tkinter import Toplevel
+
+import numpy as np
+from matplotlib.figure import Figure
+from matplotlib.lines import Line2D
+
+from data_handler import load
+from metrics import stage, count
+from run_record import PLAYER, REPLAY_TIME_MS, TIMESTAMP
+from sessions import update_analysis
+from treat_files import PLOT_COLORS, add_run_listener, remove_run_listener
+
+POLL_MS = 50
+X_HEADROOM = 0.2 # of the date span, added after the last run
+Y_MARGIN = 0.05
+
+
+class _Series:
+    """Runs of one player in growing arrays, and the artists drawing them"""
+    def __init__(self, axes, login: str, color: str, x: np.ndarray, y: np.ndarray, pbs: list):
+        self.size = len(x)
+        self.x = np.empty(max(16, 2 * self.size))
+        self.y = np.empty_like(self.x)
+        self.x[:self.size] = x
+        self.y[:self.size] = y
+        self.pbs = pbs
+        self.color = color
+        self.points = axes.add_line(Line2D([], [], linestyle="", marker="o", markersize=4, color=color, label=login))
+        self.pb_line = axes.add_line(Line2D([], [], drawstyle="steps-post", color=color, alpha=0.6))
+        self.update_artists()
+
+    def append(self, timestamp: float, seconds: float):
+        if self.size == len(self.x):
+            self.x = np.resize(self.x, 2 * self.size)
+            self.y = np.resize(self.y, 2 * self.size)
+        self.x[self.size] = timestamp
+        self.y[self.size] = seconds
+        self.size += 1
+
+    def last_date(self) -> float:
+        return self.x[:self.size].max()
+
+    def update_artists(self):
+        self.points.set_data(self.x[:self.size], self.y[:self.size])
+        # PB progression, held until the next PB fell or the last run
+        pb_dates = [date for date, _ in self.pbs] + [self.last_date()]
+        pb_times = [time_ms / 1000 for _, time_ms in self.pbs]
+        self.pb_line.set_data(pb_dates, pb_times + pb_times[-1:])
+
+
+class LivePlot:
+    def __init__(self, figure: Figure, map_folder: Path, players_source):
+        """players_source() returns the current PlayerTable (new players can show up while plotting)"""
+        self.figure = figure
+        self.canvas = figure.canvas
+        self.axes = figure.add_subplot()
+        self.map_uid = map_folder.name
+        self.players_source = players_source
+        self.pending = queue.SimpleQueue()
+        self.series = {}
+        self.background = None
+
+        # Only used to draw the increments, never part of a full draw
+        self.new_points = self.axes.add_line(Line2D([], [], linestyle="", marker="o", markersize=4, animated=True))
+        self.new_pb = self.axes.add_line(Line2D([], [], alpha=0.6, animated=True))
+
+        # Listening before the load: a run saved in between is both loaded and queued, never missed,
+        # and the queued copy is skipped by its digest
+        add_run_listener(self.on_run)
+        try:
+            map_data = load(map_folder / "data.pkl")
+        except Exception:
+            remove_run_listener(self.on_run)
+            raise
+        self.loaded = set(map_data["runs"])
+        runs = np.array([(run[PLAYER], run[TIMESTAMP], run[REPLAY_TIME_MS]) for run in map_data["runs"].values()], dtype=np.int64).reshape(-1, 3)
+        pbs = {player: state["pbs"] for player, state in update_analysis(map_data)["players"].items()}
+        players = players_source()
+        for player in np.unique(runs[:, 0]):
+            player_runs = runs[runs[:, 0] == player]
+            self._add_series(int(player), players, player_runs[:, 1], player_runs[:, 2] / 1000, pbs[player])
+
+        self.axes.set_xlabel('Date')
+        self.axes.set_ylabel('Time in seconds')
+        self.axes.set_title('Plot of times by date (live)')
+        self.canvas.mpl_connect("draw_event", self._on_draw)
+        self._rescale()
+
+    def _add_series(self, player: int, players, x, y, pbs) -> _Series:
+        color = PLOT_COLORS[len(self.series) % len(PLOT_COLORS)]
+        self.series[player] = series = _Series(self.axes, players.login(player), color, x, y, pbs)
+        return series
+
+    def on_run(self, map_uid: str, map_data: dict, file_digest: bytes):
+        """Run listener, called on the ingest thread: only what's needed is copied and queued"""
+        if map_uid != self.map_uid:
+            return
+        run = map_data["runs"][file_digest]
+        pbs = [list(pb) for pb in map_data["analysis"]["players"][run[PLAYER]]["pbs"]]
+        self.pending.put((file_digest, run[PLAYER], run[TIMESTAMP], run[REPLAY_TIME_MS] / 1000, pbs))
+
+    def poll(self) -> int:
+        """Draw the runs queued since the last call, return their number"""
+        batch = []
+        while True:
+            try:
+                batch.append(self.pending.get_nowait())
+            except queue.Empty:
+                break
+        if batch:
+            self.add_runs(batch)
+        return len(batch)
+
+    def add_runs(self, batch: list):
+        with stage("live_plot_update"):
+            full_draw = self.background is None
+            increments = []
+            players = self.players_source()
+            for file_digest, player, timestamp, seconds, pbs in batch:
+                if file_digest in self.loaded:
+                    continue
+                self.loaded.add(file_digest)
+                series = self.series.get(player)
+                if series is None:
+                    self._add_series(player, players, [timestamp], [seconds], pbs)
+                    full_draw = True
+                    continue
+                last_date = series.last_date()
+                old_pb = series.pbs[-1][1] / 1000
+                full_draw |= timestamp < last_date
+                series.append(timestamp, seconds)
+                series.pbs = pbs
+                series.update_artists()
+                full_draw |= not self._visible(timestamp, seconds)
+                increments.append((series.color, timestamp, seconds, last_date, old_pb, pbs[-1][1] / 1000))
+
+            if full_draw:
+                count("live_plot_full_draws")
+                self._rescale()
+                self.canvas.draw()
+                return
+
+            self.canvas.restore_region(self.background)
+            for color, timestamp, seconds, last_date, old_pb, new_pb in increments:
+                self.new_pb.set_color(color)
+                self.new_pb.set_data([last_date, timestamp, timestamp], [old_pb, old_pb, new_pb])
+                self.axes.draw_artist(self.new_pb)
+                self.new_points.set_color(color)
+                self.new_points.set_data([timestamp], [seconds])
+                self.axes.draw_artist(self.new_points)
+            self.canvas.blit(self.axes.bbox)
+            self.background = self.canvas.copy_from_bbox(self.axes.bbox)
+
+    def _visible(self, x: float, y: float) -> bool:
+        x_min, x_max = self.axes.get_xlim()
+        y_min, y_max = self.axes.get_ylim()
+        return x_min <= x <= x_max and y_min <= y <= y_max
+
+    def _rescale(self):
+        x = np.concatenate([series.x[:series.size] for series in self.series.values()] or [np.zeros(1)])
+        y = np.concatenate([series.y[:series.size] for series in self.series.values()] or [np.zeros(1)])
+        x_span = max(x.max() - x.min(), 3600)
+        y_span = max(y.max() - y.min(), 1)
+        self.axes.set_xlim(x.min() - Y_MARGIN * x_span, x.max() + X_HEADROOM * x_span)
+        self.axes.set_ylim(y.min() - Y_MARGIN * y_span, y.max() + Y_MARGIN * y_span)
+        self.axes.legend(loc="upper right")
+
+    def _on_draw(self, event):
+        # Any full draw (ours, a resize, the toolbar zoom) gives the new background
+        self.background = self.canvas.copy_from_bbox(self.axes.bbox)
+
+    def close(self):
+        remove_run_listener(self.on_run)
+
+
+def open_live_plot(master, map_folder: Path, players_source, title: str = "") -> LivePlot:
+    """Live plot of a map in its own window, updated until the window is closed"""
+    from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg, NavigationToolbar2Tk
+
+    window = Toplevel(master)
+    window.title(f"Live plot - {title or map_folder.name}")
+    figure = Figure(figsize=(9, 6))
+    canvas = FigureCanvasTkAgg(figure, master=window)
+    NavigationToolbar2Tk(canvas, window)
+    canvas.get_tk_widget().pack(fill="both", expand=True)
+    live_plot = LivePlot(figure, map_folder, players_source)
+    canvas.draw()
+
+    def poll():
+        live_plot.poll()
+        window.poll_id = window.after(POLL_MS, poll)
+
+    def close():
+        window.after_cancel(window.poll_id)
+        live_plot.close()
+        window.destroy()
+
+    window.poll_id = window.after(POLL_MS, poll)
+    window.protocol("WM_DELETE_WINDOW", close)
+    return live_plot
@@ -0,0 +1,122 @@
+"""
+Index of the map files found in the local Tracks folders, read before any online UID lookup so
+unpublished maps resolve too. Saved in LOCAL_MAPS_FILE:
+
+local_maps = {
+    "folders": [folder path, ...],
+    "files": {file path: (size, mtime_ns, map uid or None if unreadable)},
+    "maps": {map_uid: map_info}, # same fields as track_name.get_tmnf_map_info
+}
+
+A scan only parses the files that are new or changed since the last one, in worker processes when
+there are enough of them: the header parsing is pure Python.
+"""
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+from data_handler import save, load
+from metrics import stage, count
+from php_like import GBXChallengeFetcher
+from players import strip_formatting
+
+LOCAL_MAPS_FILE = Path(__file__).resolve().parent / "local_maps.pkl"
+MAP_SUFFIXES = (".challenge.gbx", ".map.gbx")
+PARALLEL_FROM = 64 # files, below that starting the worker processes costs more than it saves
+CHUNK_SIZE = 32
+
+_local_maps = None
+_local_maps_lock = threading.Lock()
+
+
+def new_local_maps() -> dict:
+    return {"folders": [], "files": {}, "maps": {}}
+
+
+def read_map_file(file: str) -> tuple | None:
+    """(uid, map_info) of a map file, None if it can't be read"""
+    fetcher = GBXChallengeFetcher()
+    try:
+        fetcher.processFile(file)
+    except Exception as e:
+        print(f"[!] Map file {file} not indexed - {e}")
+        return None
+    if not fetcher.uid:
+        return None
+    return fetcher.uid, {
+        "name": strip_formatting(fetcher.name),
+        "section": "Local",
+        "author": fetcher.author,
+        "environment": fetcher.envir,
+        "type": fetcher.type,
+        "mood": fetcher.mood,
+    }
+
+
+def _map_files(folder: Path):
+    for root, _, files in os.walk(folder):
+        for name in files:
+            if name.lower().endswith(MAP_SUFFIXES):
+                path = os.path.join(root, name)
+                try:
+                    file_stat = os.stat(path)
+                except OSError:
+                    continue
+                yield path, (file_stat.st_size, file_stat.st_mtime_ns)
+
+
+def scan_folders(local_maps: dict, workers: int | None = None) -> int:
+    """Parse the new and changed map files of the indexed folders, return the number of maps added"""
+    with stage("local_maps_scan"):
+        files = {}
+        for folder in local_maps["folders"]:
+            files.update(_map_files(Path(folder)))
+        old_files = local_maps["files"]
+        changed = [path for path, signature in files.items() if old_files.get(path, (None, None))[:2] != signature]
+
+        if len(changed) >= PARALLEL_FROM:
+            with ProcessPoolExecutor(max_workers=workers) as executor:
+                results = list(executor.map(read_map_file, changed, chunksize=CHUNK_SIZE))
+        else:
+            results = [read_map_file(path) for path in changed]
+
+    indexed = {path: old_files[path] for path in files if path in old_files}
+    added = 0
+    for path, result in zip(changed, results):
+        uid = None
+        if result is not None:
+            uid, map_info = result
+            added += uid not in local_maps["maps"]
+            local_maps["maps"][uid] = map_info
+        indexed[path] = (*files[path], uid)
+    local_maps["files"] = indexed
+    count("local_maps_parsed", len(changed))
+    return added
+
+
+def load_local_maps(local_maps_file: Path | str = LOCAL_MAPS_FILE) -> dict:
+    return load(local_maps_file) if Path(local_maps_file).exists() else new_local_maps()
+
+
+def index_folders(folders: list, local_maps_file: Path | str = LOCAL_MAPS_FILE, workers: int | None = None) -> int:
+    """Add folders to the index, scan them and save it, return the number of maps added"""
+    global _local_maps
+    local_maps = load_local_maps(local_maps_file)
+    local_maps["folders"] = list(dict.fromkeys([*local_maps["folders"], *map(str, folders)]))
+    added = scan_folders(local_maps, workers)
+    save(local_maps, local_maps_file)
+    if Path(local_maps_file) == LOCAL_MAPS_FILE:
+        _local_maps = local_maps
+    return added
+
+
+def find_local_map(uid: str) -> dict | None:
+    """Map info of a map file found in the Tracks folders, None if there is none"""
+    global _local_maps
+    if _local_maps is None:
+        with _local_maps_lock:
+            if _local_maps is None:
+                _local_maps = load_local_maps()
+    map_info = _local_maps["maps"].get(uid)
+    return None if map_info is None else dict(map_info)
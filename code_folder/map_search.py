@@ -0,0 +1,118 @@
+"""
+Search of the archived maps by name, UID, author or environment, fast enough to run at each key press.
+
+data_dict["map_index"] = {map_uid: (name, author, environment, last run timestamp)} is kept up to
+date by the ingestion (and built once from the map data.pkl files), MapSearch indexes one version
+of it: every word of the fields, lower-cased and sorted, so the maps with a word starting with a
+query word are found by bisection. A query word matching no word start is then looked for inside
+the fields, and as a last resort as a fuzzy match of the name: its letters in order ("a1rc" finds
+A01-Race). The maps matching every query word are ranked by match quality, then most recently
+played first.
+"""
+import re
+from bisect import bisect_left
+from heapq import nlargest
+
+from data_handler import load
+from metrics import stage
+from run_record import TIMESTAMP
+from storage import map_folder_path
+
+PREFIX_SCORE = 3
+NAME_BONUS = 1 # prefix of a word of the name rather than of another field
+SUBSTRING_SCORE = 2
+FUZZY_SCORE = 1
+WORD_SPLIT = re.compile(r"[^0-9a-z]+")
+
+
+def map_entry(map_data: dict) -> tuple:
+    last_run = max((run[TIMESTAMP] for run in map_data["runs"].values()), default=0)
+    return map_data["name"], map_data.get("author") or "", map_data.get("environment") or "", last_run
+
+
+def update_map_entry(data_dict: dict, map_uid: str, map_data: dict):
+    """
+    Put the map (new, or with a new run) in the index, the dict is replaced rather than changed.
+    An archive without index is left without: build_map_index makes it from every map.
+    """
+    if "map_index" in data_dict:
+        data_dict["map_index"] = {**data_dict["map_index"], map_uid: map_entry(map_data)}
+
+
+def build_map_index(destination, data_dict: dict) -> dict:
+    """Index every archived map from its data.pkl, for archives logged before the index existed"""
+    map_index = {}
+    with stage("map_index_build"):
+        for map_uid in data_dict["map_uids"]:
+            data_file = map_folder_path(destination, map_uid) / "data.pkl"
+            if not data_file.exists():
+                print(f"[!] Map data {data_file} not found, not in the map search")
+                continue
+            map_index[map_uid] = map_entry(load(data_file))
+    data_dict["map_index"] = map_index
+    return map_index
+
+
+def _words(text: str) -> list:
+    return [word for word in WORD_SPLIT.split(text.lower()) if word]
+
+
+class MapSearch:
+    def __init__(self, map_index: dict):
+        self.source = map_index
+        self.uids = list(map_index)
+        self.last_runs = [map_index[uid][3] for uid in self.uids]
+        # Text searched for substrings, the fields separated so no match spans two
+        self.texts = []
+        self.names = []
+        words = []
+        for position, uid in enumerate(self.uids):
+            name, author, environment, _ = map_index[uid]
+            self.names.append(name.lower())
+            self.texts.append("\n".join((name.lower(), uid.lower(), author.lower(), environment.lower())))
+            words.extend((word, position, True) for word in _words(name))
+            words.extend((word, position, False) for field in (uid, author, environment) for word in _words(field))
+        words.sort()
+        self.words = [word for word, _, _ in words]
+        self.word_maps = [(position, in_name) for _, position, in_name in words]
+
+    def _prefix_matches(self, query_word: str) -> dict:
+        scores = {}
+        start = bisect_left(self.words, query_word)
+        for index in range(start, len(self.words)):
+            if not self.words[index].startswith(query_word):
+                break
+            position, in_name = self.word_maps[index]
+            score = PREFIX_SCORE + NAME_BONUS * in_name
+            if scores.get(position, 0) < score:
+                scores[position] = score
+        return scores
+
+    def _word_scores(self, query_word: str, positions) -> dict:
+        """{map position: score} of the maps among positions that query_word matches"""
+        scores = self._prefix_matches(query_word)
+        if positions is not None:
+            scores = {position: score for position, score in scores.items() if position in positions}
+        fuzzy = re.compile(".*?".join(map(re.escape, query_word)))
+        for position in range(len(self.texts)) if positions is None else positions:
+            if position in scores:
+                continue
+            if query_word in self.texts[position]:
+                scores[position] = SUBSTRING_SCORE
+            elif fuzzy.search(self.names[position]):
+                scores[position] = FUZZY_SCORE
+        return scores
+
+    def search(self, query: str, limit: int = 50) -> list:
+        """[(map_uid, name), ...] of the best matches, the most recently played maps for an empty query"""
+        with stage("map_search"):
+            scores = None
+            for query_word in query.lower().split():
+                word_scores = self._word_scores(query_word, scores)
+                scores = word_scores if scores is None else {position: scores[position] + score for position, score in word_scores.items()}
+                if not scores:
+                    return []
+            if scores is None:
+                scores = dict.fromkeys(range(len(self.uids)), 0)
+            best = nlargest(limit, scores, key=lambda position: (scores[position], self.last_runs[position]))
+        return [(self.uids[position], self.source[self.uids[position]][0]) for position in best]
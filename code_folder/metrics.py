@@ -0,0 +1,164 @@
+import os
+import threading
+import time
+from contextlib import nullcontext
+from pathlib import Path
+
+_NULL_STAGE = nullcontext()
+
+
+class _Stage:
+    __slots__ = ("metrics", "name", "start")
+
+    def __init__(self, metrics, name):
+        self.metrics = metrics
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.metrics.add_time(self.name, time.perf_counter() - self.start, exc_type is not None)
+        return False
+
+
+class Metrics:
+    """
+    Stage timers and event counters of the replay ingestion.
+    Disabled by default, `stage` and `count` then only cost an attribute check.
+
+    timers = {
+        "stage": [calls, errors, total_seconds, max_seconds],
+        ...
+    }
+    """
+    def __init__(self):
+        self.enabled = False
+        self.started = time.time()
+        self.timers = {}
+        self.counters = {}
+        self._lock = threading.Lock()
+
+    def enable(self):
+        self.enabled = True
+
+    def disable(self):
+        self.enabled = False
+
+    def reset(self):
+        with self._lock:
+            self.timers = {}
+            self.counters = {}
+            self.started = time.time()
+
+    def stage(self, name: str):
+        if not self.enabled:
+            return _NULL_STAGE
+        return _Stage(self, name)
+
+    def add_time(self, name: str, seconds: float, failed: bool = False):
+        with self._lock:
+            timer = self.timers.get(name)
+            if timer is None:
+                timer = self.timers[name] = [0, 0, 0.0, 0.0]
+            timer[0] += 1
+            timer[1] += failed
+            timer[2] += seconds
+            if seconds > timer[3]:
+                timer[3] = seconds
+
+    def count(self, name: str, amount: int = 1):
+        if not self.enabled:
+            return
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + amount
+
+    def snapshot(self):
+        with self._lock:
+            timers = {name: list(timer) for name, timer in self.timers.items()}
+            counters = dict(self.counters)
+        return timers, counters
+
+    def summary(self) -> str:
+        timers, counters = self.snapshot()
+        if not timers and not counters:
+            return "No ingest metrics recorded yet."
+
+        lines = [f"Ingest metrics since {time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(self.started))}"]
+        if timers:
+            width = max(len(name) for name in timers)
+            lines.append(f"{'Stage'.ljust(width)} | {'Calls':>7} | {'Errors':>6} | {'Total (s)':>9} | {'Avr. (ms)':>9} | {'Max (ms)':>9}")
+            for name, (calls, errors, total, max_time) in sorted(timers.items(), key=lambda item: -item[1][2]):
+                lines.append(
+                    f"{name.ljust(width)} | {calls:>7} | {errors:>6} | {total:>9.3f} | "
+                    f"{total / calls * 1000:>9.2f} | {max_time * 1000:>9.2f}"
+                )
+        for name, value in sorted(counters.items()):
+            lines.append(f"{name}: {value}")
+        return "\n".join(lines)
+
+    def prometheus_text(self) -> str:
+        timers, counters = self.snapshot()
+        lines = [
+            "# HELP tmnf_ingest_stage_seconds_total Time spent in each ingest stage.",
+            "# TYPE tmnf_ingest_stage_seconds_total counter",
+        ]
+        lines += [f'tmnf_ingest_stage_seconds_total{{stage="{name}"}} {timer[2]:.6f}' for name, timer in timers.items()]
+        lines += [
+            "# HELP tmnf_ingest_stage_calls_total Number of times each ingest stage ran.",
+            "# TYPE tmnf_ingest_stage_calls_total counter",
+        ]
+        lines += [f'tmnf_ingest_stage_calls_total{{stage="{name}"}} {timer[0]}' for name, timer in timers.items()]
+        lines += [
+            "# HELP tmnf_ingest_stage_errors_total Number of times each ingest stage raised.",
+            "# TYPE tmnf_ingest_stage_errors_total counter",
+        ]
+        lines += [f'tmnf_ingest_stage_errors_total{{stage="{name}"}} {timer[1]}' for name, timer in timers.items()]
+        lines += [
+            "# HELP tmnf_ingest_stage_max_seconds Slowest single run of each ingest stage.",
+            "# TYPE tmnf_ingest_stage_max_seconds gauge",
+        ]
+        lines += [f'tmnf_ingest_stage_max_seconds{{stage="{name}"}} {timer[3]:.6f}' for name, timer in timers.items()]
+        lines += [
+            "# HELP tmnf_ingest_events_total Ingest events by kind.",
+            "# TYPE tmnf_ingest_events_total counter",
+        ]
+        lines += [f'tmnf_ingest_events_total{{event="{name}"}} {value}' for name, value in counters.items()]
+        return "\n".join(lines) + "\n"
+
+    def write_prometheus(self, file_path: Path | str):
+        # Written next to the target then renamed, so a scraper never reads half a file
+        tmp_path = f"{file_path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as file:
+            file.write(self.prometheus_text())
+        os.replace(tmp_path, file_path)
+
+
+class MetricsExporter(threading.Thread):
+    """Periodically writes the metrics to a Prometheus text file (node exporter textfile format)"""
+    def __init__(self, metrics: Metrics, file_path: Path | str, interval: float = 15.0):
+        super().__init__(daemon=True)
+        self.metrics = metrics
+        self.file_path = file_path
+        self.interval = interval
+        self._stop_event = threading.Event()
+
+    def run(self):
+        while not self._stop_event.wait(self.interval):
+            self.write()
+
+    def write(self):
+        try:
+            self.metrics.write_prometheus(self.file_path)
+        except OSError as e:
+            print(f"[!] Could not write metrics to {self.file_path} - {e}")
+
+    def stop(self):
+        self._stop_event.set()
+        self.write()
+
+
+METRICS = Metrics()
+stage = METRICS.stage
+count = METRICS.count
@@ -0,0 +1,159 @@
+"""
+Versioned data schema with in place migrations.
+
+Each map data.pkl carries map_data["schema"] and the app data dict carries data_dict["schema"].
+When the data format changes, SCHEMA_VERSION is bumped and a migration step is registered
+from the previous version: it rewrites the stored records of one map directly.
+Only steps registered with needs_files=True re-ingest the replay files of the map.
+
+Schema history:
+  1: runs are dicts keyed by the hex MD5 of the file, with a datetime "utc_date"
+  2: runs are tuples keyed by the 16 bytes MD5 digest, with an integer timestamp
+  3: runs store a player id of data_dict["players"] instead of the login and nickname
+  4: map folders are named after the map UID and replay files after their digest (see storage.py)
+"""
+import os
+from pathlib import Path
+from time import perf_counter
+
+from data_handler import save, load
+from file_uid import get_file_digest
+from players import PlayerTable
+from run_record import FILE_NAME
+from storage import map_folder_path, replay_path, index_map_name, link_by_name
+
+SCHEMA_VERSION = 4
+
+MIGRATIONS = {}
+
+
+def migration(from_version: int, needs_files: bool = False):
+    """Register a step migrating one map from `from_version` to `from_version + 1`"""
+    def decorator(func):
+        MIGRATIONS[from_version] = (func, needs_files)
+        return func
+    return decorator
+
+
+@migration(1)
+def runs_to_tuples(map_data: dict, data_dict: dict, map_folder: Path) -> dict:
+    runs = {}
+    for file_hash, replay_info in map_data["runs"].items():
+        runs[bytes.fromhex(file_hash)] = (
+            replay_info["user_login"],
+            replay_info["user_name"],
+            replay_info["replay_time_ms"],
+            replay_info["respawns"],
+            replay_info["stunt_score"],
+            int(replay_info["utc_date"].timestamp()),
+            replay_info.get("file_name"),
+            replay_info.get("splits"),
+        )
+    map_data["runs"] = runs
+    return map_data
+
+
+@migration(2)
+def logins_to_player_ids(map_data: dict, data_dict: dict, map_folder: Path) -> dict:
+    players = data_dict.setdefault("players", PlayerTable())
+    map_data["runs"] = {
+        file_digest: (players.get_id(run[0], run[1]),) + run[2:]
+        for file_digest, run in map_data["runs"].items()
+    }
+    return map_data
+
+
+@migration(3)
+def content_addressed_files(map_data: dict, data_dict: dict, map_folder: Path) -> dict:
+    # Renamed in place: same folder, same device, nothing is copied
+    destination = map_folder.parent
+    map_uid = map_data["uid"]
+    runs = map_data["runs"]
+    accounted = set()
+    for file_digest, run in runs.items():
+        stored = replay_path(map_folder, file_digest)
+        # The runs know the name their file was stored under, only the others are hashed below
+        if run[FILE_NAME] is not None and (map_folder / run[FILE_NAME]).is_file():
+            os.replace(map_folder / run[FILE_NAME], stored)
+        if stored.exists():
+            accounted.add(stored.name)
+            link_by_name(stored, destination, map_data["name"], map_uid, run[FILE_NAME] or stored.name)
+
+    for file in map_folder.iterdir():
+        if not file.name.endswith(".Gbx") or file.name in accounted:
+            continue
+        file_digest = get_file_digest(file)
+        if file_digest not in runs:
+            print(f"[!] {file} isn't a logged run, left as is")
+            continue
+        stored = replay_path(map_folder, file_digest)
+        os.replace(file, stored)
+        accounted.add(stored.name)
+        link_by_name(stored, destination, map_data["name"], map_uid, runs[file_digest][FILE_NAME] or file.name)
+    index_map_name(data_dict, map_uid, map_data["name"])
+    return map_data
+
+
+def detect_schema(map_data: dict) -> int:
+    """Version of a map saved before versions were stored, guessed from its runs"""
+    if "schema" in map_data:
+        return map_data["schema"]
+    run = next(iter(map_data["runs"].values()), None)
+    if run is None or isinstance(run, dict):
+        return 1
+    return 2 if len(run) == 8 else 3
+
+
+def needs_migration(data_dict: dict) -> bool:
+    return data_dict.get("schema", 1) < SCHEMA_VERSION
+
+
+def migrate_map(map_uid: str, destination: Path, data_dict: dict, save_data) -> bool:
+    """Bring one map to SCHEMA_VERSION, return True if it was rewritten"""
+    map_folder = map_folder_path(destination, map_uid)
+    if not map_folder.exists():
+        # Folder still named after the map (schema 3 and before)
+        old_folder = destination / data_dict["map_uids"][map_uid]
+        if not (old_folder / "data.pkl").exists():
+            print(f"[!] Map folder of {map_uid} not found, skipped")
+            return False
+        os.rename(old_folder, map_folder)
+
+    data_file = map_folder / "data.pkl"
+    map_data = load(data_file)
+    version = detect_schema(map_data)
+    if version >= SCHEMA_VERSION:
+        return False
+    map_data["uid"] = map_uid
+
+    steps = [MIGRATIONS[from_version] for from_version in range(version, SCHEMA_VERSION)]
+    if any(needs_files for _, needs_files in steps):
+        # Imported here: treat_files pulls the network and plotting dependencies
+        from treat_files import reingest_map_folder
+        print(f"  {map_folder.name}: re-reading the replay files")
+        reingest_map_folder(map_folder, destination, data_dict, map_data)
+    else:
+        for step, _ in steps:
+            map_data = step(map_data, data_dict, map_folder)
+        map_data["schema"] = SCHEMA_VERSION
+        save(map_data, data_file)
+    # The app data is saved after each map: a map rewritten with new player ids must never be
+    # left with a player table that wasn't saved, whatever happens after this
+    save_data()
+    return True
+
+
+def migrate_archive(destination: Path, data_dict: dict, save_data) -> int:
+    """
+    Migrate every map of the destination folder, resuming where a previous run stopped.
+    save_data() must persist data_dict, it's called after each migrated map.
+    """
+    start = perf_counter()
+    migrated = 0
+    for map_uid in list(data_dict["map_uids"]):
+        migrated += migrate_map(map_uid, destination, data_dict, save_data)
+
+    data_dict["schema"] = SCHEMA_VERSION
+    save_data()
+    print(f"Migrated {migrated} maps to data schema {SCHEMA_VERSION} in {perf_counter() - start:.2f}s")
+    return migrated
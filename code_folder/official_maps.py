@@ -0,0 +1,131 @@
+"""
+Bundled index of the official maps (StarTrack, Nations...), read before any online UID lookup.
+It only ships with a partial A01-Race entry for now, the official maps need a full table built with
+build_official_index.py to be found offline (see track_name.get_tmnf_map_info).
+
+official_maps.tsv is the editable source, one map per line:
+    uid <tab> name <tab> section <tab> author <tab> environment <tab> type <tab> mood
+official_maps.idx is built from it (build_official_index.py) and only memory-mapped when a map is
+looked up, nothing is read at startup:
+
+    header   MAGIC, format version, number of maps               (struct HEADER)
+    records  (uid padded to UID_SIZE bytes, offset of its fields) sorted by uid (struct RECORD)
+    fields   the FIELDS of each map, utf-8, tab separated, one line per map
+
+A lookup is a binary search on the fixed size records, so it reads about log2(maps) of them.
+"""
+import mmap
+import struct
+import threading
+from pathlib import Path
+
+MAGIC = b"TMOI"
+FORMAT_VERSION = 1
+UID_SIZE = 32
+HEADER = struct.Struct("<4sHI")
+RECORD = struct.Struct(f"<{UID_SIZE}sI")
+FIELDS = ("name", "section", "author", "environment", "type", "mood")
+
+INDEX_FILE = Path(__file__).resolve().parent / "official_maps.idx"
+SOURCE_FILE = Path(__file__).resolve().parent / "official_maps.tsv"
+
+_index = None
+_index_lock = threading.Lock()
+
+
+def read_source(source_file: Path | str = SOURCE_FILE) -> dict:
+    """{uid: map_info} of the TSV source, lines starting with # are comments"""
+    maps = {}
+    with open(source_file, encoding="utf-8") as file:
+        for line_number, line in enumerate(file, 1):
+            line = line.rstrip("\n")
+            if not line or line.startswith("#"):
+                continue
+            values = line.split("\t")
+            if len(values) != len(FIELDS) + 1:
+                raise ValueError(f"{source_file}:{line_number}: expected {len(FIELDS) + 1} tab separated columns")
+            maps[values[0]] = dict(zip(FIELDS, values[1:]))
+    return maps
+
+
+def write_source(maps: dict, source_file: Path | str = SOURCE_FILE):
+    with open(source_file, "w", encoding="utf-8", newline="\n") as file:
+        file.write("# uid\t" + "\t".join(FIELDS) + "\n")
+        for uid, map_info in sorted(maps.items()):
+            file.write("\t".join([uid, *(map_info.get(field, "") for field in FIELDS)]) + "\n")
+
+
+def write_index(maps: dict, index_file: Path | str = INDEX_FILE) -> int:
+    """Build the binary index of {uid: map_info}, return the number of maps written"""
+    records = []
+    fields = bytearray()
+    for uid in sorted(maps):
+        key = uid.encode("ascii")
+        if len(key) > UID_SIZE:
+            raise ValueError(f"UID {uid} is longer than {UID_SIZE} characters")
+        values = [maps[uid].get(field, "") for field in FIELDS]
+        if any("\t" in value or "\n" in value for value in values):
+            raise ValueError(f"Map info of {uid} contains a tab or a new line")
+        records.append(RECORD.pack(key, len(fields)))
+        fields += ("\t".join(values) + "\n").encode("utf-8")
+
+    tmp_path = f"{index_file}.tmp"
+    with open(tmp_path, "wb") as file:
+        file.write(HEADER.pack(MAGIC, FORMAT_VERSION, len(records)))
+        file.writelines(records)
+        file.write(fields)
+    Path(tmp_path).replace(index_file)
+    return len(records)
+
+
+class OfficialIndex:
+    def __init__(self, index_file: Path | str):
+        with open(index_file, "rb") as file:
+            self.map = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, self.size = HEADER.unpack_from(self.map)
+        if magic != MAGIC or version != FORMAT_VERSION:
+            raise ValueError(f"{index_file} is not an official maps index of version {FORMAT_VERSION}")
+        self.fields_start = HEADER.size + self.size * RECORD.size
+
+    def __len__(self):
+        return self.size
+
+    def find(self, uid: str) -> dict | None:
+        try:
+            key = uid.encode("ascii").ljust(UID_SIZE, b"\0")
+        except UnicodeEncodeError:
+            return None
+        low, high = 0, self.size
+        while low < high:
+            middle = (low + high) // 2
+            position = HEADER.size + middle * RECORD.size
+            record_key = self.map[position:position + UID_SIZE]
+            if record_key < key:
+                low = middle + 1
+            elif record_key > key:
+                high = middle
+            else:
+                start = self.fields_start + RECORD.unpack_from(self.map, position)[1]
+                end = self.map.find(b"\n", start)
+                return dict(zip(FIELDS, self.map[start:end].decode("utf-8").split("\t")))
+        return None
+
+
+def _load_index() -> OfficialIndex | None:
+    global _index
+    with _index_lock:
+        if _index is None:
+            try:
+                _index = OfficialIndex(INDEX_FILE)
+            except (OSError, ValueError) as e:
+                print(f"[!] Official maps index not available, maps are looked up online - {e}")
+                _index = False
+    return _index or None
+
+
+def find_official_map(uid: str) -> dict | None:
+    """Map info of an official map, None if it's not in the bundled index"""
+    index = _index or _load_index()
+    if index is None:
+        return None
+    return index.find(uid)
@@ -1,90 +1,93 @@
 import re
 from pathlib import Path
+from typing import NamedTuple
 
 from php_like import GBXReplayFetcher
-from error_display import display_error
 
 from track_name import get_tmnf_map_info
 
-def is_gbx_file(file_path: Path | str) -> bool:
-    with open(file_path, "rb") as f:
-        data = f.read()
-    return is_gbx_data(data.decode(errors="ignore"))
 
-def is_gbx_data(file_data: str) -> bool:
-    return len(file_data) >= 3 and file_data[:3] == "GBX"
+class ReplayHeader(NamedTuple):
+    validable: bool
+    best_time: int | None
+    respawns: int
+    stunt_score: int
+    map_uid: str | None
+    checkpoints_cur: int
+    checkpoints_lap: int
+    player_model: str
+    exe_version: str
+    exe_build: str
 
-def is_validable(file_data: str) -> bool:
-    match = re.search(r' validable="([01])"/>', file_data)
-    if match:
-        return bool(int(match.group(1)))
-    return False
 
-def get_times_match(file_data: str):
-    return re.search(r'<times best="(\d+)" respawns="(\d+)" stuntscore="(\d+)"', file_data)
+# One scan of the header XML: every tag we care about with its attributes
+_HEADER_TAG_RE = re.compile(rb'<(header|challenge|times|checkpoints|playermodel)\b([^>]*)>')
+_ATTRIBUTE_RE = re.compile(rb'(\w+)="([^"]*)"')
 
-def get_time(file_data: str) -> int:
-    match = get_times_match(file_data)
-    if match:
-        return match.group(1)
-    raise Exception("Map best time not found")
 
-def get_map_uid(file_data: str) -> int:
-    match = re.search(r'<challenge uid="([^"]+)"/>', file_data)
-    if match:
-        return match.group(1)
-    raise Exception("Map uid not found")
+def parse_header_xml(xml: bytes) -> ReplayHeader:
+    """Extract all the run fields from the XML header chunk of a replay"""
+    tags = {}
+    for match in _HEADER_TAG_RE.finditer(xml):
+        tags[match.group(1)] = dict(_ATTRIBUTE_RE.findall(match.group(2)))
+    
+    header = tags.get(b"header", {})
+    times = tags.get(b"times", {})
+    checkpoints = tags.get(b"checkpoints", {})
+    best_time = times.get(b"best")
+    map_uid = tags.get(b"challenge", {}).get(b"uid")
+    return ReplayHeader(
+        validable=times.get(b"validable") == b"1",
+        best_time=int(best_time) if best_time is not None else None,
+        respawns=int(times.get(b"respawns", 0)),
+        stunt_score=int(times.get(b"stuntscore", 0)),
+        map_uid=map_uid.decode() if map_uid is not None else None,
+        checkpoints_cur=int(checkpoints.get(b"cur", 0)),
+        checkpoints_lap=int(checkpoints.get(b"onelap", 0)),
+        player_model=tags.get(b"playermodel", {}).get(b"id", b"").decode(errors="replace"),
+        exe_version=header.get(b"exever", b"").decode(errors="replace"),
+        exe_build=header.get(b"exebuild", b"").decode(errors="replace"),
+    )
 
 
-def parse_trackmania_replay(file_path: str) -> dict:
+def is_gbx_file(file_path: Path | str) -> bool:
     with open(file_path, "rb") as f:
-        data = f.read()
-    file_data = data.decode(errors="ignore")
-    
-    if not is_gbx_data(file_data):
+        data = f.read(3)
+    return data == b"GBX"
+
+
+def parse_trackmania_replay(file_path: str) -> dict:
+    if not is_gbx_file(file_path):
         print("The file is not a GBX replay file.")
+        return None
     
-    validable = is_validable(file_data)
-    if not validable:
+    replay_fetcher = GBXReplayFetcher()
+    replay_fetcher.processFile(file_path)
+    header = parse_header_xml(replay_fetcher.xmlBytes)
+    if not header.validable:
         print("Replay file is not validable, not displayed in logs.")
         return None
 
+    # --- USER + MAP INFO ---
     result = {
-        "environment": None,
-        "author": None,
-        "user_name": None,
-        "user_login": None,
-        "map_uid": None,
-        "replay_time_ms": None,
-        "respawns": None,
-        "stunt_score": None,
-        "validable": True,
+        "environment": replay_fetcher.envir,
+        "author": replay_fetcher.author,
+        "user_name": replay_fetcher.nickname,
+        "user_login": replay_fetcher.login,
+        "map_uid": header.map_uid or replay_fetcher.uid,
     }
 
-    # --- USER + MAP INFO ---
-    replay_fetcher = GBXReplayFetcher(debug=True)
-    replay_fetcher.processFile(file_path)
-    result["environment"] = replay_fetcher.envir
-    result["author"] = replay_fetcher.author
-    result["user_name"] = replay_fetcher.nickname
-    result["user_login"] = replay_fetcher.login
-    result["map_uid"] = replay_fetcher.uid
-
     # --- USER STATS ---
-    try:
-        # print(xml_text[:400])
-        times_match = get_times_match(file_data)
-        if times_match:
-            result["replay_time_ms"] = int(times_match.group(1))
-            result["respawns"] = int(times_match.group(2))
-            result["stunt_score"] = int(times_match.group(3))
-        else:
-            print("[!] User stats not found")
-            
-        result["map_uid"] = get_map_uid(file_data)
-    except Exception as e:
-        print(f"[!] Could not parse XML info: {e}")
-        display_error()
+    if header.best_time is None:
+        print("[!] User stats not found")
+    result["replay_time_ms"] = header.best_time
+    result["respawns"] = header.respawns
+    result["stunt_score"] = header.stunt_score
+    result["validable"] = header.validable
+    result["checkpoints"] = header.checkpoints_cur
+    result["checkpoints_lap"] = header.checkpoints_lap
+    result["player_model"] = header.player_model
+    result["exe_version"] = header.exe_version
     return result
 
 
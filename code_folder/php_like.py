@@ -1,4 +1,7 @@
 import struct
+import xml.parsers.expat
+
+from metrics import stage
 
 
 class GBXBaseFetcher:
@@ -18,6 +21,7 @@ class GBXBaseFetcher:
     def __init__(self, parse_xml=False, debug=False):
         self.parse_xml = parse_xml
         self.xml = ''
+        self.xmlBytes = b''
         self.xmlParsed = {}
 
         self.author_ver = 0
@@ -53,7 +57,7 @@ class GBXBaseFetcher:
         self._error = str(prefix)
 
     def error_out(self, msg, code=0):
-        self.clear_gbxdata()
+        self.clearGBXdata()
         raise Exception(f"{self._error}{msg}", code)
 
     # Load/store GBX data
@@ -64,6 +68,18 @@ class GBXBaseFetcher:
         except IOError:
             self.error_out(f"Unable to read GBX data from {filename}", 1)
 
+    def loadGBXheader(self, filename):
+        """Only read the bytes up to the end of the header block, the body is never needed here"""
+        try:
+            with open(filename, 'rb') as f:
+                start = f.read(17)
+                if len(start) == 17:
+                    headerSize = struct.unpack_from('<l', start, 13)[0]
+                    start += f.read(max(headerSize, 0))
+                self.storeGBXdata(start)
+        except IOError:
+            self.error_out(f"Unable to read GBX data from {filename}", 1)
+
     def storeGBXdata(self, gbxdata: bytes):
         self._gbxdata = gbxdata
         self._gbxlen = len(gbxdata)
@@ -106,13 +122,15 @@ class GBXBaseFetcher:
         fmt = '>l' if self._endianess == self.BIG_ENDIAN_ORDER else '<l'
         return struct.unpack(fmt, self.readData(4))[0]
     
-    def readString(self):
+    def readStringBytes(self):
         len_ = self.readInt32() & 0x7FFFFFFF
         if len_ <= 0 or len_ >= 0x18000:
             if len_ != 0:
-                self.errorOut(f'Invalid string length {len_} (0x{len_:04X}) at pos 0x{self.getGBXptr():04X}', 3)
-        data = self.readData(len_)
-        return data.decode('utf-8', errors='replace')
+                self.error_out(f'Invalid string length {len_} (0x{len_:04X}) at pos 0x{self.getGBXptr():04X}', 3)
+        return self.readData(len_)
+
+    def readString(self):
+        return self.readStringBytes().decode('utf-8', errors='replace')
 
     def stripBOM(self, s):
         return s.replace('\xef\xbb\xbf', '')
@@ -125,7 +143,7 @@ class GBXBaseFetcher:
             self._lookbacks = []
             version = self.readInt32()
             if version != 3:
-                self.errorOut(f'Unknown lookback strings version: {version}', 4)
+                self.error_out(f'Unknown lookback strings version: {version}', 4)
 
         index = self.readInt32()
         if index == -1:
@@ -150,7 +168,9 @@ class GBXBaseFetcher:
 
     # XML Parsing
     def startTag(self, name, attribs):
-        attribs = {k: v.encode('utf-8').decode('utf-8') for k, v in attribs.items()}
+        # Tags and attributes are upper cased like PHP's expat case folding
+        name = name.upper()
+        attribs = {k.upper(): v for k, v in attribs.items()}
         self._parsestack.append(name)
         if name == 'DEP':
             self.xmlParsed.setdefault('DEPS', []).append(attribs)
@@ -173,27 +193,28 @@ class GBXBaseFetcher:
         parser.CharacterDataHandler = self.charData
 
         # Escape bare '&' characters
-        xml = self.xml
-        xml = xml.replace('&', '&amp;') if '&' in xml and not any(ent in xml for ent in ['&amp;', '&quot;', '&apos;', '&lt;', '&gt;']) else xml
+        xml_string = self.xml
+        if '&' in xml_string and not any(ent in xml_string for ent in ['&amp;', '&quot;', '&apos;', '&lt;', '&gt;']):
+            xml_string = xml_string.replace('&', '&amp;')
 
         try:
-            parser.Parse(xml.encode('utf-8'), True)
+            parser.Parse(xml_string.encode('utf-8'), True)
         except xml.parsers.expat.ExpatError as e:
-            self.errorOut(f"XML chunk parse error: {e} at line {parser.ErrorLineNumber}", 12)
+            self.error_out(f"XML chunk parse error: {e} at line {parser.ErrorLineNumber}", 12)
 
     def checkHeader(self, classes):
         data = self.readData(3)
         version = self.readInt16()
         if data != b'GBX':
-            self.errorOut('No magic GBX header', 5)
+            self.error_out('No magic GBX header', 5)
         if version != 6:
-            self.errorOut(f'Unsupported GBX version: {version}', 6)
+            self.error_out(f'Unsupported GBX version: {version}', 6)
 
         self.moveGBXptr(4)  # Skip unknown/format/compression
 
         mainClass = self.readInt32()
         if mainClass not in classes:
-            self.errorOut(f'Main class ID {mainClass:08X} not supported', 7)
+            self.error_out(f'Main class ID {mainClass:08X} not supported', 7)
         self.debugLog(f'GBX main class ID: {mainClass:08X} - {self._gbxptr}')
 
         headerSize = self.readInt32()
@@ -242,21 +263,22 @@ class GBXBaseFetcher:
             return
 
         self.initChunk(chunks_list['XML']['off'])
-        self.xml = self.readString()
-        xml_len = len(self.xml)
+        self.xmlBytes = self.readStringBytes()
+        self.xml = self.xmlBytes.decode('utf-8', errors='replace')
+        xml_len = len(self.xmlBytes)
 
         if xml_len > 0 and chunks_list['XML']['size'] != xml_len + 4:
             self.error_out(f'XML chunk size mismatch: {chunks_list["XML"]["size"]} <> {xml_len + 4}', 11)
 
         if self.parse_xml and self.xml:
-            self.parse_xml_string()
+            self.parseXMLstring()
 
 
     def get_author_fields(self):
         self.author_ver = self.readInt32()
         self.author_login = self.readString()
-        self.author_nick = self.strip_bom(self.readString())
-        self.author_zone = self.strip_bom(self.readString())
+        self.author_nick = self.stripBOM(self.readString())
+        self.author_zone = self.stripBOM(self.readString())
         self.author_einfo = self.readString()
 
 
@@ -264,7 +286,7 @@ class GBXBaseFetcher:
         if 'Author' not in chunks_list:
             return
 
-        self.init_chunk(chunks_list['Author']['off'])
+        self.initChunk(chunks_list['Author']['off'])
         version = self.readInt32()
         self.debugLog(f'GBX Author chunk version: {version}')
 
@@ -300,7 +322,7 @@ class GBXBaseFetcher:
 
 class GBXReplayFetcher(GBXBaseFetcher):
     def __init__(self, parsexml=False, debug=False):
-        super().__init__()
+        super().__init__(parsexml, debug)
 
         self.uid = ''
         self.envir = ''
@@ -327,11 +349,13 @@ class GBXReplayFetcher(GBXBaseFetcher):
         self.setError('GBX replay error: ')
 
     def processFile(self, filename: str):
-        self.loadGBXdata(str(filename))
-        self.processGBX()
+        with stage("gbx_read"):
+            self.loadGBXheader(str(filename))
+        with stage("gbx_parse"):
+            self.processGBX()
 
-    def processData(self, gbxdata: str):
-        self.storeGBXdata(str(gbxdata))
+    def processData(self, gbxdata: bytes):
+        self.storeGBXdata(bytes(gbxdata))
         self.processGBX()
 
     def processGBX(self):
@@ -343,7 +367,7 @@ class GBXReplayFetcher(GBXBaseFetcher):
 
         headerSize = self.checkHeader(replayclasses)
         if headerSize == 0:
-            self.errorOut('No GBX header block', 8)
+            self.error_out('No GBX header block', 8)
 
         headerStart = headerEnd = self.getGBXptr()
 
@@ -367,7 +391,7 @@ class GBXReplayFetcher(GBXBaseFetcher):
         headerEnd = max(headerEnd, self.getGBXptr())
 
         if headerSize != headerEnd - headerStart:
-            self.errorOut(f'Header size mismatch: {headerSize} <> {headerEnd - headerStart}', 20)
+            self.error_out(f'Header size mismatch: {headerSize} <> {headerEnd - headerStart}', 20)
 
         if self.parseXml:
             self.debugLog(f"xmlParsed -\n{self.xmlParsed}")
@@ -379,7 +403,7 @@ class GBXReplayFetcher(GBXBaseFetcher):
             if 'TIMES' in x:
                 self.respawns = int(x['TIMES'].get('RESPAWNS', 0))
                 self.stuntScore = int(x['TIMES'].get('STUNTSCORE', 0))
-                self.validable = bool(x['TIMES'].get('VALIDABLE', False))
+                self.validable = x['TIMES'].get('VALIDABLE', '0') == '1'
             if 'CHECKPOINTS' in x:
                 self.cpsCur = int(x['CHECKPOINTS'].get('CUR', 0))
                 self.cpsLap = int(x['CHECKPOINTS'].get('ONELAP', 0))
@@ -412,6 +436,101 @@ class GBXReplayFetcher(GBXBaseFetcher):
                     self.titleUid = self.readLookbackString()
 
 
+class GBXChallengeFetcher(GBXBaseFetcher):
+    """Map info from the header of a .Challenge.Gbx / .Map.Gbx file"""
+    def __init__(self, parsexml=True, debug=False):
+        super().__init__(parsexml, debug)
+
+        self.uid = ''
+        self.envir = ''
+        self.author = ''
+        self.name = ''
+        self.kind = 0
+        self.mood = ''
+        self.type = ''
+        self.authorTime = -1
+
+        self.parseXml = bool(parsexml)
+        if debug:
+            self.enableDebug()
+
+        self.setError('GBX challenge error: ')
+
+    def processFile(self, filename: str):
+        with stage("gbx_read"):
+            self.loadGBXheader(str(filename))
+        with stage("gbx_parse"):
+            self.processGBX()
+
+    def processData(self, gbxdata: bytes):
+        self.storeGBXdata(bytes(gbxdata))
+        self.processGBX()
+
+    def processGBX(self):
+        challengeclasses = [
+            self.GBX_CHALLENGE_TMF,
+            self.GBX_CHALLENGE_TM
+        ]
+
+        headerSize = self.checkHeader(challengeclasses)
+        if headerSize == 0:
+            self.error_out('No GBX header block', 8)
+
+        chunks = {
+            0x03043003: 'String',
+            0x24003003: 'String',
+            0x03043005: 'XML',
+            0x24003005: 'XML',
+            0x03043008: 'Author',
+            0x24003008: 'Author'
+        }
+
+        # The Info, Version and Thumbnail chunks are not read, so the header size is not checked against the chunks read
+        chunksList = self.getChunksList(headerSize, chunks)
+
+        self.getStringChunk(chunksList)
+        self.getXMLChunk(chunksList)
+        self.getAuthorChunk(chunksList)
+
+        if self.parseXml:
+            self.debugLog(f"xmlParsed -\n{self.xmlParsed}")
+            x = self.xmlParsed
+            if 'IDENT' in x:
+                self.uid = x['IDENT'].get('UID', self.uid)
+                self.name = x['IDENT'].get('NAME', self.name)
+                self.author = x['IDENT'].get('AUTHOR', self.author)
+            if 'DESC' in x:
+                self.envir = x['DESC'].get('ENVIR', self.envir)
+                self.mood = x['DESC'].get('MOOD', self.mood)
+                self.type = x['DESC'].get('TYPE', self.type)
+            if 'TIMES' in x:
+                self.authorTime = int(x['TIMES'].get('AUTHORTIME', -1))
+
+        self.clearGBXdata()
+        self.debugLog("")
+
+    def getStringChunk(self, chunksList):
+        if 'String' not in chunksList:
+            return
+
+        self.initChunk(chunksList['String']['off'])
+        version = self.readInt8()
+        self.debugLog(f'GBX String chunk version: {version}')
+
+        self.uid = self.readLookbackString()
+        self.envir = self.readLookbackString()
+        self.author = self.readLookbackString()
+        self.name = self.stripBOM(self.readString())
+        self.kind = self.readInt8()
+
+        if version >= 1:
+            self.moveGBXptr(4)  # skip locked
+            self.readString()   # skip password
+
+            if version >= 2:
+                self.mood = self.readLookbackString()  # decoration
+
+
 def gbx_replay_to_dict(fetcher):
     """
     Convert a GBXReplayFetcher instance into a dictionary with all metadata.
@@ -0,0 +1,82 @@
+import re
+from itertools import count
+
+# Versions of the tables, unique in the process: two tables with the same version have the same players
+_VERSIONS = count(1)
+
+# $$ is a literal $, everything else after a $ is a color (1 to 3 hex digits), a style or a link
+_FORMATTING_RE = re.compile(r'\$(\$|[0-9a-fA-F]{1,3}|[lLhH](?:\[[^\]]*\])?|.)')
+
+
+def strip_formatting(nickname: str) -> str:
+    return _FORMATTING_RE.sub(lambda match: "$" if match.group(1) == "$" else "", nickname).strip()
+
+
+class PlayerTable:
+    """
+    Global player dictionary, kept in data_dict["players"].
+    Each login gets a small integer id (its index), runs only store that id.
+    nicknames[id] is the nickname history of the player in first seen order.
+    version changes with every new player or nickname, for the caches built from the table.
+    """
+    def __init__(self):
+        self.logins = []
+        self.nicknames = []
+        self.ids = {}
+        self._display_names = {}
+        self.version = 0
+
+    def __len__(self):
+        return len(self.logins)
+
+    def __getstate__(self):
+        return {"logins": self.logins, "nicknames": self.nicknames}
+
+    def __setstate__(self, state):
+        self.logins = state["logins"]
+        self.nicknames = state["nicknames"]
+        self.ids = {login: player_id for player_id, login in enumerate(self.logins)}
+        self._display_names = {}
+        self.version = next(_VERSIONS)
+
+    def get_id(self, login: str, nickname: str | None = None) -> int:
+        player_id = self.ids.get(login)
+        if player_id is None:
+            player_id = self.ids[login] = len(self.logins)
+            self.logins.append(login)
+            self.nicknames.append([])
+            self.version = next(_VERSIONS)
+        if nickname and nickname not in self.nicknames[player_id]:
+            self.nicknames[player_id].append(nickname)
+            self._display_names.pop(player_id, None)
+            self.version = next(_VERSIONS)
+        return player_id
+
+    def with_player(self, login: str, nickname: str | None = None) -> tuple:
+        """(table, player id) like get_id, but a new player or nickname goes in a copy of the table (see data_store)"""
+        player_id = self.ids.get(login)
+        if player_id is not None and (not nickname or nickname in self.nicknames[player_id]):
+            return self, player_id
+        table = PlayerTable()
+        table.logins = list(self.logins)
+        table.nicknames = list(self.nicknames)
+        table.ids = dict(self.ids)
+        table._display_names = dict(self._display_names)
+        if player_id is not None:
+            table.nicknames[player_id] = list(table.nicknames[player_id])
+        return table, table.get_id(login, nickname)
+
+    def login(self, player_id: int) -> str:
+        return self.logins[player_id]
+
+    def names(self, player_id: int) -> list:
+        return self.nicknames[player_id]
+
+    def display_name(self, player_id: int) -> str:
+        """Latest nickname without its $ formatting codes, computed once per player"""
+        name = self._display_names.get(player_id)
+        if name is None:
+            nicknames = self.nicknames[player_id]
+            name = strip_formatting(nicknames[-1]) if nicknames else ""
+            self._display_names[player_id] = name = name or self.logins[player_id]
+        return name
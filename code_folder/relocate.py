@@ -0,0 +1,140 @@
+"""
+Relocation of the whole destination tree when the user picks a new destination folder.
+
+On the same device every entry is renamed, nothing is copied.
+Across devices the files are copied in parallel, each copy is verified against the source digest
+before it replaces its final name, and every finished file is appended to a journal kept in the new
+folder: an interrupted relocation resumes from the journal and never copies a file twice.
+The source files are only deleted once everything is copied, the caller flips the stored
+destination when relocate_tree returns True.
+"""
+import os
+import shutil
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+from file_uid import get_file_digest
+from metrics import stage, count
+
+JOURNAL_NAME = ".relocation-journal"
+COPY_WORKERS = 4
+
+
+def same_device(source: Path, destination: Path) -> bool:
+    return os.stat(source).st_dev == os.stat(destination).st_dev
+
+
+def _rename_tree(source: Path, destination: Path):
+    for entry in source.iterdir():
+        target = destination / entry.name
+        if not target.exists():
+            os.rename(entry, target)
+        elif entry.is_dir() and target.is_dir():
+            # Half done relocation or folders merged by hand: go down a level
+            _rename_tree(entry, target)
+            entry.rmdir()
+        else:
+            print(f"[!] {target} already exists, {entry} is left in place")
+
+
+def _read_journal(journal_path: Path, source: Path) -> set:
+    if not journal_path.exists():
+        return set()
+    lines = journal_path.read_text(encoding="utf-8").splitlines()
+    if not lines or lines[0] != str(source):
+        # Journal of a relocation from another folder, nothing in it applies here
+        return set()
+    return set(lines[1:])
+
+
+def _copy_verified(source_file: Path, target_file: Path):
+    part_file = target_file.with_name(target_file.name + ".part")
+    with stage("relocate_copy"):
+        shutil.copy2(source_file, part_file)
+    with stage("relocate_verify"):
+        if get_file_digest(part_file) != get_file_digest(source_file):
+            part_file.unlink()
+            raise OSError(f"Copy of {source_file} doesn't match the original")
+    os.replace(part_file, target_file)
+
+
+def _copy_tree(source: Path, destination: Path, workers: int):
+    journal_path = destination / JOURNAL_NAME
+    done = _read_journal(journal_path, source)
+    if not done:
+        journal_path.write_text(f"{source}\n", encoding="utf-8")
+
+    files = [path for path in source.rglob("*") if path.is_file()]
+    # Hard links (by-name folder) are copied once then linked again, not stored twice
+    first_links = {}
+    links = []
+    for path in files:
+        file_stat = path.stat()
+        first = first_links.setdefault((file_stat.st_dev, file_stat.st_ino), path)
+        if first is not path:
+            links.append((path, first))
+    linked = {path for path, _ in links}
+    to_copy = [path for path in files if path not in linked and path.relative_to(source).as_posix() not in done]
+    print(f"Copying {len(to_copy)} files to {destination} ({len(files) - len(to_copy) - len(links)} already copied)")
+    for folder in {path.parent for path in to_copy + list(linked)}:
+        (destination / folder.relative_to(source)).mkdir(parents=True, exist_ok=True)
+
+    journal_lock = threading.Lock()
+    with open(journal_path, "a", encoding="utf-8") as journal:
+        def copy_one(source_file: Path):
+            relative = source_file.relative_to(source).as_posix()
+            _copy_verified(source_file, destination / relative)
+            with journal_lock:
+                journal.write(relative + "\n")
+                journal.flush()
+            count("relocated_files")
+
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            # list() re-raises the first failed copy, the journal keeps what was done
+            list(executor.map(copy_one, to_copy))
+
+        for path, first in links:
+            relative = path.relative_to(source).as_posix()
+            if relative in done:
+                continue
+            target = destination / relative
+            target.unlink(missing_ok=True)
+            os.link(destination / first.relative_to(source), target)
+            journal.write(relative + "\n")
+        journal.flush()
+
+    # Everything is copied and verified, only now the source can go
+    for source_file in files:
+        source_file.unlink()
+    for folder in sorted((path for path in source.rglob("*") if path.is_dir()), key=lambda path: -len(path.parts)):
+        folder.rmdir()
+    journal_path.unlink()
+
+
+def relocate_tree(source: Path | None, destination: Path, workers: int = COPY_WORKERS) -> bool:
+    """Move the content of source into destination, return True once nothing is left to move"""
+    if source is None or not source.exists():
+        return True
+    source, destination = source.resolve(), destination.resolve()
+    if source == destination:
+        return True
+    if destination.is_relative_to(source):
+        print(f"[!] Can't move {source} inside itself")
+        return False
+    destination.mkdir(parents=True, exist_ok=True)
+
+    with stage("relocate"):
+        if same_device(source, destination):
+            _rename_tree(source, destination)
+        else:
+            _copy_tree(source, destination, workers)
+    return True
+
+
+def move_whole_directory(source: Path | None, destination: Path) -> bool:
+    try:
+        return relocate_tree(source, destination)
+    except OSError as e:
+        print(f"[!] Relocation to {destination} stopped, it will resume from where it stopped - {e}")
+        return False
@@ -0,0 +1,344 @@
+import struct
+import zlib
+from pathlib import Path
+from typing import NamedTuple
+
+import numpy as np
+
+from metrics import stage, count
+
+try:
+    import lzo # python-lzo, optional: much faster than the pure python decompressor
+except ImportError:
+    lzo = None
+
+GHOST_CHECKPOINTS_CHUNK = 0x0309200B
+GHOST_DATA_CHUNK = 0x0303F005
+GHOST_DATA_REPLAYING_CHUNK = 0x0303F006 # same data after an "is replaying" flag
+SKIPPABLE_MARKER = b"PIKS"
+VEHICLE_CAR_CLASS = 0x0A02B000
+# Start of a CSceneVehicleCar sample, the rest of it (wheels, inputs) isn't read
+CAR_SAMPLE = np.dtype([
+    ("position", "<f4", 3),
+    ("angle", "<u2"),
+    ("axis_heading", "<i2"),
+    ("axis_pitch", "<i2"),
+    ("speed", "<i2"), # log of the speed: exp(speed / 1000), -0x8000 when stopped
+    ("velocity_heading", "i1"),
+    ("velocity_pitch", "i1"),
+])
+
+
+class GBXBodyError(Exception):
+    pass
+
+
+def lzo1x_decompress(src: bytes, out_len: int | None = None) -> bytes:
+    """Pure python LZO1X decompression, used when python-lzo isn't installed"""
+    out = bytearray()
+    ip = 0
+    state = 0
+    src_len = len(src)
+
+    def read_length(ip, base):
+        # Lengths too big for the instruction are stored as zero bytes (255 each) and a last non zero byte
+        length = 0
+        while src[ip] == 0:
+            length += 255
+            ip += 1
+        return length + base + src[ip], ip + 1
+
+    def copy_match(distance, length):
+        start = len(out) - distance
+        if start < 0:
+            raise GBXBodyError(f"LZO match distance {distance} out of the output")
+        if distance >= length:
+            out.extend(out[start:start + length])
+        else:
+            pattern = out[start:]
+            out.extend((pattern * (length // distance + 1))[:length])
+
+    if src[0] > 17:
+        length = src[0] - 17
+        ip = 1
+        out.extend(src[ip:ip + length])
+        ip += length
+        state = length if length < 4 else 4
+
+    while ip < src_len:
+        inst = src[ip]
+        ip += 1
+
+        if inst < 16:
+            if state == 0:
+                # Long literal run
+                if inst == 0:
+                    length, ip = read_length(ip, 15)
+                else:
+                    length = inst
+                length += 3
+                out.extend(src[ip:ip + length])
+                ip += length
+                state = 4
+                continue
+            if state < 4:
+                copy_match((src[ip] << 2) + ((inst >> 2) & 3) + 1, 2)
+            else:
+                copy_match((src[ip] << 2) + ((inst >> 2) & 3) + 2049, 3)
+            ip += 1
+            next_state = inst & 3
+        elif inst < 32:
+            length = inst & 7
+            if length == 0:
+                length, ip = read_length(ip, 7)
+            low, high = src[ip], src[ip + 1]
+            ip += 2
+            distance = 16384 + ((inst & 8) << 11) + ((high << 6) | (low >> 2))
+            if distance == 16384:
+                break # End of stream marker
+            copy_match(distance, length + 2)
+            next_state = low & 3
+        elif inst < 64:
+            length = inst & 31
+            if length == 0:
+                length, ip = read_length(ip, 31)
+            low, high = src[ip], src[ip + 1]
+            ip += 2
+            copy_match(((high << 6) | (low >> 2)) + 1, length + 2)
+            next_state = low & 3
+        else:
+            length = (3 + ((inst >> 5) & 1)) if inst < 128 else (5 + ((inst >> 5) & 3))
+            copy_match((src[ip] << 3) + ((inst >> 2) & 7) + 1, length)
+            ip += 1
+            next_state = inst & 3
+
+        # Instructions can be followed by up to 3 literals
+        state = next_state
+        if next_state:
+            out.extend(src[ip:ip + next_state])
+            ip += next_state
+
+    if out_len is not None and len(out) != out_len:
+        raise GBXBodyError(f"LZO decompressed size mismatch: {len(out)} <> {out_len}")
+    return bytes(out)
+
+
+def decompress_body(data: bytes, uncompressed_size: int) -> bytes:
+    if lzo is not None:
+        return lzo.decompress(data, False, uncompressed_size)
+    return lzo1x_decompress(data, uncompressed_size)
+
+
+class GhostSamples(NamedTuple):
+    time_ms: np.ndarray # (n,) int32, from the start of the run
+    position: np.ndarray # (n, 3) float32, x, y (height), z
+    speed: np.ndarray # (n,) float32, in game units per second (x 3.6 is the speedometer km/h)
+    sample_period_ms: int
+
+
+class _Reader:
+    def __init__(self, data: bytes, pos: int = 0):
+        self.data = data
+        self.pos = pos
+
+    def read(self, length: int) -> bytes:
+        if self.pos + length > len(self.data):
+            raise GBXBodyError(f"Insufficient data for {length} bytes at pos 0x{self.pos:04X}")
+        value = self.data[self.pos:self.pos + length]
+        self.pos += length
+        return value
+
+    def int32(self) -> int:
+        return struct.unpack("<l", self.read(4))[0]
+
+    def string(self) -> str:
+        return self.read(self.int32() & 0x7FFFFFFF).decode("utf-8", errors="replace")
+
+    def folder(self):
+        self.string()
+        for _ in range(self.int32()):
+            self.folder()
+
+
+def extract_body(gbx_data: bytes) -> bytes:
+    """Return the (decompressed) body of a GBX file: what follows the header and reference table"""
+    reader = _Reader(gbx_data)
+    if reader.read(3) != b"GBX":
+        raise GBXBodyError("No magic GBX header")
+    version = struct.unpack("<h", reader.read(2))[0]
+    if version != 6:
+        raise GBXBodyError(f"Unsupported GBX version: {version}")
+    _, ref_compression, body_compression, _ = reader.read(4)
+    reader.read(4) # Main class ID
+    header_size = reader.int32()
+    reader.pos += header_size # Header chunks
+    reader.int32() # Number of nodes
+
+    if ref_compression != ord("U"):
+        raise GBXBodyError("Compressed reference tables are not supported")
+    external_nodes = reader.int32()
+    if external_nodes > 0:
+        reader.int32() # Ancestor level
+        for _ in range(reader.int32()):
+            reader.folder()
+        for _ in range(external_nodes):
+            flags = reader.int32()
+            if flags & 4 == 0:
+                reader.string()
+            else:
+                reader.int32()
+            reader.int32() # Node index
+            reader.int32() # Use file
+            if flags & 4 == 0:
+                reader.int32() # Folder index
+
+    if body_compression == ord("U"):
+        return gbx_data[reader.pos:]
+    uncompressed_size = reader.int32()
+    compressed_size = reader.int32()
+    return decompress_body(reader.read(compressed_size), uncompressed_size)
+
+
+def get_checkpoint_times(body: bytes) -> list[int]:
+    """
+    Checkpoint times (ms, from the start, the last one is the finish) of the first ghost of a replay body.
+    The ghost checkpoints chunk is skippable so it's found by its id and marker without parsing the whole body.
+    """
+    marker = struct.pack("<L", GHOST_CHECKPOINTS_CHUNK) + SKIPPABLE_MARKER
+    pos = body.find(marker)
+    while pos != -1:
+        start = pos + len(marker)
+        if start + 8 <= len(body):
+            size, num_checkpoints = struct.unpack_from("<LL", body, start)
+            if size == 4 + num_checkpoints * 8 and start + 4 + size <= len(body):
+                values = struct.unpack_from(f"<{num_checkpoints * 2}L", body, start + 8)
+                return list(values[0::2])
+        pos = body.find(marker, pos + 1)
+    return []
+
+
+def read_replay_splits(file_path: Path | str) -> list[int]:
+    with stage("body_read"):
+        with open(file_path, "rb") as file:
+            gbx_data = file.read()
+    return replay_splits(gbx_data)
+
+
+def replay_splits(gbx_data: bytes) -> list[int]:
+    count("body_decodes")
+    with stage("body_decode"):
+        body = extract_body(gbx_data)
+    with stage("body_splits"):
+        return get_checkpoint_times(body)
+
+
+def _ghost_data(body: bytes) -> bytes:
+    """Decompressed sample stream of the first ghost of a replay body, found by its chunk id like the checkpoints"""
+    markers = (struct.pack("<L", GHOST_DATA_CHUNK), struct.pack("<L", GHOST_DATA_REPLAYING_CHUNK))
+    positions = sorted(
+        (pos, marker) for marker in markers
+        for pos in _find_all(body, marker)
+    )
+    for pos, marker in positions:
+        start = pos + 4
+        if body[start:start + 4] == SKIPPABLE_MARKER:
+            start += 8 # Marker and chunk size
+        if marker == markers[1]:
+            start += 4
+        if start + 8 > len(body):
+            continue
+        uncompressed_size, compressed_size = struct.unpack_from("<LL", body, start)
+        compressed = body[start + 8:start + 8 + compressed_size]
+        # The stream is zlib compressed, a chunk id found by chance fails one of these checks
+        if len(compressed) != compressed_size or compressed_size < 2 or compressed[0] != 0x78:
+            continue
+        try:
+            data = zlib.decompress(compressed)
+        except zlib.error:
+            continue
+        if len(data) == uncompressed_size:
+            return data
+    raise GBXBodyError("No ghost samples in the replay body")
+
+
+def _find_all(data: bytes, marker: bytes):
+    pos = data.find(marker)
+    while pos != -1:
+        yield pos
+        pos = data.find(marker, pos + 1)
+
+
+def get_ghost_samples(body: bytes, max_samples: int | None = None) -> GhostSamples:
+    """
+    Time, position and speed of the samples of the first ghost of a replay body (one every
+    sample_period_ms, 100 ms in TMNF), max_samples keeps that many evenly spread ones, for plots.
+    The samples are read in place from the stream as a numpy structured array, no object per sample.
+    """
+    reader = _Reader(_ghost_data(body))
+    class_id = reader.int32() & 0xFFFFFFFF
+    if class_id != VEHICLE_CAR_CLASS:
+        raise GBXBodyError(f"Unsupported ghost vehicle class 0x{class_id:08X}")
+    skip_times = reader.int32() != 0
+    reader.int32()
+    sample_period = reader.int32()
+    reader.int32()
+    samples_size = reader.int32()
+    samples_start = reader.pos
+    reader.read(samples_size)
+
+    num_samples = reader.int32()
+    offsets = np.zeros(0, dtype=np.int64)
+    if num_samples > 0:
+        first_offset = reader.int32()
+        if num_samples == 1:
+            offsets = np.array([first_offset], dtype=np.int64)
+        else:
+            size_per_sample = reader.int32()
+            if size_per_sample == -1:
+                sample_sizes = np.frombuffer(reader.read(4 * (num_samples - 1)), dtype="<i4")
+                offsets = first_offset + np.concatenate(([0], np.cumsum(sample_sizes, dtype=np.int64)))
+            else:
+                offsets = first_offset + np.arange(num_samples, dtype=np.int64) * size_per_sample
+    times = None
+    if not skip_times:
+        times = np.frombuffer(reader.read(4 * reader.int32()), dtype="<i4")
+        if len(times) != num_samples:
+            times = None
+    if len(offsets) and (offsets.min() < 0 or offsets.max() + CAR_SAMPLE.itemsize > samples_size):
+        raise GBXBodyError("Ghost sample offsets out of the sample data")
+
+    kept = np.arange(num_samples)
+    if max_samples is not None and num_samples > max_samples:
+        # Evenly spread, first and last samples kept
+        kept = np.unique(np.linspace(0, num_samples - 1, max_samples).round().astype(np.int64))
+
+    # Every kept sample gathered from the stream in one go, then viewed with the sample layout
+    stream = np.frombuffer(reader.data, dtype=np.uint8, offset=samples_start, count=samples_size)
+    gathered = stream[offsets[kept, None] + np.arange(CAR_SAMPLE.itemsize)]
+    samples = np.ascontiguousarray(gathered).view(CAR_SAMPLE).reshape(-1)
+
+    ghost = GhostSamples(
+        time_ms=np.empty(len(kept), dtype=np.int32),
+        position=np.empty((len(kept), 3), dtype=np.float32),
+        speed=np.empty(len(kept), dtype=np.float32),
+        sample_period_ms=sample_period,
+    )
+    ghost.time_ms[:] = kept * sample_period if times is None else times[kept]
+    ghost.position[:] = samples["position"]
+    np.exp(samples["speed"] / 1000, out=ghost.speed, casting="same_kind")
+    ghost.speed[samples["speed"] == -0x8000] = 0
+    return ghost
+
+
+def replay_ghost(gbx_data: bytes, max_samples: int | None = None) -> GhostSamples:
+    count("ghost_decodes")
+    with stage("body_decode"):
+        body = extract_body(gbx_data)
+    with stage("ghost_samples"):
+        return get_ghost_samples(body, max_samples)
+
+
+def positions_at(ghost: GhostSamples, time_ms) -> np.ndarray:
+    """Positions of a ghost at other times (the samples of another run), interpolated: (n, 3)"""
+    time_ms = np.asarray(time_ms)
+    return np.stack([np.interp(time_ms, ghost.time_ms, ghost.position[:, axis]) for axis in range(3)], axis=1)
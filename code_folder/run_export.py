@@ -0,0 +1,213 @@
+"""
+Export of the logged runs joined with their map info, to CSV, JSON Lines or Parquet.
+
+Runs go through a generator pipeline (maps -> runs -> filters -> rows -> writer), only one map
+data.pkl is loaded at a time and rows are written as they come, so memory doesn't grow with the archive.
+
+Incremental exports keep a cursor per map in a JSON state file: map_data["runs"] is a dict, new runs
+are always added at its end, so the runs after the number already exported are the new ones.
+The digest of the last exported run checks the order is still the same (sanitise rebuilds it),
+the whole map is exported again otherwise. The cursors are kept per filter: a run left out by the
+filter of one export is still new for an export with another filter.
+"""
+import csv
+import json
+import math
+from datetime import datetime, timezone
+from itertools import islice
+from pathlib import Path
+
+from data_handler import load
+from metrics import stage, count
+from run_filters import RunFilter, filter_runs
+from run_record import PLAYER, REPLAY_TIME_MS, RESPAWNS, STUNT_SCORE, TIMESTAMP, FILE_NAME, SPLITS
+from storage import map_folder_path, find_maps
+
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
+
+FORMATS = ("csv", "jsonl", "parquet")
+COLUMNS = (
+    "map_uid", "map_name", "author", "environment", "login", "nickname", "time_ms",
+    "respawns", "stunt_score", "date", "timestamp", "file_digest", "file_name", "splits",
+)
+PARQUET_BATCH = 10_000
+
+
+def iter_maps(destination: Path, data_dict: dict, maps: list | None = None):
+    """(map_uid, map_folder) of the maps to export, maps are UIDs or names"""
+    if not maps:
+        map_uids = list(data_dict["map_uids"])
+    else:
+        map_uids = []
+        for map_key in maps:
+            found = [map_key] if map_key in data_dict["map_uids"] else find_maps(data_dict, map_key)
+            if not found:
+                print(f"[!] No map {map_key} in the archive")
+            map_uids += found
+    for map_uid in map_uids:
+        yield map_uid, map_folder_path(destination, map_uid)
+
+
+def iter_runs(maps, cursors: dict | None = None, run_filter: RunFilter | None = None):
+    """
+    (map_uid, map_data, file_digest, run) of every run matching run_filter, or only the new ones when cursors is given.
+    cursors = {map_uid: [runs exported, digest of the last one], ...} is updated as the maps are read.
+    """
+    for map_uid, map_folder in maps:
+        data_file = map_folder / "data.pkl"
+        if not data_file.exists():
+            print(f"[!] Map data {data_file} not found, skipped")
+            continue
+        map_data = load(data_file)
+        runs = map_data["runs"]
+
+        start = 0
+        if cursors is not None:
+            exported, last_digest = cursors.get(map_uid, (0, None))
+            if 0 < exported <= len(runs) and next(islice(runs, exported - 1, None)).hex() == last_digest:
+                start = exported
+            elif exported:
+                print(f"[!] Runs of {map_uid} were rebuilt since the last export, exporting all of them again")
+            if len(runs):
+                cursors[map_uid] = [len(runs), next(reversed(runs)).hex()]
+
+        matching = filter_runs(map_data, run_filter)
+        if start == 0:
+            digests = matching
+        else:
+            digests = (file_digest for file_digest in islice(runs, start, None) if file_digest in matching)
+        for file_digest in digests:
+            yield map_uid, map_data, file_digest, runs[file_digest]
+
+
+def make_run_filter(players, logins: list | None = None, since: datetime | None = None,
+                    until: datetime | None = None) -> RunFilter | None:
+    """RunFilter of the export options, None when none of the logins is in the archive (nothing to export)"""
+    player_ids = ()
+    if logins:
+        player_ids = tuple(players.ids[login] for login in logins if login in players.ids)
+        if not player_ids:
+            return None
+    return RunFilter(
+        # Run timestamps are whole seconds
+        since=None if since is None else math.ceil(since.timestamp()),
+        until=None if until is None else math.ceil(until.timestamp()),
+        players=player_ids,
+    )
+
+
+def filter_key(maps: list | None, logins: list | None, since: datetime | None, until: datetime | None) -> str:
+    """Key of the cursors of one set of export options in the state file"""
+    return json.dumps({
+        "maps": sorted(maps or []), "logins": sorted(logins or []),
+        "since": None if since is None else since.isoformat(), "until": None if until is None else until.isoformat(),
+    }, sort_keys=True)
+
+
+def iter_rows(runs, players):
+    for map_uid, map_data, file_digest, run in runs:
+        count("exported_runs")
+        yield {
+            "map_uid": map_uid,
+            "map_name": map_data.get("name"),
+            "author": map_data.get("author"),
+            "environment": map_data.get("environment"),
+            "login": players.login(run[PLAYER]),
+            "nickname": players.display_name(run[PLAYER]),
+            "time_ms": run[REPLAY_TIME_MS],
+            "respawns": run[RESPAWNS],
+            "stunt_score": run[STUNT_SCORE],
+            "date": datetime.fromtimestamp(run[TIMESTAMP], timezone.utc).isoformat(),
+            "timestamp": run[TIMESTAMP],
+            "file_digest": file_digest.hex(),
+            "file_name": run[FILE_NAME],
+            "splits": run[SPLITS],
+        }
+
+
+def write_csv(rows, output: Path) -> int:
+    written = 0
+    with open(output, "w", newline="", encoding="utf-8") as file:
+        writer = csv.writer(file)
+        writer.writerow(COLUMNS)
+        for row in rows:
+            splits = row["splits"]
+            row["splits"] = "" if splits is None else " ".join(map(str, splits))
+            writer.writerow([row[column] for column in COLUMNS])
+            written += 1
+    return written
+
+
+def write_jsonl(rows, output: Path) -> int:
+    written = 0
+    with open(output, "w", encoding="utf-8") as file:
+        for row in rows:
+            file.write(json.dumps(row, ensure_ascii=False) + "\n")
+            written += 1
+    return written
+
+
+def write_parquet(rows, output: Path) -> int:
+    if pyarrow is None:
+        raise RuntimeError("Parquet export needs pyarrow: pip install pyarrow")
+    schema = pyarrow.schema([
+        *((column, pyarrow.string()) for column in ("map_uid", "map_name", "author", "environment", "login", "nickname")),
+        ("time_ms", pyarrow.int32()),
+        ("respawns", pyarrow.int32()),
+        ("stunt_score", pyarrow.int32()),
+        ("date", pyarrow.string()),
+        ("timestamp", pyarrow.int64()),
+        ("file_digest", pyarrow.string()),
+        ("file_name", pyarrow.string()),
+        ("splits", pyarrow.list_(pyarrow.int32())),
+    ])
+    written = 0
+    with pyarrow.parquet.ParquetWriter(output, schema) as writer:
+        while batch := list(islice(rows, PARQUET_BATCH)):
+            writer.write_table(pyarrow.Table.from_pylist(batch, schema=schema))
+            written += len(batch)
+    return written
+
+
+WRITERS = {"csv": write_csv, "jsonl": write_jsonl, "parquet": write_parquet}
+
+
+def export_runs(destination: Path, data_dict: dict, output: Path, file_format: str | None = None,
+                maps: list | None = None, logins: list | None = None,
+                since: datetime | None = None, until: datetime | None = None,
+                state_file: Path | None = None) -> int:
+    """Write the runs to output, return the number of runs written"""
+    output = Path(output)
+    file_format = file_format or output.suffix.lstrip(".").lower()
+    if file_format not in WRITERS:
+        raise ValueError(f"Unknown export format {file_format}, use one of {', '.join(FORMATS)}")
+
+    state = cursors = None
+    if state_file is not None:
+        state_file = Path(state_file)
+        state = json.loads(state_file.read_text(encoding="utf-8")) if state_file.exists() else {}
+        if any(isinstance(value, list) for value in state.values()):
+            # Cursors of every map at the top level, saved before they were kept per filter
+            print(f"[!] {state_file} doesn't say which filters it was made with, exporting all the runs again")
+            state = {}
+        cursors = state.setdefault(filter_key(maps, logins, since, until), {})
+
+    players = data_dict["players"]
+    run_filter = make_run_filter(players, logins, since, until)
+    if run_filter is None:
+        print(f"[!] No run of {', '.join(logins)} in the archive")
+        selected_maps = iter(())
+    else:
+        selected_maps = iter_maps(Path(destination), data_dict, maps)
+    rows = iter_rows(iter_runs(selected_maps, cursors, run_filter), players)
+    with stage("export"):
+        written = WRITERS[file_format](rows, output)
+
+    # Saved once the output is complete: a failed export is simply done again
+    if state_file is not None:
+        state_file.write_text(json.dumps(state), encoding="utf-8")
+    return written
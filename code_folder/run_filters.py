@@ -0,0 +1,112 @@
+"""
+Runs of a map by date, kept in memory (see index_cache.py) and updated on each ingest like the time index:
+
+run_index = {
+    "runs": number of runs indexed, "last": digest of the last one (see run_record.runs_after),
+    "dates": [(timestamp, digest), ...],                  # every run of the map, by date
+    "players": {player_id: [(timestamp, digest), ...]},  # runs of each player, by date
+    "clean": [(timestamp, digest), ...],                  # runs without respawn, by date
+}
+
+A RunFilter picks the smallest of the lists it can use (a player's runs, the clean runs or all of
+them) and bisects it to its date window, the other conditions are only checked on what's left:
+"last 7 days of login X" on a map with 100k runs reads about as many runs as it returns.
+The digests are the keys of map_data["runs"], pickle stores them once.
+"""
+from bisect import bisect_left, insort
+from typing import NamedTuple
+
+import index_cache
+from metrics import stage, count
+from run_record import PLAYER, RESPAWNS, TIMESTAMP, runs_after, cursor
+
+DAY = 24 * 60 * 60
+
+
+class RunFilter(NamedTuple):
+    since: int | None = None # first timestamp kept
+    until: int | None = None # first timestamp left out
+    players: tuple = () # player ids, all players if empty
+    clean_only: bool = False # only the runs without respawn
+
+    def is_empty(self) -> bool:
+        return self == RunFilter()
+
+
+def update_run_index(map_data: dict) -> dict:
+    runs = map_data["runs"]
+    map_data.pop("run_index", None) # Saved in data.pkl by older versions
+    with index_cache.lock:
+        index = index_cache.get_index("run_index", map_data)
+        new_digests = None if index is None else runs_after(runs, index["runs"], index["last"])
+        if new_digests == []:
+            return index
+        with stage("run_index_update"):
+            if new_digests is None:
+                index = {"dates": [], "players": {}, "clean": []}
+                for file_digest, run in runs.items():
+                    entry = (run[TIMESTAMP], file_digest)
+                    index["dates"].append(entry)
+                    index["players"].setdefault(run[PLAYER], []).append(entry)
+                    if run[RESPAWNS] == 0:
+                        index["clean"].append(entry)
+                index["dates"].sort()
+                for player_runs in index["players"].values():
+                    player_runs.sort()
+                index["clean"].sort()
+            else:
+                for file_digest in new_digests:
+                    run = runs[file_digest]
+                    entry = (run[TIMESTAMP], file_digest)
+                    insort(index["dates"], entry)
+                    insort(index["players"].setdefault(run[PLAYER], []), entry)
+                    if run[RESPAWNS] == 0:
+                        insort(index["clean"], entry)
+            index["runs"], index["last"] = cursor(runs)
+        index_cache.put_index("run_index", map_data, index)
+    return index
+
+
+def _window(entries: list, since: int | None, until: int | None) -> tuple:
+    start = 0 if since is None else bisect_left(entries, (since,))
+    end = len(entries) if until is None else bisect_left(entries, (until,))
+    return start, end
+
+
+def filter_runs(map_data: dict, run_filter: RunFilter | None = None) -> dict:
+    """{digest: run} of the runs of a map matching run_filter (by date, all of them in map order without filter)"""
+    runs = map_data["runs"]
+    if run_filter is None or run_filter.is_empty():
+        return runs
+    with index_cache.lock:
+        index = update_run_index(map_data)
+        with stage("run_filter"):
+            # Each candidate list with its date window, the shortest window is walked
+            candidates = [[index["players"].get(player, []) for player in run_filter.players]] if run_filter.players else []
+            if run_filter.clean_only:
+                candidates.append([index["clean"]])
+            if not candidates:
+                candidates.append([index["dates"]])
+            windows = [
+                [(entries, *_window(entries, run_filter.since, run_filter.until)) for entries in lists]
+                for lists in candidates
+            ]
+            shortest = min(windows, key=lambda lists: sum(end - start for _, start, end in lists))
+            if len(shortest) == 1:
+                entries, start, end = shortest[0]
+                selected = entries[start:end]
+            else:
+                # Runs of several players merged back in date order
+                selected = sorted(entry for entries, start, end in shortest for entry in entries[start:end])
+
+            players = set(run_filter.players)
+            matching = {}
+            for _, file_digest in selected:
+                run = runs[file_digest]
+                if players and run[PLAYER] not in players:
+                    continue
+                if run_filter.clean_only and run[RESPAWNS] != 0:
+                    continue
+                matching[file_digest] = run
+    count("runs_filtered", len(selected))
+    return matching
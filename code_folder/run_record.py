@@ -0,0 +1,46 @@
+"""
+Runs are stored in map_data["runs"] under the 16 bytes MD5 digest of their replay file.
+A run is a plain tuple read through the field indexes below: pickle rebuilds tuples without
+calling any python code, so big archives load about twice as fast as with dicts or objects.
+
+run = (player, replay_time_ms, respawns, stunt_score, timestamp, file_name, splits)
+
+player is the id of the login in the global PlayerTable (data_dict["players"]),
+timestamp is the file creation time in seconds since the epoch,
+splits stays None until the replay body is decoded (see get_map_splits).
+
+Data derived from the runs (sessions, time index) keeps a cursor: the number of runs it has seen and
+the digest of the last one. New runs are always added at the end of map_data["runs"], runs_after
+gives the ones after a cursor, walking the dict from its end so an ingest doesn't scan the whole map.
+"""
+from itertools import islice
+
+PLAYER = 0
+REPLAY_TIME_MS = 1
+RESPAWNS = 2
+STUNT_SCORE = 3
+TIMESTAMP = 4
+FILE_NAME = 5
+SPLITS = 6
+
+
+def make_run(player: int, replay_time_ms: int, respawns: int, stunt_score: int,
+             timestamp: int, file_name: str | None = None, splits: list | None = None) -> tuple:
+    return (player, replay_time_ms, respawns, stunt_score, timestamp, file_name, splits)
+
+
+def replace_field(run: tuple, index: int, value) -> tuple:
+    return run[:index] + (value,) + run[index + 1:]
+
+
+
+def runs_after(runs: dict, seen: int, last_digest: bytes | None) -> list | None:
+    """Digests of the runs added after the cursor, None if the runs were rebuilt since (sanitise)"""
+    new_count = len(runs) - seen
+    if new_count < 0 or (seen and next(islice(reversed(runs), new_count, None)) != last_digest):
+        return None
+    return list(islice(reversed(runs), new_count))[::-1]
+
+
+def cursor(runs: dict) -> tuple:
+    return len(runs), next(reversed(runs), None)
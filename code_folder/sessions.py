@@ -0,0 +1,131 @@
+"""
+Sessions and PB progression of each player on a map, kept in map_data["analysis"] and updated
+with the runs added since the last update:
+
+analysis = {
+    "runs": number of runs analysed, "last": digest of the last one (map_data["runs"] order),
+    "players": {
+        player_id: {
+            "last": timestamp of the latest run analysed,
+            "sessions": [[start, end, runs], ...],   # runs less than SESSION_GAP apart
+            "pbs": [[timestamp, time_ms], ...],       # each time the PB fell
+        },
+        ...
+    },
+}
+
+New runs later than everything analysed for their player extend the last session and PB, a run
+dated before (replay found late by the catch-up scan) recomputes that player only.
+"""
+import numpy as np
+
+from metrics import stage
+from run_record import PLAYER, REPLAY_TIME_MS, TIMESTAMP, runs_after, cursor
+
+SESSION_GAP = 30 * 60 # seconds without a run that end a session
+VECTORIZE_FROM = 32 # below this many new runs numpy costs more than it saves
+
+
+def _sessions(timestamps: np.ndarray) -> list:
+    """Sessions of sorted timestamps, as [start, end, runs]"""
+    starts = np.flatnonzero(np.diff(timestamps, prepend=timestamps[0] - SESSION_GAP - 1) > SESSION_GAP)
+    ends = np.append(starts[1:], len(timestamps)) - 1
+    return np.column_stack((timestamps[starts], timestamps[ends], ends - starts + 1)).tolist()
+
+
+def _pb_falls(timestamps: np.ndarray, times: np.ndarray, current_pb: int | None = None) -> list:
+    """[timestamp, time_ms] of the runs beating every run before them (and current_pb)"""
+    best_before = np.iinfo(np.int64).max if current_pb is None else current_pb
+    previous_best = np.minimum(np.concatenate(([best_before], np.minimum.accumulate(times)[:-1])), best_before)
+    improved = times < previous_best
+    return np.column_stack((timestamps[improved], times[improved])).tolist()
+
+
+def _analyse_player(timestamps: np.ndarray, times: np.ndarray) -> dict:
+    order = np.argsort(timestamps, kind="stable")
+    timestamps, times = timestamps[order], times[order]
+    return {"last": int(timestamps[-1]), "sessions": _sessions(timestamps), "pbs": _pb_falls(timestamps, times)}
+
+
+def _extend_player_runs(state: dict, runs: list):
+    sessions = state["sessions"]
+    pbs = state["pbs"]
+    for timestamp, time_ms in sorted(runs, key=lambda run: run[0]):
+        if timestamp - sessions[-1][1] <= SESSION_GAP:
+            sessions[-1][1] = timestamp
+            sessions[-1][2] += 1
+        else:
+            sessions.append([timestamp, timestamp, 1])
+        if time_ms < pbs[-1][1]:
+            pbs.append([timestamp, time_ms])
+    state["last"] = sessions[-1][1]
+
+
+def _extend_player(state: dict, timestamps: np.ndarray, times: np.ndarray):
+    order = np.argsort(timestamps, kind="stable")
+    timestamps, times = timestamps[order], times[order]
+    new_sessions = _sessions(timestamps)
+    last_session = state["sessions"][-1]
+    if new_sessions[0][0] - last_session[1] <= SESSION_GAP:
+        first = new_sessions.pop(0)
+        last_session[1] = first[1]
+        last_session[2] += first[2]
+    state["sessions"] += new_sessions
+    state["pbs"] += _pb_falls(timestamps, times, state["pbs"][-1][1])
+    state["last"] = int(timestamps[-1])
+
+
+def _player_runs(runs) -> dict:
+    by_player = {}
+    for run in runs:
+        by_player.setdefault(run[PLAYER], []).append((run[TIMESTAMP], run[REPLAY_TIME_MS]))
+    return by_player
+
+
+def _arrays(player_runs: list) -> tuple:
+    timestamps, times = np.array(player_runs, dtype=np.int64).T
+    return timestamps, times
+
+
+def update_analysis(map_data: dict) -> dict:
+    """Bring map_data["analysis"] up to date with map_data["runs"] and return it"""
+    runs = map_data["runs"]
+    analysis = map_data.get("analysis")
+    new_digests = None if analysis is None else runs_after(runs, analysis["runs"], analysis["last"])
+    if new_digests is None:
+        analysis = {"runs": 0, "last": None, "players": {}}
+        new_digests = list(runs)
+    if not new_digests:
+        map_data["analysis"] = analysis
+        return analysis
+
+    with stage("analysis_update"):
+        players = analysis["players"]
+        new_runs = _player_runs(runs[file_digest] for file_digest in new_digests)
+        for player, player_runs in new_runs.items():
+            state = players.get(player)
+            if state is None:
+                players[player] = _analyse_player(*_arrays(player_runs))
+            elif min(run[0] for run in player_runs) < state["last"]:
+                # A run older than the analysed ones changes everything after it
+                all_runs = _player_runs(run for run in runs.values() if run[PLAYER] == player)[player]
+                players[player] = _analyse_player(*_arrays(all_runs))
+            elif len(player_runs) < VECTORIZE_FROM:
+                _extend_player_runs(state, player_runs)
+            else:
+                _extend_player(state, *_arrays(player_runs))
+        analysis["runs"], analysis["last"] = cursor(runs)
+    map_data["analysis"] = analysis
+    return analysis
+
+
+def session_summary(state: dict) -> dict:
+    sessions = np.array(state["sessions"], dtype=np.int64).reshape(-1, 3)
+    durations = sessions[:, 1] - sessions[:, 0]
+    return {
+        "sessions": len(sessions),
+        "runs": int(sessions[:, 2].sum()),
+        "time_played": int(durations.sum()), # seconds between the first and last run of each session
+        "longest": int(durations.max()) if len(sessions) else 0,
+        "runs_per_session": float(sessions[:, 2].mean()) if len(sessions) else 0.0,
+    }
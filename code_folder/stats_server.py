@@ -0,0 +1,232 @@
+"""
+Local read-only HTTP API over the logged runs, for stream overlays and dashboards.
+
+GET /maps                     maps of the archive: uid, name
+GET /maps/<uid>               map info and number of runs
+GET /maps/<uid>/stats         get_map_stats_from_data as JSON
+GET /maps/<uid>/pbs           best time of each player, fastest first
+GET /maps/<uid>/runs          every run sorted by date, ?login=... to keep one player
+GET /maps/<uid>/sessions      sessions summary and PB progression of each player
+
+Responses are built once per version of the map data.pkl (its mtime and size) and of the player
+table, and served from memory with an ETag: a client polling with If-None-Match gets an empty 304 while nothing changed.
+Readers only load data.pkl files, which are replaced atomically by the ingestion, and read the app
+data from a published snapshot of the DataStore, so they never wait for the ingestion.
+"""
+import hashlib
+import json
+import threading
+from collections import OrderedDict
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from pathlib import Path
+from urllib.parse import urlsplit, parse_qs
+
+from data_handler import load
+from data_store import DataStore
+from metrics import stage, count
+from run_record import PLAYER, REPLAY_TIME_MS, RESPAWNS, STUNT_SCORE, TIMESTAMP
+from sessions import update_analysis, session_summary
+from storage import map_folder_path
+from treat_files import get_map_stats_from_data
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8765
+# Access-Control-Allow-Origin of the responses, None to only serve same origin pages and tools like curl:
+# "*" lets any web page read the API, an origin like "http://localhost:8080" only lets that one
+ALLOWED_ORIGIN = None
+MAX_RESPONSES = 64 # cached responses per map, the least recently used go first (one per ?login=...)
+
+
+def _map_stats_json(map_data: dict, players) -> dict:
+    stats = {}
+    for login, player_stats in get_map_stats_from_data(map_data, players).items():
+        names = sorted(player_stats.pop("names"))
+        stats[login] = {
+            "names": names,
+            "times": [
+                {"time_ms": time_ms, "count": time_stats["times"], "dates": sorted(time_stats["dates"]),
+                 "respawns": time_stats["respawns"], "stunt_score": time_stats["stunt_score"]}
+                for time_ms, time_stats in sorted(player_stats.items())
+            ],
+        }
+    return stats
+
+
+def _map_pbs_json(map_data: dict, players) -> list:
+    records = {}
+    for run in map_data["runs"].values():
+        record = records.get(run[PLAYER])
+        if record is None or run[REPLAY_TIME_MS] < record[REPLAY_TIME_MS]:
+            records[run[PLAYER]] = run
+    return [
+        {"login": players.login(player), "name": players.display_name(player),
+         "time_ms": run[REPLAY_TIME_MS], "date": run[TIMESTAMP]}
+        for player, run in sorted(records.items(), key=lambda item: (item[1][REPLAY_TIME_MS], item[1][TIMESTAMP]))
+    ]
+
+
+def _map_runs_json(map_data: dict, players) -> list:
+    return [
+        {"login": players.login(run[PLAYER]), "time_ms": run[REPLAY_TIME_MS], "date": run[TIMESTAMP],
+         "respawns": run[RESPAWNS], "stunt_score": run[STUNT_SCORE]}
+        for run in sorted(map_data["runs"].values(), key=lambda run: run[TIMESTAMP])
+    ]
+
+
+def _map_sessions_json(map_data: dict, players) -> dict:
+    return {
+        players.login(player): {**session_summary(state), "pbs": state["pbs"]}
+        for player, state in update_analysis(map_data)["players"].items()
+    }
+
+
+def _map_info_json(map_uid: str, map_data: dict) -> dict:
+    info = {key: value for key, value in map_data.items() if key not in ("runs", "schema", "analysis", "time_index", "run_index", "cold")}
+    info["uid"] = map_uid
+    info["runs"] = len(map_data["runs"])
+    return info
+
+
+class StatsCache:
+    """
+    Encoded responses by map, dropped as soon as the map data.pkl or the player table changes.
+
+    maps = {
+        map_uid: ((mtime_ns, size, players version), OrderedDict({(view, login): (etag, body), ...})),
+        ...
+    }
+    """
+    def __init__(self, destination: Path, store: DataStore):
+        self.destination = destination
+        self.store = store
+        self.maps = {}
+        self._lock = threading.Lock()
+
+    def map_version(self, map_uid: str) -> tuple | None:
+        try:
+            file_stat = (map_folder_path(self.destination, map_uid) / "data.pkl").stat()
+        except OSError:
+            return None
+        return file_stat.st_mtime_ns, file_stat.st_size
+
+    def map_list(self) -> tuple:
+        maps = sorted(self.store.snapshot()["map_uids"].items(), key=lambda item: item[1].lower())
+        return _encode([{"uid": map_uid, "name": name} for map_uid, name in maps])
+
+    def map_response(self, map_uid: str, view: str, login: str | None = None) -> tuple | None:
+        data_dict = self.store.snapshot()
+        version = self.map_version(map_uid)
+        if version is None or map_uid not in data_dict["map_uids"]:
+            return None
+        # Logins and names come from the player table: a new nickname changes the responses too
+        version += (data_dict["players"].version,)
+        key = (view, login)
+        with self._lock:
+            cached_version, responses = self.maps.get(map_uid, (None, None))
+            if cached_version == version and key in responses:
+                count("stats_api_cache_hits")
+                responses.move_to_end(key)
+                return responses[key]
+
+        # Built outside the lock: one slow map doesn't hold the other readers
+        with stage("stats_api_build"):
+            map_data = load(map_folder_path(self.destination, map_uid) / "data.pkl")
+            players = data_dict["players"]
+            if view == "info":
+                payload = _map_info_json(map_uid, map_data)
+            elif view == "stats":
+                payload = _map_stats_json(map_data, players)
+            elif view == "pbs":
+                payload = _map_pbs_json(map_data, players)
+            elif view == "sessions":
+                payload = _map_sessions_json(map_data, players)
+            else:
+                payload = _map_runs_json(map_data, players)
+                if login is not None:
+                    payload = [run for run in payload if run["login"] == login]
+            response = _encode(payload)
+
+        with self._lock:
+            cached_version, responses = self.maps.get(map_uid, (None, None))
+            if cached_version != version:
+                responses = OrderedDict()
+                self.maps[map_uid] = (version, responses)
+            responses[key] = response
+            if len(responses) > MAX_RESPONSES:
+                responses.popitem(last=False)
+        return response
+
+
+def _encode(payload) -> tuple:
+    body = json.dumps(payload, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+    return f'"{hashlib.md5(body).hexdigest()}"', body
+
+
+class _StatsHandler(BaseHTTPRequestHandler):
+    cache: StatsCache = None
+    allowed_origin: str | None = None
+
+    def do_GET(self):
+        count("stats_api_requests")
+        url = urlsplit(self.path)
+        parts = [part for part in url.path.split("/") if part]
+        query = parse_qs(url.query)
+
+        response = None
+        if parts == ["maps"]:
+            response = self.cache.map_list()
+        elif len(parts) == 2 and parts[0] == "maps":
+            response = self.cache.map_response(parts[1], "info")
+        elif len(parts) == 3 and parts[0] == "maps" and parts[2] in ("stats", "pbs", "runs", "sessions"):
+            login = query.get("login", [None])[0] if parts[2] == "runs" else None
+            response = self.cache.map_response(parts[1], parts[2], login)
+
+        if response is None:
+            self.send_json(404, _encode({"error": f"Nothing at {url.path}"}))
+            return
+        if self.headers.get("If-None-Match") == response[0]:
+            count("stats_api_not_modified")
+            self.send_response(304)
+            self.send_header("ETag", response[0])
+            self.end_headers()
+            return
+        self.send_json(200, response)
+
+    def send_json(self, status: int, response: tuple):
+        etag, body = response
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.send_header("ETag", etag)
+        self.send_header("Cache-Control", "no-cache")
+        if self.allowed_origin:
+            # Overlays are web pages from another origin (OBS browser source)
+            self.send_header("Access-Control-Allow-Origin", self.allowed_origin)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class StatsServer:
+    def __init__(self, destination: Path, store: DataStore, host: str = DEFAULT_HOST, port: int = DEFAULT_PORT,
+                 allowed_origin: str | None = ALLOWED_ORIGIN):
+        self.cache = StatsCache(Path(destination), store)
+        handler = type("StatsHandler", (_StatsHandler,), {"cache": self.cache, "allowed_origin": allowed_origin})
+        self.server = ThreadingHTTPServer((host, port), handler)
+        self.server.daemon_threads = True
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    @property
+    def url(self) -> str:
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        self.thread.start()
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+        self.thread.join()
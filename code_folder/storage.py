@@ -0,0 +1,102 @@
+"""
+Layout of the destination folder:
+
+destination/
+    <map uid>/                       one folder per map, named after its UID (names aren't unique)
+        data.pkl
+        <md5 digest>.Replay.Gbx      replays named after their content, placing one is a single path join
+        cold.pack                    replays moved to the cold tier, see cold_archive.py
+    by-name/
+        <map name> [<map uid>]/
+            <original file name>     hard links to the files above, to browse replays by map name
+
+The replay bytes are stored once, the by-name folder only holds links and can be rebuilt from data.pkl.
+data_dict["map_uids"] maps a UID to its name, data_dict["map_names"] a name to its UIDs.
+"""
+import os
+import re
+import shutil
+import threading
+from pathlib import Path
+
+
+NAMES_FOLDER = "by-name"
+REPLAY_SUFFIX = ".Replay.Gbx"
+
+# Characters windows doesn't allow in a file name
+_UNSAFE_CHARS_RE = re.compile(r'[<>:"/\\|?*\x00-\x1f]')
+
+_map_locks = {}
+_map_locks_lock = threading.Lock()
+
+
+def map_folder_path(destination: Path, map_uid: str) -> Path:
+    return destination / map_uid
+
+
+def map_lock(map_folder: Path) -> threading.Lock:
+    """
+    Lock of a map folder, held from loading its data.pkl to saving it: the ingest thread and
+    the GUI both write it, a save made from an older load would drop the runs added since.
+    """
+    key = os.path.normcase(os.path.abspath(map_folder))
+    with _map_locks_lock:
+        return _map_locks.setdefault(key, threading.Lock())
+
+
+def replay_path(map_folder: Path, file_digest: bytes) -> Path:
+    return map_folder / f"{file_digest.hex()}{REPLAY_SUFFIX}"
+
+
+def name_folder_path(destination: Path, map_name: str, map_uid: str) -> Path:
+    safe_name = _UNSAFE_CHARS_RE.sub("_", map_name).strip(" .") or "_"
+    return destination / NAMES_FOLDER / f"{safe_name} [{map_uid}]"
+
+
+def index_map_name(data_dict: dict, map_uid: str, map_name: str):
+    # Replaced rather than changed in place, readers may hold the previous version (see data_store)
+    map_names = data_dict.get("map_names", {})
+    if map_uid not in map_names.get(map_name, []):
+        data_dict["map_names"] = {**map_names, map_name: [*map_names.get(map_name, []), map_uid]}
+
+
+def find_maps(data_dict: dict, map_name: str) -> list:
+    return data_dict.get("map_names", {}).get(map_name, [])
+
+
+def store_replay(file: Path, map_folder: Path, file_digest: bytes) -> Path:
+    dst = replay_path(map_folder, file_digest)
+    if dst.exists():
+        # Same digest, same bytes: left by an interrupted ingest
+        file.unlink()
+    else:
+        shutil.move(str(file), str(dst))
+    return dst
+
+
+def link_by_name(stored: Path, destination: Path, map_name: str, map_uid: str, file_name: str):
+    """Hard link a stored replay under its map name and original file name"""
+    folder = name_folder_path(destination, map_name, map_uid)
+    folder.mkdir(parents=True, exist_ok=True)
+    link = folder / file_name
+    if link.exists():
+        if os.path.samefile(link, stored):
+            return
+        # The digest prefix makes the name unique, no probing
+        link = folder / f"{file_name.removesuffix(REPLAY_SUFFIX)}-{stored.name[:8]}{REPLAY_SUFFIX}"
+        if link.exists():
+            return
+    try:
+        os.link(stored, link)
+    except OSError as e:
+        # No hard links on this file system (FAT, some network drives): the view is only a convenience
+        print(f"[!] Could not link {stored.name} as {link} - {e}")
+
+
+def unlink_by_name(stored: Path, destination: Path, map_name: str, map_uid: str, file_name: str):
+    """Remove the by-name link of a stored replay, under either name link_by_name may have given it"""
+    folder = name_folder_path(destination, map_name, map_uid)
+    for link in (folder / file_name, folder / f"{file_name.removesuffix(REPLAY_SUFFIX)}-{stored.name[:8]}{REPLAY_SUFFIX}"):
+        if link.exists() and os.path.samefile(link, stored):
+            link.unlink()
+            return
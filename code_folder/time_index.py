@@ -0,0 +1,67 @@
+"""
+Sorted run times of a map, kept in memory (see index_cache.py) and updated on each ingest:
+
+time_index = {
+    "runs": number of runs indexed, "last": digest of the last one (see run_record.runs_after),
+    "all": [time_ms, ...],                 # every run of the map, sorted
+    "players": {player_id: [time_ms, ...]}, # runs of each player, sorted
+}
+
+Rank, percentile and "runs within X ms of the PB" are then bisections.
+"""
+from bisect import bisect_left, bisect_right, insort
+
+import index_cache
+from metrics import stage
+from run_record import PLAYER, REPLAY_TIME_MS, runs_after, cursor
+
+NEAR_PB_MS = 500
+
+
+def update_time_index(map_data: dict) -> dict:
+    runs = map_data["runs"]
+    map_data.pop("time_index", None) # Saved in data.pkl by older versions
+    with index_cache.lock:
+        index = index_cache.get_index("time_index", map_data)
+        new_digests = None if index is None else runs_after(runs, index["runs"], index["last"])
+        with stage("time_index_update"):
+            if new_digests is None:
+                players = {}
+                for run in runs.values():
+                    players.setdefault(run[PLAYER], []).append(run[REPLAY_TIME_MS])
+                for times in players.values():
+                    times.sort()
+                index = {"all": sorted(run[REPLAY_TIME_MS] for run in runs.values()), "players": players}
+            else:
+                for file_digest in new_digests:
+                    run = runs[file_digest]
+                    insort(index["all"], run[REPLAY_TIME_MS])
+                    insort(index["players"].setdefault(run[PLAYER], []), run[REPLAY_TIME_MS])
+            index["runs"], index["last"] = cursor(runs)
+        index_cache.put_index("time_index", map_data, index)
+    return index
+
+
+def rank(times: list, time_ms: int) -> int:
+    """1 for the fastest, equal times share their rank"""
+    return bisect_left(times, time_ms) + 1
+
+
+def percentile(times: list, time_ms: int) -> float:
+    """Share of the runs as fast or faster, in %: 1.0 means top 1%"""
+    return 100 * bisect_right(times, time_ms) / len(times)
+
+
+def within_pb(times: list, margin_ms: int = NEAR_PB_MS) -> int:
+    """Number of runs less than margin_ms slower than the best one (itself included)"""
+    return bisect_right(times, times[0] + margin_ms) if times else 0
+
+
+def describe_run(index: dict, player: int, time_ms: int, margin_ms: int = NEAR_PB_MS) -> str:
+    all_times = index["all"]
+    player_times = index["players"][player]
+    return (
+        f"Rank {rank(all_times, time_ms)}/{len(all_times)} on the map (top {percentile(all_times, time_ms):.1f}%), "
+        f"{rank(player_times, time_ms)}/{len(player_times)} of the player's runs (top {percentile(player_times, time_ms):.1f}%), "
+        f"{within_pb(player_times, margin_ms)} runs within {margin_ms} ms of the PB"
+    )
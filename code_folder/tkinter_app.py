@@ -1,37 +1,42 @@
+import math
+import threading
 from pathlib import Path
 from tkinter import (
-    Tk, Frame, Label, Button, filedialog, Text, END, DISABLED, NORMAL, Scrollbar, RIGHT, Y
+    Tk, Toplevel, Frame, Label, Button, Entry, Listbox, Checkbutton, BooleanVar, filedialog, messagebox, simpledialog, Text, END, DISABLED, NORMAL, Scrollbar, RIGHT, Y
 )
-from watchdog.observers import Observer
-from watchdog.events import FileSystemEventHandler
 from datetime import datetime
 
-from treat_files import treat_new_file, get_map_stats_from_data, plot_times, move_whole_directory, sanitise_replays
+from treat_files import treat_new_file, load_map_data, get_map_stats_from_data, get_map_splits, get_map_analysis, plot_times, plot_ghosts, sanitise_replays
 from data_handler import save, load, recur_display
+from data_store import DataStore
+from metrics import METRICS, MetricsExporter
+from run_record import PLAYER, REPLAY_TIME_MS
+from players import PlayerTable
+from migrations import SCHEMA_VERSION, needs_migration, migrate_archive
+from relocate import move_whole_directory
+from watcher import ReplayWatcher, make_source
+from stats_server import StatsServer
+from sessions import session_summary
+from live_plot import open_live_plot
+from local_maps import index_folders, LOCAL_MAPS_FILE
+from leaderboards import new_leaderboards, build_leaderboards, most_attempted_maps, best_improvements, top_players
+from map_search import MapSearch, build_map_index
+from run_filters import RunFilter, DAY
+from storage import map_folder_path
+
+METRICS_FILE = "metrics.prom"
+METRICS_INTERVAL = 15 # seconds
+SNAPSHOT_FILE = "sources_snapshot.pkl"
+
+
+def format_ms(value):
+    minutes, millis = divmod(value, 60000)
+    if minutes > 0:
+        return f"{minutes}:{millis / 1000:05.2f}"
+    return f"{millis / 1000:.2f}"
 
 
 
-class FileMover(FileSystemEventHandler):
-    def __init__(self, app):
-        self.app = app
-        self.dest = app.destination
-        self.data = app.data
-
-    def on_created(self, event):
-        if not event.is_directory:
-            src = Path(event.src_path)
-            try:
-                treat_new_file(src, self.dest, self.data)
-            except IndexError as e:
-                self.app.log(f"Error searching map data, contact Heavysaur0 for more info - {e}")
-                print(f"Error searching map data - {e}")
-            except Exception as e:
-                self.app.log("Error searching map data, are you sure the map is uploaded to TMX ?")
-                print(f"Error searching map data - {e}")
-            
-            self.app.save_data()
-
-
 class App:
     def __init__(self, master):
         self.master = master
@@ -39,29 +44,88 @@ class App:
 
         self.source = None
         self.destination = None
-        self.data = {"map_uids": {}}
-        self.observer = None
+        self.store = DataStore({
+            "map_uids": {}, "map_names": {}, "players": PlayerTable(), "schema": SCHEMA_VERSION,
+            "leaderboards": new_leaderboards(), "map_index": {},
+        })
+        self._save_lock = threading.Lock()
+        self.watcher = None
         self.watching = False
         self.watch_button = None
+        self.metrics_button = None
+        self.metrics_exporter = None
+        self.stats_button = None
+        self.leaderboards_button = None
+        self.leaderboard_login = ""
+        self.stats_server = None
         self.selected_map_folder = None
+        self.map_search = None
 
+        METRICS.enable()
         self.load_saved_data()
         self.build_main_ui()
+        self.master.protocol("WM_DELETE_WINDOW", self.close)
+
+    def close(self):
+        # Stopped properly so the source snapshot is saved for the next catch-up scan
+        if self.watching:
+            self.stop_watching()
+        if self.stats_server:
+            self.stats_server.stop()
+        self.master.destroy()
+
+    @property
+    def data(self) -> dict:
+        """Latest published snapshot of the data, read only: changes go through self.store.write()"""
+        return self.store.snapshot()
 
     def load_saved_data(self):
-        self.source, self.destination, self.data = load("data.pkl")
+        self.source, self.destination, data = load("data.pkl")
+        data.setdefault("players", PlayerTable())
+        if not data.get("map_uids"):
+            # Nothing logged yet: empty leaderboards and map index are complete ones
+            data.setdefault("leaderboards", new_leaderboards())
+            data.setdefault("map_index", {})
+        if "sources" not in data:
+            # Single source of the previous versions, it was watched without its subfolders
+            data["sources"] = [make_source(self.source, recursive=False)] if self.source else []
+        self.store = DataStore(data)
+        if "relocating_to" in self.data:
+            print("Resuming the interrupted move of the destination folder...")
+            self.relocate(Path(self.data["relocating_to"]))
+        if self.destination and needs_migration(self.data):
+            print("Migrating saved data to the new format...")
+            # Nothing else runs yet: the draft is migrated in place and saved after each map
+            with self.store.write() as draft:
+                migrate_archive(Path(self.destination), draft, lambda: self.save_data(draft))
+                draft.pop("leaderboards", None)
+                draft.pop("map_index", None)
+        if self.destination and "leaderboards" not in self.data:
+            print("Building the leaderboards...")
+            with self.store.write() as draft:
+                build_leaderboards(Path(self.destination), draft)
+            self.save_data()
+        if self.destination and "map_index" not in self.data:
+            print("Building the map search index...")
+            with self.store.write() as draft:
+                build_map_index(Path(self.destination), draft)
+            self.save_data()
         print("Loaded data:")
         recur_display("source", self.source, 1)
         recur_display("destination", self.destination, 1)
         recur_display("data", self.data, 1)
 
-    def save_data(self):
+    def save_data(self, data: dict | None = None):
         if self.destination:
-            save((self.source, self.destination, self.data), "data.pkl")
+            # The GUI and the ingest thread both save, the snapshot is taken in the lock so the last save is the latest version
+            with self._save_lock:
+                save((self.source, self.destination, self.data if data is None else data), "data.pkl")
 
     def clear_window(self):
         for widget in self.master.winfo_children():
-            widget.destroy()
+            # Live plot windows stay open while going through the screens
+            if not isinstance(widget, Toplevel):
+                widget.destroy()
 
     def build_main_ui(self):
         self.clear_window()
@@ -71,9 +135,10 @@ class App:
 
         Label(self.frame, text="Select Replay Folders", font=("Arial", 14, "bold")).pack(pady=(0, 10))
 
-        self.source_label = Label(self.frame, text=f"Source Folder: {self.source or 'None'}")
+        self.source_label = Label(self.frame, text=self.sources_text(), justify="left")
         self.source_label.pack()
-        Button(self.frame, text="Change Replay Source Folder", command=self.set_source).pack()
+        Button(self.frame, text="Add Replay Source Folder", command=self.add_source).pack()
+        Button(self.frame, text="Clear Replay Source Folders", command=self.clear_sources).pack()
 
         self.dest_label = Label(self.frame, text=f"Destination Folder: {self.destination or 'None'}")
         self.dest_label.pack(pady=(10, 0))
@@ -83,6 +148,13 @@ class App:
         self.watch_button.pack(pady=15)
 
         Button(self.frame, text="Map Data", command=self.build_map_data_folder_select_ui).pack(pady=(0, 10))
+        Button(self.frame, text="Index Local Maps", command=self.add_tracks_folder).pack(pady=(0, 10))
+        self.metrics_button = Button(self.frame, text="Ingest Metrics", command=self.show_metrics)
+        self.metrics_button.pack(pady=(0, 10))
+        self.stats_button = Button(self.frame, text="Stop Stats API" if self.stats_server else "Start Stats API", command=self.toggle_stats_server)
+        self.stats_button.pack(pady=(0, 10))
+        self.leaderboards_button = Button(self.frame, text="Leaderboards", command=self.display_leaderboards)
+        self.leaderboards_button.pack(pady=(0, 10))
         # Button(self.frame, text="Show All Map Stats", command=self.show_all_stats).pack(pady=(0, 10))
 
         self.log_area = Text(self.master, height=15, state=DISABLED)
@@ -91,23 +163,83 @@ class App:
         self.log_area.pack(side="left", fill="both", expand=True, padx=(10, 0))
         scrollbar.pack(side=RIGHT, fill=Y)
 
-    def set_source(self):
+    def sources_text(self):
+        if not self.data["sources"]:
+            return "Source Folders: None"
+        lines = ["Source Folders:"]
+        for source in self.data["sources"]:
+            options = "with subfolders" if source["recursive"] else "folder only"
+            if source["exclude"]:
+                options += f", except {' '.join(source['exclude'])}"
+            lines.append(f"{source['path']} ({options})")
+        return "\n".join(lines)
+
+    def add_source(self):
         path = filedialog.askdirectory(title="Select Replay Source Folder")
-        if path:
-            self.source = Path(path)
-            self.source_label.config(text=f"Source Folder: {self.source}")
-            self.log(f"Selected source folder: {self.source}")
-            self.save_data()
+        if not path:
+            return
+        recursive = messagebox.askyesno("Source Folder", "Also watch the replays saved in its subfolders?")
+        exclude = simpledialog.askstring(
+            "Source Folder", "Paths to ignore, separated by spaces (for example: Autosaves/*), leave empty for none:"
+        ) or ""
+        source = make_source(Path(path), recursive, exclude=exclude.split())
+        with self.store.write() as data:
+            data["sources"] = [other for other in data["sources"] if other["path"] != source["path"]] + [source]
+        # First source kept in the saved tuple for the scripts reading it
+        self.source = Path(self.data["sources"][0]["path"])
+        self.source_label.config(text=self.sources_text())
+        self.log(f"Added source folder: {path}")
+        self.save_data()
+
+    def clear_sources(self):
+        with self.store.write() as data:
+            data["sources"] = []
+        self.source = None
+        self.source_label.config(text=self.sources_text())
+        self.log("Cleared source folders.")
+        self.save_data()
 
     def set_destination(self):
         path = filedialog.askdirectory(title="Select Replay Destination Folder")
         if path:
-            new_path = Path(path)
-            move_whole_directory(self.destination, new_path)
-            self.destination = new_path
+            if not self.relocate(Path(path)):
+                self.log(f"Moving the replays to {path} stopped, it resumes when the app starts again.")
+                return
             self.dest_label.config(text=f"Destination Folder: {self.destination}")
             self.log(f"Selected destination folder: {self.destination}")
-            self.save_data()
+
+    def relocate(self, new_path: Path) -> bool:
+        # The target is saved first so an interrupted move resumes at the next start,
+        # the destination itself only changes once everything is in the new folder
+        with self.store.write() as data:
+            data["relocating_to"] = str(new_path)
+        self.save_data()
+        if not move_whole_directory(self.destination, new_path):
+            return False
+        self.destination = new_path
+        if self.stats_server:
+            self.stats_server.cache.destination = new_path
+        with self.store.write() as data:
+            del data["relocating_to"]
+        self.save_data()
+        return True
+
+    def add_tracks_folder(self):
+        path = filedialog.askdirectory(title="Select a Tracks Folder (its subfolders are indexed too)")
+        if not path:
+            return
+        self.log(f"Indexing the maps of {path}...")
+        threading.Thread(target=self.index_local_maps, args=([Path(path)],), daemon=True).start()
+
+    def index_local_maps(self, folders: list):
+        try:
+            added = index_folders(folders)
+        except Exception as e:
+            self.log(f"Error indexing local maps - {e}")
+            print(f"Error indexing local maps - {e}")
+            return
+        if folders or added:
+            self.log(f"Local maps index: {added} new maps")
 
     def toggle_watching(self):
         if self.watching:
@@ -116,32 +248,73 @@ class App:
             self.start_watching()
 
     def start_watching(self):
-        if not self.source or not self.destination:
+        if not self.data["sources"] or not self.destination:
             self.log("Error: Please select both source and destination folders.")
             return
 
-        self.log("Started watching folder. Click again or close the window to stop.")
-        handler = FileMover(self)
-        self.observer = Observer()
-        self.observer.schedule(handler, str(self.source), recursive=False)
-        self.observer.start()
+        self.log("Started watching folders. Click again or close the window to stop.")
+        self.watcher = ReplayWatcher(self.data["sources"], self.ingest_file, ignored=[self.destination], snapshot_file=SNAPSHOT_FILE)
+        self.watcher.start()
+        if LOCAL_MAPS_FILE.exists():
+            # Maps made or downloaded since the last scan
+            threading.Thread(target=self.index_local_maps, args=([],), daemon=True).start()
+
+        self.metrics_exporter = MetricsExporter(METRICS, METRICS_FILE, METRICS_INTERVAL)
+        self.metrics_exporter.start()
 
         self.watching = True
         self.watch_button.config(text="Stop Watching")
 
         for widget in self.frame.winfo_children():
-            if widget != self.watch_button:
+            if widget not in (self.watch_button, self.metrics_button, self.stats_button, self.leaderboards_button):
                 widget.config(state=DISABLED)
 
+    def ingest_file(self, file: Path):
+        try:
+            # Published only if the whole ingest went through, readers never see half of it
+            with self.store.write() as data:
+                ranking = treat_new_file(file, self.destination, data)
+            if ranking:
+                self.log(f"{file.name}: {ranking}")
+        except IndexError as e:
+            self.log(f"Error searching map data, contact Heavysaur0 for more info - {e}")
+            print(f"Error searching map data - {e}")
+        except Exception as e:
+            self.log("Error searching map data, are you sure the map is uploaded to TMX ?")
+            print(f"Error searching map data - {e}")
+        
+        self.save_data()
+
+    def toggle_stats_server(self):
+        if self.stats_server:
+            self.stats_server.stop()
+            self.stats_server = None
+            self.stats_button.config(text="Start Stats API")
+            self.log("Stopped the stats API.")
+            return
+        if not self.destination:
+            self.log("Please select a destination folder first.")
+            return
+        try:
+            self.stats_server = StatsServer(self.destination, self.store)
+        except OSError as e:
+            self.log(f"Could not start the stats API - {e}")
+            return
+        self.stats_server.start()
+        self.stats_button.config(text="Stop Stats API")
+        self.log(f"Stats API running on {self.stats_server.url}/maps")
+
     def stop_watching(self):
-        if self.observer:
-            self.observer.stop()
-            self.observer.join()
-            self.observer = None
+        if self.watcher:
+            self.watcher.stop()
+            self.watcher = None
+        if self.metrics_exporter:
+            self.metrics_exporter.stop()
+            self.metrics_exporter = None
 
         self.watching = False
         self.watch_button.config(text="Start Watching")
-        self.log("Stopped watching folder.")
+        self.log("Stopped watching folders.")
 
         for widget in self.frame.winfo_children():
             widget.config(state=NORMAL)
@@ -152,29 +325,47 @@ class App:
         frame = Frame(self.master)
         frame.pack(padx=10, pady=10)
 
-        Label(frame, text="Select Map Data Folder", font=("Arial", 14, "bold")).pack(pady=(0, 10))
+        Label(frame, text="Select Map", font=("Arial", 14, "bold")).pack(pady=(0, 10))
 
-        self.map_folder_label = Label(frame, text="No folder selected.")
+        self.map_folder_label = Label(frame, text="No map selected.")
         self.map_folder_label.pack()
 
-        Button(frame, text="Browse Map Folder", command=self.select_map_folder).pack(pady=5)
+        Label(frame, text="Search by name, UID, author or environment:").pack(pady=(10, 0))
+        self.map_search_entry = Entry(frame, width=50)
+        self.map_search_entry.pack()
+        self.map_search_entry.bind("<KeyRelease>", lambda event: self.update_map_search())
+        self.map_search_results = Listbox(frame, width=60, height=15)
+        self.map_search_results.pack(pady=5)
+        self.map_search_results.bind("<<ListboxSelect>>", lambda event: self.select_map_folder())
+        self.map_search_results.bind("<Double-Button-1>", lambda event: self.build_map_data_actions_ui())
+        self.map_search_entry.focus_set()
+        map_index = self.data.get("map_index", {})
+        # The index is replaced, never changed, by the ingestion: same dict, same search
+        if self.map_search is None or self.map_search.source is not map_index:
+            self.map_search = MapSearch(map_index)
+        self.update_map_search()
+
         Button(frame, text="OK", command=self.build_map_data_actions_ui).pack(pady=5)
         Button(frame, text="Back", command=self.build_main_ui).pack(pady=10)
 
-    def select_map_folder(self):
+    def update_map_search(self):
         if not self.destination:
             self.log("Please select a destination folder first.")
             return
-        self.log_area = None
+        # Searches the maps as they were when the screen was opened, no rebuild while typing
+        self.map_search_hits = self.map_search.search(self.map_search_entry.get())
+        self.map_search_results.delete(0, END)
+        for map_uid, name in self.map_search_hits:
+            self.map_search_results.insert(END, f"{name}  ({map_uid})")
 
-        path = Path(filedialog.askdirectory(title="Select a Folder Inside Destination", initialdir=self.destination))
-        if path:
-            if path.parent.resolve() == self.destination.resolve():
-                self.selected_map_folder = Path(path)
-                self.map_folder_label.config(text=f"Selected: {self.selected_map_folder}")
-                self.log(f"Selected map data folder: {self.selected_map_folder}")
-            else:
-                self.map_folder_label.config(text=f"Selected folder is not in the destination directory.")
+    def select_map_folder(self):
+        selection = self.map_search_results.curselection()
+        if not selection:
+            return
+        map_uid, name = self.map_search_hits[selection[0]]
+        self.selected_map_folder = map_folder_path(Path(self.destination), map_uid)
+        self.map_folder_label.config(text=f"Selected: {name} ({self.selected_map_folder})")
+        self.log(f"Selected map data folder: {self.selected_map_folder}")
 
     def build_map_data_actions_ui(self):
         if not self.selected_map_folder:
@@ -188,8 +379,24 @@ class App:
 
         Label(frame, text="Map Data Actions", font=("Arial", 14, "bold")).pack(pady=(0, 10))
 
+        # Filters of the stats and the plot of times
+        filters = Frame(frame)
+        filters.pack(pady=(0, 5))
+        Label(filters, text="Last days:").pack(side="left")
+        self.filter_days_entry = Entry(filters, width=5)
+        self.filter_days_entry.pack(side="left", padx=(0, 10))
+        Label(filters, text="Login:").pack(side="left")
+        self.filter_login_entry = Entry(filters, width=15)
+        self.filter_login_entry.pack(side="left", padx=(0, 10))
+        self.filter_clean_var = BooleanVar(value=False)
+        Checkbutton(filters, text="No respawn", variable=self.filter_clean_var).pack(side="left")
+
         Button(frame, text="Show map stats", command=self.display_map_stats).pack(pady=5)
         Button(frame, text="Plot map times", command=self.plot_map_times).pack(pady=5)
+        Button(frame, text="Live plot (updated while watching)", command=self.open_live_plot).pack(pady=5)
+        Button(frame, text="Show sector times", command=self.display_map_splits).pack(pady=5)
+        Button(frame, text="Plot PB trajectories", command=self.plot_map_ghosts).pack(pady=5)
+        Button(frame, text="Show sessions and PBs", command=self.display_map_sessions).pack(pady=5)
         Button(frame, text="Back", command=self.build_main_ui).pack(pady=10)
         
         self.log_area = Text(self.master, height=15, state=DISABLED)
@@ -202,6 +409,36 @@ class App:
     def show_all_stats(self):
         pass
 
+    def show_metrics(self):
+        self.log(METRICS.summary())
+
+    def display_leaderboards(self):
+        # One snapshot for the whole display, the ingest thread can publish new versions meanwhile
+        data = self.data
+        if "leaderboards" not in data:
+            self.log("Please select a destination folder first.")
+            return
+        leaderboards = data["leaderboards"]
+        players = data["players"]
+        
+        lines = ["Most attempted maps:"]
+        for map_uid, runs in most_attempted_maps(leaderboards):
+            best = ", ".join(f"{players.login(player)} {format_ms(time_ms)}" for player, time_ms, _, _ in top_players(leaderboards, map_uid, 3))
+            lines.append(f"  {data['map_uids'].get(map_uid, map_uid)}: {runs} runs - {best}")
+        
+        login = simpledialog.askstring("Leaderboards", "Login to show the most improved maps of:",
+                                       initialvalue=self.leaderboard_login)
+        if login:
+            self.leaderboard_login = login
+            lines.append("")
+            if login not in players.ids:
+                lines.append(f"No runs of {login}")
+            else:
+                lines.append(f"Most improved maps of {login}:")
+                for map_uid, first_ms, best_ms in best_improvements(leaderboards, players.ids[login]):
+                    lines.append(f"  {data['map_uids'].get(map_uid, map_uid)}: {format_ms(first_ms)} -> {format_ms(best_ms)} (-{format_ms(first_ms - best_ms)})")
+        self.log("\n".join(lines))
+
 
     def display_map_stats(self):
         """
@@ -219,18 +456,20 @@ class App:
         
         text being justified on the right
         """
-        data_file = self.selected_map_folder / "data.pkl"
-        map_data = load(data_file)
+        run_filter = self.map_run_filter()
+        if run_filter is None:
+            return
+        map_data = load_map_data(self.selected_map_folder)
         recur_display("map_data", map_data, 0)
         
-        map_stats = get_map_stats_from_data(map_data)
+        map_stats = get_map_stats_from_data(map_data, self.data["players"], run_filter)
         stats = []
         for login, dic in map_stats.items():
             for key, value in dic.items():
                 if key == "names": 
                     continue
                 
-                min_date = min(value["dates"], key=lambda dt: dt.timestamp())
+                min_date = datetime.fromtimestamp(min(value["dates"]))
                 total = value["times"]
                 respawn_avr = value["respawns"] / total
                 stuntscore_avr =  value["stunt_score"] / total
@@ -291,6 +530,10 @@ class App:
             f"Type: {map_data['type']}",
             f"Mood: {map_data['mood']}",
             "",
+        ]
+        if not run_filter.is_empty():
+            lines += [f"{sum(row[1] for row in stats)} of the {len(map_data['runs'])} runs match the filters", ""]
+        lines += [
             f"| {header_line} |",
             f"| {separator} |",
         ]
@@ -299,8 +542,107 @@ class App:
 
         self.log("\n".join(lines))
 
+    def display_map_splits(self):
+        """
+        Checkpoint and sector times of the record of each player, only those replays are decoded
+        (once, the splits are kept in the map data).
+        """
+        map_data = load(self.selected_map_folder / "data.pkl")
+        runs = map_data["runs"]
+        records = {}
+        for file_digest, run in runs.items():
+            player = run[PLAYER]
+            if player not in records or run[REPLAY_TIME_MS] < runs[records[player]][REPLAY_TIME_MS]:
+                records[player] = file_digest
+        
+        splits = get_map_splits(self.selected_map_folder, list(records.values()))
+        
+        lines = [f"Map: {map_data['name']}", ""]
+        best_sectors = []
+        for player, file_digest in sorted(records.items(), key=lambda item: runs[item[1]][REPLAY_TIME_MS]):
+            players = self.data["players"]
+            login = f"{players.display_name(player)} ({players.login(player)})"
+            checkpoints = splits.get(file_digest)
+            if not checkpoints:
+                lines.append(f"{login}: no checkpoint times found in the replay")
+                continue
+            sectors = [checkpoints[0]] + [b - a for a, b in zip(checkpoints, checkpoints[1:])]
+            for i, sector in enumerate(sectors):
+                if i == len(best_sectors):
+                    best_sectors.append(sector)
+                elif sector < best_sectors[i]:
+                    best_sectors[i] = sector
+            lines.append(f"{login}: {format_ms(checkpoints[-1])}")
+            lines.append("  Checkpoints: " + " | ".join(format_ms(value) for value in checkpoints))
+            lines.append("  Sectors:     " + " | ".join(format_ms(value) for value in sectors))
+        
+        if best_sectors:
+            lines.append("")
+            lines.append("Best sectors: " + " | ".join(format_ms(value) for value in best_sectors))
+            lines.append(f"Ideal time: {format_ms(sum(best_sectors))}")
+        
+        self.log("\n".join(lines))
+
+    def display_map_sessions(self):
+        analysis = get_map_analysis(self.selected_map_folder)
+        players = self.data["players"]
+        map_name = self.data["map_uids"].get(self.selected_map_folder.name, self.selected_map_folder.name)
+        
+        def format_date(timestamp):
+            return datetime.fromtimestamp(timestamp).strftime('%Y-%m-%d %H:%M')
+        
+        lines = [f"Map: {map_name}", ""]
+        # Most played first
+        for player, state in sorted(analysis["players"].items(), key=lambda item: -len(item[1]["sessions"])):
+            summary = session_summary(state)
+            lines.append(f"{players.display_name(player)} ({players.login(player)}): "
+                         f"{summary['sessions']} sessions, {summary['runs']} runs, "
+                         f"{summary['time_played'] / 3600:.1f}h played, longest session {summary['longest'] / 60:.0f} min, "
+                         f"{summary['runs_per_session']:.1f} runs per session")
+            previous = None
+            for timestamp, time_ms in state["pbs"]:
+                gain = "" if previous is None else f" (-{format_ms(previous - time_ms)})"
+                lines.append(f"  PB {format_ms(time_ms)}{gain} on {format_date(timestamp)}")
+                previous = time_ms
+        self.log("\n".join(lines))
+
+    def map_run_filter(self) -> RunFilter | None:
+        """Filter of the map actions inputs, None (and a message) if one is invalid"""
+        days = self.filter_days_entry.get().strip()
+        login = self.filter_login_entry.get().strip()
+        since = None
+        if days:
+            try:
+                days_value = float(days)
+            except ValueError:
+                days_value = math.nan
+            if not math.isfinite(days_value) or days_value <= 0:
+                self.log(f"Last days must be a positive number, not {days}.")
+                return None
+            now = datetime.now().timestamp()
+            # More days than since 1970 (or too many to compute) keep every run
+            since = None if days_value * DAY >= now else int(now - days_value * DAY)
+        players = ()
+        if login:
+            player = self.data["players"].ids.get(login)
+            if player is None:
+                self.log(f"No runs of {login}.")
+                return None
+            players = (player,)
+        return RunFilter(since=since, players=players, clean_only=self.filter_clean_var.get())
+
     def plot_map_times(self):
-        plot_times(self.selected_map_folder)
+        run_filter = self.map_run_filter()
+        if run_filter is not None:
+            plot_times(self.selected_map_folder, self.data["players"], run_filter)
+
+    def plot_map_ghosts(self):
+        plot_ghosts(self.selected_map_folder, self.data["players"])
+
+    def open_live_plot(self):
+        map_name = self.data["map_uids"].get(self.selected_map_folder.name, self.selected_map_folder.name)
+        open_live_plot(self.master, self.selected_map_folder, lambda: self.data["players"], map_name)
+        self.log(f"Live plot of {map_name} opened, start watching to see the new runs appear.")
 
     def log(self, message):
         if not hasattr(self, "log_area") or self.log_area is None:
@@ -2,7 +2,39 @@ import requests
 from bs4 import BeautifulSoup
 # -> pip install beautifulsoup4 requests
 
+from metrics import stage, count
+from official_maps import find_official_map
+from local_maps import find_local_map
+
 def get_tmnf_map_info(uid):
+    # Complete entries of the bundled official index and local maps of the Tracks folders index need no request
+    map_info = find_official_map(uid)
+    if map_info is not None:
+        count("official_map_hits")
+        if all(map_info.values()):
+            return map_info
+        return complete_map_info(uid, map_info)
+    map_info = find_local_map(uid)
+    if map_info is not None:
+        count("local_map_hits")
+        return map_info
+    return fetch_tmnf_map_info(uid)
+
+def complete_map_info(uid, map_info):
+    # Fields left blank in the bundled index are looked up online, the partial entry is kept offline
+    try:
+        online_info = fetch_tmnf_map_info(uid)
+    except Exception as e:
+        print(f"[!] Could not complete the map info of {uid} online - {e}")
+        return map_info
+    return {**online_info, **{key: value for key, value in map_info.items() if value}}
+
+def fetch_tmnf_map_info(uid):
+    count("xaseco_lookups")
+    with stage("xaseco_lookup"):
+        return _get_tmnf_map_info(uid)
+
+def _get_tmnf_map_info(uid):
     url = f"https://www.xaseco.org/uidfinder.php?uid={uid}"
     response = requests.get(url)
     
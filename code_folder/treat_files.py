@@ -1,131 +1,226 @@
 import shutil
 import os
 from pathlib import Path
-from datetime import datetime, timezone
 import matplotlib.pyplot as plt
 
 from track_name import get_tmnf_map_info
 from error_display import display_error
 from php_like import GBXReplayFetcher
-from file_uid import get_file_hash
+from file_uid import get_file_digest
+from run_record import make_run, replace_field, PLAYER, REPLAY_TIME_MS, RESPAWNS, STUNT_SCORE, TIMESTAMP, FILE_NAME, SPLITS
+from players import PlayerTable
 
 from data_handler import save, load, recur_display
-from parse_replay import is_gbx_file, is_gbx_data, is_validable, get_map_uid, get_times_match
+from parse_replay import is_gbx_file, parse_header_xml
+from metrics import stage, count
+from replay_body import replay_splits, replay_ghost
+from cold_archive import read_replay, restore_map, PACK_NAME
+from sessions import update_analysis
+import index_cache
+from time_index import update_time_index, describe_run
+from run_filters import RunFilter, update_run_index, filter_runs
+from leaderboards import new_leaderboards, update_leaderboards
+from map_search import update_map_entry
+from migrations import SCHEMA_VERSION, detect_schema
+from storage import NAMES_FOLDER, map_folder_path, map_lock, name_folder_path, replay_path, index_map_name, store_replay, link_by_name
 
+GBX_DEBUG = False
+PLOT_COLORS = [
+    'red', 'blue', 'green', 'orange', 'purple', 'brown', 'pink', 'olive', 'cyan', 'magenta', 'gold',
+    'darkgreen', 'navy', 'crimson', 'teal', 'coral', 'indigo', 'turquoise', 'darkorange',  'slateblue'
+]
 
-def treat_new_file(file: Path, destination: Path, data_dict: dict):
-    with open(file, "rb") as f:
-        data = f.read()
-    file_data = data.decode(errors="ignore")
-    pos = file_data.find("</header>")
-    if pos != -1:
-        file_data = file_data[:pos + 10]
-    
-    if not is_gbx_data(file_data):
+# Keys of the app data built from the runs, sanitise_replays rebuilds them and keeps the others
+RUN_DATA_KEYS = ("map_uids", "map_names", "players", "schema", "leaderboards", "map_index")
+
+# Called on the ingest thread with (map_uid, map_data, file_digest) once a run is saved
+RUN_LISTENERS = []
+
+
+def add_run_listener(listener):
+    RUN_LISTENERS.append(listener)
+
+
+def remove_run_listener(listener):
+    if listener in RUN_LISTENERS:
+        RUN_LISTENERS.remove(listener)
+
+
+def treat_new_file(file: Path, destination: Path, data_dict: dict) -> str | None:
+    """Log and move a replay file, return where the run ranks on its map if it was logged"""
+    count("replays_seen")
+    with stage("ingest"):
+        return _treat_new_file(file, destination, data_dict)
+
+def _treat_new_file(file: Path, destination: Path, data_dict: dict):
+    if not is_gbx_file(file):
         print("The file is not a GBX replay file.")
+        count("replays_not_gbx")
         return
     
-    validable = is_validable(file_data)
-    if not validable:
+    # Only the header block is read, the XML chunk is scanned once for all the run fields
+    replay_fetcher = GBXReplayFetcher(debug=GBX_DEBUG)
+    replay_fetcher.processFile(file)
+    with stage("xml_parse"):
+        header = parse_header_xml(replay_fetcher.xmlBytes)
+    
+    if not header.validable:
         print("Replay file is not validable, not displayed in logs.")
+        count("replays_not_validable")
         return
+    if header.best_time is None or header.map_uid is None:
+        print("[!] User stats not found")
+        return
+    map_uid = header.map_uid
     
-    map_uid = get_map_uid(file_data)
-    
-    if map_uid in data_dict["map_uids"]:
-        map_name = data_dict["map_uids"][map_uid]
-        map_folder_path = destination / map_name
-        data_file_path = map_folder_path / "data.pkl"
-        
-        map_data = load(data_file_path)
-    else:
-        map_data = get_tmnf_map_info(map_uid)
-        recur_display("map data", map_data, 0)
-        data_dict["map_uids"][map_uid] = map_data["name"] 
-        map_folder_path = destination / map_data["name"]
-        data_file_path = map_folder_path / "data.pkl"
+    map_folder = map_folder_path(destination, map_uid)
+    data_file_path = map_folder / "data.pkl"
+    # Held from the load to the save, the GUI saves this data.pkl too
+    with map_lock(map_folder):
+        if map_uid in data_dict["map_uids"]:
+            map_data = load(data_file_path)
+        else:
+            map_data = get_tmnf_map_info(map_uid)
+            recur_display("map data", map_data, 0)
+            data_dict["map_uids"] = {**data_dict["map_uids"], map_uid: map_data["name"]}
+            index_map_name(data_dict, map_uid, map_data["name"])
         
-        map_data["runs"] = {}
-        map_folder_path.mkdir()
-    
-    replay_info = {}
+            map_data["uid"] = map_uid
+            map_data["runs"] = {}
+            map_data["schema"] = SCHEMA_VERSION
+            map_folder.mkdir(exist_ok=True)
     
-    replay_fetcher = GBXReplayFetcher(debug=True)
-    replay_fetcher.processFile(file)
-    replay_info["user_name"] = replay_fetcher.nickname
-    replay_info["user_login"] = replay_fetcher.login
+        file_stat = file.stat()
+        creation_time = getattr(file_stat, "st_birthtime", file_stat.st_mtime) # No birth time on Linux
     
-    times_match = get_times_match(file_data)
-    if times_match:
-        replay_info["replay_time_ms"] = int(times_match.group(1))
-        replay_info["respawns"] = int(times_match.group(2))
-        replay_info["stunt_score"] = int(times_match.group(3))
-    else:
-        print("[!] User stats not found")
-        return
-
-    creation_time = file.stat().st_birthtime
-    utc_date = datetime.fromtimestamp(creation_time)
-    replay_info["utc_date"] = utc_date
+        with stage("hash"):
+            file_digest = get_file_digest(file)
+        if file_digest in map_data["runs"]:
+            print("Replay file ignored due to duplicate")
+            count("replays_duplicate")
+            return
     
-    file_hash = get_file_hash(file)
-    if file_hash in map_data["runs"]:
-        print("Replay file ignored due to duplicate")
-        return
-    map_data["runs"][file_hash] = replay_info
-    save(map_data, data_file_path)
+        data_dict["players"], player = data_dict["players"].with_player(replay_fetcher.login, replay_fetcher.nickname)
+        map_data["runs"][file_digest] = make_run(
+            player,
+            header.best_time,
+            header.respawns,
+            header.stunt_score,
+            int(creation_time),
+            file.name,
+        )
+        update_analysis(map_data)
+        with index_cache.lock:
+            ranking = describe_run(update_time_index(map_data), player, header.best_time)
+        update_run_index(map_data)
+        update_leaderboards(data_dict, map_uid, map_data)
+        update_map_entry(data_dict, map_uid, map_data)
+        # Saved last: if anything above fails, the run is in neither data.pkl nor the published data
+        save(map_data, data_file_path)
+    count("replays_ingested")
+    print(ranking)
+    for listener in list(RUN_LISTENERS):
+        try:
+            listener(map_uid, map_data, file_digest)
+        except Exception as e:
+            print(f"[!] Run listener failed - {e}")
     
     try:
-        dst = map_folder_path / file
-        file_name = Path(file.stem).stem # Remove the Replay Gbx
-        index = 0
-        while dst.exists():
-            dst = map_folder_path / f"{file_name}-({index}).Replay.Gbx"
-            index += 1
+        with stage("move"):
+            dst = store_replay(file, map_folder, file_digest)
+            link_by_name(dst, destination, map_data["name"], map_uid, file.name)
+        print(f"Moved: {file.name} to {dst}")
+    except Exception as e:
+        print(f"Error moving the file {file.name} - {e}")
+        display_error()
+    return ranking
+
+def get_map_splits(map_folder: Path, file_digests=None) -> dict:
+    """
+    Checkpoint times of the runs of a map (all of them if file_digests is None).
+    Replays are decoded the first time only, the splits are then kept with the run in data.pkl.
+    """
+    data_file = map_folder / "data.pkl"
+    map_data = load(data_file)
+    runs = map_data["runs"]
+    if file_digests is None:
+        file_digests = list(runs.keys())
+    
+    # Decoded without the map lock, the ingestion goes on meanwhile
+    decoded = {}
+    for file_digest in file_digests:
+        if runs[file_digest][SPLITS] is not None:
+            continue
         try:
-            shutil.move(str(file), str(dst))
-            print(f"Moved: {file.name} to {dst}")
-            file.unlink(True)
+            # Archived replays are read from the cold pack
+            decoded[file_digest] = replay_splits(read_replay(map_folder, map_data, file_digest))
         except Exception as e:
-            print(f"Error moving the file {dst} - {e}")
+            print(f"[!] Could not read the splits of {runs[file_digest][FILE_NAME]} - {e}")
             display_error()
-    except Exception as e:
-        print(f"Error moving {file.name}: {e}")
-        display_error()
-        return
+    if decoded:
+        with map_lock(map_folder):
+            # Merged into the latest data.pkl: runs may have been saved since it was loaded above
+            map_data = load(data_file)
+            latest = map_data["runs"]
+            for file_digest, splits in decoded.items():
+                if file_digest in latest:
+                    latest[file_digest] = replace_field(latest[file_digest], SPLITS, splits)
+            save(map_data, data_file)
+    
+    return {file_digest: decoded.get(file_digest, runs[file_digest][SPLITS]) for file_digest in file_digests}
 
-def get_map_stats_from_data(map_data: dict):
-    map_stats = {}
+def get_map_analysis(map_folder: Path) -> dict:
+    """Sessions and PB progression of the map (see sessions.py), saved if runs were added since"""
+    data_file = map_folder / "data.pkl"
+    map_data = load(data_file)
+    previous = map_data.get("analysis", {}).get("runs")
+    analysis = update_analysis(map_data)
+    if analysis["runs"] != previous:
+        with map_lock(map_folder):
+            # The analysis of the runs loaded above is brought up to date with the runs saved since
+            latest = load(data_file)
+            latest["analysis"] = analysis
+            analysis = update_analysis(latest)
+            save(latest, data_file)
+    return analysis
+
+def load_map_data(map_folder: Path) -> dict:
+    """Map data with its run index (see run_filters.py) up to date in memory"""
+    map_data = load(map_folder / "data.pkl")
+    update_run_index(map_data)
+    return map_data
+
+def get_map_stats_from_data(map_data: dict, players: PlayerTable, run_filter: RunFilter | None = None):
+    # Grouped on player ids, logins and nicknames are only resolved once per player at the end
+    player_stats = {}
     
-    for value in map_data["runs"].values():
-        name = value["user_name"]
-        login = value["user_login"]
-        time_ms = value["replay_time_ms"]
-        respawns = value["respawns"]
-        stunt_score = value["stunt_score"]
-        date = value["utc_date"]
+    for run in filter_runs(map_data, run_filter).values():
+        player = run[PLAYER]
+        time_ms = run[REPLAY_TIME_MS]
         
-        if login not in map_stats:
-            map_stats[login] = {"names": set([name])}
-        else:
-            map_stats[login]["names"].add(name)
+        if player not in player_stats:
+            player_stats[player] = {}
+        time_stats = player_stats[player].get(time_ms)
         
-        if time_ms not in map_stats[login]:
-            map_stats[login][time_ms] = {
+        if time_stats is None:
+            player_stats[player][time_ms] = {
                 "times": 1, 
-                "dates": set([date]), 
-                "respawns": respawns,
-                "stunt_score": stunt_score,
+                "dates": set([run[TIMESTAMP]]), 
+                "respawns": run[RESPAWNS],
+                "stunt_score": run[STUNT_SCORE],
             }
         else:
-            map_stats[login][time_ms]["times"] += 1
-            map_stats[login][time_ms]["dates"].add(date)
-            map_stats[login][time_ms]["respawns"] += respawns
-            map_stats[login][time_ms]["stunt_score"] += stunt_score
+            time_stats["times"] += 1
+            time_stats["dates"].add(run[TIMESTAMP])
+            time_stats["respawns"] += run[RESPAWNS]
+            time_stats["stunt_score"] += run[STUNT_SCORE]
     
+    map_stats = {}
+    for player, stats in player_stats.items():
+        map_stats[players.login(player)] = {"names": set(players.names(player)), **stats}
     return map_stats
 
-def get_map_stats(map_folder: Path | str):
+def get_map_stats(map_folder: Path | str, players: PlayerTable, run_filter: RunFilter | None = None):
     """
     return of layout:
     map_stats = {
@@ -133,7 +228,7 @@ def get_map_stats(map_folder: Path | str):
             "names": {..., ..., ...},
             time.1: {
                 "times": ...,
-                "dates": {..., ..., ...},
+                "dates": {..., ..., ...}, (timestamps in seconds)
                 "respawns": ...,
                 "stunt_score": ...,
             },
@@ -148,61 +243,62 @@ def get_map_stats(map_folder: Path | str):
         raise Exception(f"The map folder {map_folder} doesn't exist yet.")
     data_file = map_folder / "data.pkl" if isinstance(map_folder, Path) else os.path.join(map_folder, "data.pkl")
     map_data = load(data_file)
-    return get_map_stats_from_data(map_data)
+    return get_map_stats_from_data(map_data, players, run_filter)
 
-def plot_times(map_folder: Path | str):
-    if not os.path.exists(map_folder):
-        raise Exception(f"The map folder {map_folder} doesn't exist yet.")
-    data_file = map_folder / "data.pkl" if isinstance(map_folder, Path) else os.path.join(map_folder, "data.pkl")
-    data = load(data_file)["runs"]
-    if not data:
-        print("The map folder data is empty.")
-        return
-    
+def get_plot_data(data: dict, players: PlayerTable):
     x_dict = {}
     y_dict = {}
     
-    min_date_int = None
-    max_date_int = None
-    min_date = None
-    max_date = None
-    
-    for value in data.values():
-        login = value["user_login"]
-        time_ms = value["replay_time_ms"]
-        date = value["utc_date"]
-        
-        timestamp_float = date.timestamp()
-        date_int = int(timestamp_float)
-        
-        if min_date is None:
-            min_date = max_date = date
-            min_date_int = max_date_int = date_int
-        
-        if date_int < min_date_int:
-            min_date_int = date_int
-            min_date = date
-        if date_int > max_date_int:
-            max_date_int = date_int
-            max_date = date
-        
-        if login not in x_dict:
-            x_dict[login] = [date_int]
-            y_dict[login] = [time_ms / 1000]
+    for run in data.values():
+        player = run[PLAYER]
+        if player not in x_dict:
+            x_dict[player] = [run[TIMESTAMP]]
+            y_dict[player] = [run[REPLAY_TIME_MS] / 1000]
         else:
-            x_dict[login].append(date_int)
-            y_dict[login].append(time_ms / 1000)
+            x_dict[player].append(run[TIMESTAMP])
+            y_dict[player].append(run[REPLAY_TIME_MS] / 1000)
     
+    x_dict = {players.login(player): x for player, x in x_dict.items()}
+    y_dict = {players.login(player): y for player, y in y_dict.items()}
+    return x_dict, y_dict
+
+def get_pb_timelines(runs: dict, players: PlayerTable) -> dict:
+    """PB progression of each player among some runs, as in the analysis: {login: [[timestamp, time_ms], ...]}"""
+    pb_timelines = {}
+    for run in sorted(runs.values(), key=lambda run: run[TIMESTAMP]):
+        pbs = pb_timelines.setdefault(run[PLAYER], [])
+        if not pbs or run[REPLAY_TIME_MS] < pbs[-1][1]:
+            pbs.append([run[TIMESTAMP], run[REPLAY_TIME_MS]])
+    return {players.login(player): pbs for player, pbs in pb_timelines.items()}
+
+def plot_times(map_folder: Path | str, players: PlayerTable, run_filter: RunFilter | None = None):
+    if not os.path.exists(map_folder):
+        raise Exception(f"The map folder {map_folder} doesn't exist yet.")
+    filtered = run_filter is not None and not run_filter.is_empty()
+    if not filtered:
+        data_file = map_folder / "data.pkl" if isinstance(map_folder, Path) else os.path.join(map_folder, "data.pkl")
+        data = load(data_file)["runs"]
+    else:
+        data = filter_runs(load_map_data(Path(map_folder)), run_filter)
+    if not data:
+        print("No run matches the filters." if filtered else "The map folder data is empty.")
+        return
     
-    colors = [
-        'red', 'blue', 'green', 'orange', 'purple', 'brown', 'pink', 'olive', 'cyan', 'magenta', 'gold',
-        'darkgreen', 'navy', 'crimson', 'teal', 'coral', 'indigo', 'turquoise', 'darkorange',  'slateblue'
-    ]
+    x_dict, y_dict = get_plot_data(data, players)
+    if not filtered:
+        pb_timelines = {players.login(player): state["pbs"] for player, state in get_map_analysis(Path(map_folder))["players"].items()}
+    else:
+        # Best time among the shown runs, only these few runs are read
+        pb_timelines = get_pb_timelines(data, players)
     
     for i, login in enumerate(x_dict.keys()):
-        color = colors[i % len(colors)]
+        color = PLOT_COLORS[i % len(PLOT_COLORS)]
         plt.scatter(x_dict[login], y_dict[login], 
                     color=color, marker='o', label=login)
+        # PB progression, held until the next PB fell or the last run
+        pb_dates = [date for date, _ in pb_timelines[login]] + [max(x_dict[login])]
+        pb_times = [time_ms / 1000 for _, time_ms in pb_timelines[login]]
+        plt.step(pb_dates, pb_times + pb_times[-1:], where='post', color=color, alpha=0.6)
     
     plt.xlabel('Date')
     plt.ylabel('Time in seconds')
@@ -211,44 +307,107 @@ def plot_times(map_folder: Path | str):
     
     plt.show()
 
-def move_whole_directory(source: Path, destination: Path):
-    if source is None: 
+def plot_ghosts(map_folder: Path, players: PlayerTable, file_digests=None, max_samples: int = 2000):
+    """Trajectory seen from above and speed of runs of a map, by default the PB of each player"""
+    map_data = load(map_folder / "data.pkl")
+    runs = map_data["runs"]
+    if file_digests is None:
+        pbs = {}
+        for file_digest, run in runs.items():
+            best = pbs.get(run[PLAYER])
+            if best is None or run[REPLAY_TIME_MS] < runs[best][REPLAY_TIME_MS]:
+                pbs[run[PLAYER]] = file_digest
+        file_digests = sorted(pbs.values(), key=lambda file_digest: runs[file_digest][REPLAY_TIME_MS])[:len(PLOT_COLORS)]
+    if not file_digests:
+        print("The map folder data is empty.")
         return
     
-    shutil.move(str(source / "data.pkl"), str(destination))
-    map_folders = [map_folder for map_folder in source.iterdir() if map_folder.is_dir()]
-    for map_folder in map_folders:
-        shutil.move(str(map_folder), str(destination))
+    _, (path_axes, speed_axes) = plt.subplots(1, 2, figsize=(14, 6))
+    for i, file_digest in enumerate(file_digests):
+        run = runs[file_digest]
+        try:
+            # Only the plotted samples are kept, a long run has thousands of them
+            ghost = replay_ghost(read_replay(map_folder, map_data, file_digest), max_samples)
+        except Exception as e:
+            print(f"[!] Could not read the ghost of {run[FILE_NAME]} - {e}")
+            continue
+        color = PLOT_COLORS[i % len(PLOT_COLORS)]
+        label = f"{players.login(run[PLAYER])} {run[REPLAY_TIME_MS] / 1000:.2f}s"
+        path_axes.plot(ghost.position[:, 0], ghost.position[:, 2], color=color, label=label)
+        speed_axes.plot(ghost.time_ms / 1000, ghost.speed * 3.6, color=color, label=label)
+    
+    path_axes.set_aspect("equal")
+    path_axes.set_title("Trajectories seen from above")
+    speed_axes.set_xlabel("Time in seconds")
+    speed_axes.set_ylabel("Speed in km/h")
+    speed_axes.set_title("Speed")
+    path_axes.legend()
+    
+    plt.show()
+
+def _move_to_temporary(folder: Path, temporary_folder: Path, moved_files: set, file_names: dict | None = None):
+    """
+    Move the replays of a folder to the temporary folder, under their name in file_names if there.
+    moved_files holds the (device, inode) of the files already moved: other links to them are only removed.
+    """
+    for file in folder.iterdir():
+        if file.name == "data.pkl":
+            continue
+        file_stat = file.stat()
+        if (file_stat.st_dev, file_stat.st_ino) in moved_files:
+            file.unlink()
+            continue
+        moved_files.add((file_stat.st_dev, file_stat.st_ino))
+
+        name = (file_names or {}).get(file.name, file.name)
+        dst = temporary_folder / name
+        file_name = Path(Path(name).stem).stem # Remove the Replay Gbx
+        index = 0
+        while dst.exists():
+            dst = temporary_folder / f"{file_name}-({index}).Replay.Gbx"
+            index += 1
+        shutil.move(str(file), str(dst))
+        print(f"  Moved {file} to temporary folder.")
 
 
 def sanitise_replays(destination: Path, data_dict: dict):
-    data_dict = {"map_uids": {}}
+    # Emptied in place so the caller saves the rebuilt data, the settings (sources...) are kept
+    settings = {key: value for key, value in data_dict.items() if key not in RUN_DATA_KEYS}
+    data_dict.clear()
+    data_dict.update(settings)
+    data_dict["map_uids"] = {}
+    data_dict["map_names"] = {}
+    data_dict["players"] = PlayerTable()
+    data_dict["schema"] = SCHEMA_VERSION
+    # Every map is logged again: the leaderboards and the map index are rebuilt on the way
+    data_dict["leaderboards"] = new_leaderboards()
+    data_dict["map_index"] = {}
     temporary_folder = destination / "temp"
     if not temporary_folder.exists():
         temporary_folder.mkdir()
     
-    for folder in destination.iterdir():
+    # The by-name links go first: they carry the original file names,
+    # the digest named links to the same files are then only removed
+    moved_files = set()
+    names_folder = destination / NAMES_FOLDER
+    folders = list(names_folder.iterdir()) if names_folder.exists() else []
+    folders += [folder for folder in destination.iterdir() if folder.name != NAMES_FOLDER]
+    for folder in folders:
         if folder.name == "temp":
             continue
         if not folder.is_dir():
             print(f"{folder} isn't a folder, removing...")
             folder.unlink()
             continue
+        if (folder / PACK_NAME).exists():
+            print(f"Restoring the archived replays of {folder}")
+            restore_map(folder, load(folder / "data.pkl"))
         print(f"Moving entire {folder} to temporary folder")
-        for file in folder.iterdir():
-            if file.name == "data.pkl":
-                file.unlink()
-                continue
-            
-            dst = temporary_folder / file
-            file_name = Path(file.stem).stem # Remove the Replay Gbx
-            index = 0
-            while dst.exists():
-                dst = temporary_folder / f"{file_name}-({index}).Replay.Gbx"
-                index += 1
-            shutil.move(str(file), str(dst))
-            print(f"  Moved {file} to temporary folder.")
+        (folder / "data.pkl").unlink(missing_ok=True)
+        _move_to_temporary(folder, temporary_folder, moved_files)
         folder.rmdir()
+    if names_folder.exists():
+        names_folder.rmdir()
     
     for replay_file in temporary_folder.iterdir():
         
@@ -258,3 +417,40 @@ def sanitise_replays(destination: Path, data_dict: dict):
         treat_new_file(replay_file, destination, data_dict)
     
     temporary_folder.rmdir()
+
+
+def reingest_map_folder(map_folder: Path, destination: Path, data_dict: dict, map_data: dict):
+    """
+    Rebuild the runs of one map from its replay files, keeping the map info.
+    Used by migrations that need data only found in the files.
+    """
+    restore_map(map_folder, map_data)
+    temporary_folder = destination / "temp"
+    temporary_folder.mkdir(exist_ok=True)
+    # The replays keep their original names: the by-name links go first like in sanitise_replays,
+    # the files without a link (archived ones) get the name their run recorded
+    moved_files = set()
+    names_folder = name_folder_path(destination, map_data["name"], map_folder.name)
+    if names_folder.exists():
+        _move_to_temporary(names_folder, temporary_folder, moved_files)
+        names_folder.rmdir()
+    file_names = {}
+    if detect_schema(map_data) >= 3:
+        file_names = {
+            replay_path(map_folder, file_digest).name: run[FILE_NAME]
+            for file_digest, run in map_data["runs"].items() if run[FILE_NAME]
+        }
+    _move_to_temporary(map_folder, temporary_folder, moved_files, file_names)
+
+    map_data["runs"] = {}
+    map_data["schema"] = SCHEMA_VERSION
+    save(map_data, map_folder / "data.pkl")
+    for replay_file in temporary_folder.iterdir():
+        if not is_gbx_file(replay_file):
+            print(f"[!] File {replay_file} shouldn't be in temporary folder")
+            continue
+        treat_new_file(replay_file, destination, data_dict)
+    if any(temporary_folder.iterdir()):
+        print(f"[!] Some files of {map_folder.name} were not logged back, they are left in {temporary_folder}")
+    else:
+        temporary_folder.rmdir()
@@ -0,0 +1,260 @@
+"""
+Watching of the replay source folders.
+
+Every source root is scheduled on one shared Observer, its events are filtered on the
+include/exclude patterns and go to one IngestQueue: a single worker thread that ingests each
+file once, after it stopped changing for SETTLE_SECONDS (the game writes a replay in several steps).
+
+Files saved while the app was closed are found at start by comparing the source folders with the
+snapshot saved when watching stopped:
+
+snapshot = {
+    folder path: (folder mtime_ns, subfolder names, {file name: (size, mtime_ns)}),
+    ...
+}
+
+A folder whose mtime didn't change has the same entries, it's not listed again: the catch-up scan
+costs one stat per folder plus the listing of the folders that changed.
+Files modified in place without any rename don't change their folder and are only seen live.
+
+source = {
+    "path": str,
+    "recursive": bool,
+    "include": ["*.replay.gbx", ...], # matched on the file name, case insensitive
+    "exclude": ["autosaves/*", ...],  # matched on the path relative to the root, case insensitive
+}
+"""
+import os
+import threading
+import time
+from fnmatch import fnmatch
+from pathlib import Path
+
+from watchdog.observers import Observer
+from watchdog.events import FileSystemEventHandler
+
+from data_handler import save, load
+from metrics import stage, count
+
+DEFAULT_INCLUDE = ["*.replay.gbx"]
+SETTLE_SECONDS = 1.0
+
+
+def make_source(path: Path | str, recursive: bool = True, include: list | None = None, exclude: list | None = None) -> dict:
+    return {
+        "path": str(path),
+        "recursive": recursive,
+        "include": [pattern.lower() for pattern in include or DEFAULT_INCLUDE],
+        "exclude": [pattern.lower() for pattern in exclude or []],
+    }
+
+
+def source_matches(source: dict, file: Path) -> bool:
+    name = file.name.lower()
+    if not any(fnmatch(name, pattern) for pattern in source["include"]):
+        return False
+    try:
+        relative = file.relative_to(source["path"])
+    except ValueError:
+        return False
+    if not source["recursive"] and len(relative.parts) > 1:
+        return False
+    relative = relative.as_posix().lower()
+    return not any(fnmatch(relative, pattern) for pattern in source["exclude"])
+
+
+class IngestQueue(threading.Thread):
+    """Single consumer of the files to ingest, a file submitted many times is ingested once"""
+    def __init__(self, ingest, settle: float = SETTLE_SECONDS):
+        super().__init__(daemon=True)
+        self.ingest = ingest
+        self.settle = settle
+        self.pending = {} # path -> time of the last event
+        self.handled = set()
+        self._condition = threading.Condition()
+        self._stopped = False
+
+    def submit(self, file: Path):
+        with self._condition:
+            # Re-inserted at the end: pending stays ordered by last event, the oldest is first
+            if self.pending.pop(file, None) is not None:
+                count("watch_events_merged")
+            self.pending[file] = time.monotonic()
+            self._condition.notify()
+
+    def _next_ready(self) -> Path | None:
+        with self._condition:
+            while not self._stopped:
+                if not self.pending:
+                    self._condition.wait()
+                    continue
+                now = time.monotonic()
+                file, last_event = next(iter(self.pending.items()))
+                if now - last_event >= self.settle:
+                    del self.pending[file]
+                    return file
+                self._condition.wait(self.settle - (now - last_event))
+            return None
+
+    def run(self):
+        while (file := self._next_ready()) is not None:
+            if file.is_file():
+                self.ingest(file)
+            self.handled.add(file)
+
+    def stop(self) -> list:
+        """Stop the worker, return the files that were still waiting"""
+        with self._condition:
+            self._stopped = True
+            self._condition.notify()
+        self.join()
+        return list(self.pending)
+
+
+class _SourcesHandler(FileSystemEventHandler):
+    def __init__(self, sources: list, queue: IngestQueue, ignored: list):
+        self.sources = sources
+        self.queue = queue
+        self.ignored = ignored
+
+    def submit(self, path: str):
+        file = Path(path)
+        if any(file.is_relative_to(folder) for folder in self.ignored):
+            return
+        # Nested sources are only scheduled through their outer root, so every source is checked
+        if any(source_matches(source, file) for source in self.sources):
+            self.queue.submit(file)
+
+    def on_created(self, event):
+        if not event.is_directory:
+            self.submit(event.src_path)
+
+    def on_modified(self, event):
+        if not event.is_directory:
+            self.submit(event.src_path)
+
+    def on_moved(self, event):
+        if not event.is_directory:
+            self.submit(event.dest_path)
+
+
+class ReplayWatcher:
+    """One observer for all the source roots, feeding one ingest queue"""
+    def __init__(self, sources: list, ingest, ignored: list | None = None, snapshot_file: Path | str | None = None):
+        self.sources = sources
+        # The destination can be inside a watched folder: its own moves must not come back
+        self.ignored = [Path(folder) for folder in ignored or []]
+        self.queue = IngestQueue(ingest)
+        self.observer = Observer()
+        self.snapshot_file = snapshot_file
+        self.snapshot = {}
+        self.catch_up_thread = None
+
+    def start(self):
+        self.queue.start()
+        handler = _SourcesHandler(self.sources, self.queue, self.ignored)
+        for source in _outermost(self.sources):
+            self.observer.schedule(handler, source["path"], recursive=source["recursive"])
+        self.observer.start()
+        if self.snapshot_file is not None:
+            # Started after the observer: a file saved during the scan is seen by one or the other
+            self.catch_up_thread = threading.Thread(target=self.catch_up, daemon=True)
+            self.catch_up_thread.start()
+
+    def catch_up(self):
+        if Path(self.snapshot_file).exists():
+            self.snapshot = load(self.snapshot_file)
+        with stage("catch_up_scan"):
+            files = scan_sources(self.sources, self.snapshot, self.ignored)
+        print(f"Catch-up scan: {len(files)} new or changed replay files")
+        count("catch_up_files", len(files))
+        for file in files:
+            self.queue.submit(file)
+
+    def stop(self):
+        self.observer.stop()
+        self.observer.join()
+        if self.catch_up_thread is not None:
+            self.catch_up_thread.join()
+        waiting = self.queue.stop()
+        if self.snapshot_file is not None:
+            # Files that arrived after the observer stopped, or were never ingested, are caught up next time
+            unseen = [file for file in scan_sources(self.sources, self.snapshot, self.ignored) if file not in self.queue.handled]
+            forget_files(self.snapshot, waiting + unseen)
+            save(self.snapshot, self.snapshot_file)
+
+
+def _outermost(sources: list) -> list:
+    # A root inside another recursive root would get every event twice and cost one more watch
+    roots = []
+    for source in sources:
+        path = Path(source["path"])
+        if not path.is_dir():
+            print(f"[!] Source folder {path} not found, not watched")
+            continue
+        if any(other["recursive"] and other is not source and path.is_relative_to(other["path"]) and Path(other["path"]) != path
+               for other in sources):
+            continue
+        roots.append(source)
+    return roots
+
+
+def scan_sources(sources: list, snapshot: dict, ignored: list) -> list:
+    """Update the snapshot with the current source folders, return the new or changed files"""
+    changed = []
+    seen = set()
+    for source in _outermost(sources):
+        root = Path(source["path"])
+        folders = [root]
+        while folders:
+            folder = folders.pop()
+            key = str(folder)
+            if key in seen:
+                continue
+            seen.add(key)
+            try:
+                mtime = folder.stat().st_mtime_ns
+            except OSError:
+                continue
+
+            entry = snapshot.get(key)
+            if entry is not None and entry[0] == mtime:
+                subfolders = entry[1]
+            else:
+                old_files = entry[2] if entry is not None else {}
+                files = {}
+                subfolders = []
+                with os.scandir(folder) as entries:
+                    for dir_entry in entries:
+                        if dir_entry.is_dir(follow_symlinks=False):
+                            subfolders.append(dir_entry.name)
+                        elif dir_entry.is_file():
+                            file_stat = dir_entry.stat()
+                            signature = (file_stat.st_size, file_stat.st_mtime_ns)
+                            files[dir_entry.name] = signature
+                            if old_files.get(dir_entry.name) != signature:
+                                file = folder / dir_entry.name
+                                if any(source_matches(other, file) for other in sources):
+                                    changed.append(file)
+                subfolders = tuple(subfolders)
+                snapshot[key] = (mtime, subfolders, files)
+
+            if source["recursive"]:
+                for name in subfolders:
+                    subfolder = folder / name
+                    if not any(subfolder.is_relative_to(ignored_folder) for ignored_folder in ignored):
+                        folders.append(subfolder)
+
+    for key in [key for key in snapshot if key not in seen]:
+        del snapshot[key]
+    return changed
+
+
+def forget_files(snapshot: dict, files: list):
+    """Make the next scan report these files again (their folder is listed again too)"""
+    for file in files:
+        entry = snapshot.get(str(file.parent))
+        if entry is not None:
+            files_stats = dict(entry[2])
+            files_stats.pop(file.name, None)
+            snapshot[str(file.parent)] = (None, entry[1], files_stats)
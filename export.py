@@ -0,0 +1,40 @@
+"""Export the logged runs to CSV, JSON Lines or Parquet (Parquet needs pyarrow)
+
+python export.py runs.csv
+python export.py runs.jsonl --map "A01-Race" --login my_login --since 2024-01-01
+python export.py new_runs.csv --state export_state.json   # only the runs added since the last export with this state file"""
+
+import argparse
+import sys
+from datetime import datetime
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent / "code_folder"))
+
+from run_export import export_runs, FORMATS
+from data_handler import load
+
+data_file = Path(__file__).resolve().parent / "code_folder/data.pkl"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export the logged runs joined with their map info")
+    parser.add_argument("output", type=Path)
+    parser.add_argument("--format", choices=FORMATS, help="Default: from the output file extension")
+    parser.add_argument("--map", action="append", dest="maps", help="Map UID or name, can be repeated")
+    parser.add_argument("--login", action="append", dest="logins", help="Player login, can be repeated")
+    parser.add_argument("--since", type=datetime.fromisoformat, help="First date included (YYYY-MM-DD)")
+    parser.add_argument("--until", type=datetime.fromisoformat, help="First date excluded (YYYY-MM-DD)")
+    parser.add_argument("--state", type=Path, help="Incremental export: only the runs added since the last export using this file")
+    args = parser.parse_args()
+
+    if not data_file.exists():
+        print("Nothing to export, data file is not created yet.")
+        sys.exit(1)
+    _, destination, data = load(data_file)
+    written = export_runs(destination, data, args.output, args.format, args.maps, args.logins, args.since, args.until, args.state)
+    print(f"Exported {written} runs to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,29 @@
+"""Bring the saved data to the data format of this version, run after each update
+Only the stored records are rewritten, replay files are re-read only when a format change needs them"""
+
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent / "code_folder"))
+
+from migrations import migrate_archive, needs_migration
+from data_handler import save, load
+from error_display import display_error
+
+data_file = Path(__file__).resolve().parent / "code_folder/data.pkl"
+if not data_file.exists():
+    print("Nothing to migrate, data file is not created yet.")
+    sys.exit(0)
+
+source, destination, data = load(data_file)
+if not destination or not needs_migration(data):
+    print("Data is already up to date.")
+    sys.exit(0)
+
+print("Migrating data...")
+try:
+    migrate_archive(Path(destination), data, lambda: save((source, destination, data), data_file))
+except Exception as e:
+    display_error()
+    print(f"[!] The migration stopped, run it again to resume from where it stopped - {e}")
+    sys.exit(1)
@@ -1,14 +1,16 @@
 """File to sanitise replay files in case of problems
-Also used if I change data formats in a new version"""
+Data format changes are handled by migrate.py, without re-reading every replay"""
 
 import sys
 from pathlib import Path
 
-from code_folder.treat_files import sanitise_replays
-from code_folder.data_handler import save, load
-from code_folder.error_display import display_error
+sys.path.insert(0, str(Path(__file__).resolve().parent / "code_folder"))
 
-data_file = Path(__file__).resolve().parent / "code/data.pkl"
+from treat_files import sanitise_replays
+from data_handler import save, load
+from error_display import display_error
+
+data_file = Path(__file__).resolve().parent / "code_folder/data.pkl"
 if not data_file.exists():
     print("Couldn't sanitise, data file is not created yet.")
     sys.exit(1)
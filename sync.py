@@ -0,0 +1,59 @@
+"""Merge the runs of the archive of another PC with this one, both ways, sending only the missing runs
+
+python sync.py //other-pc/logger/code_folder/data.pkl
+python sync.py other/code_folder/data.pkl --destination //other-pc/Replays   # its destination as seen from here
+python sync.py other/code_folder/data.pkl --pull-only                         # only add its runs here
+Run it while neither app is watching: both archives are written."""
+
+import argparse
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent / "code_folder"))
+
+from archive_sync import ArchivePeer, SyncError, sync_archives
+from data_handler import save, load
+
+data_file = Path(__file__).resolve().parent / "code_folder/data.pkl"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Two-way sync of the runs and replays of two archives")
+    parser.add_argument("other", type=Path, help="App data file (code_folder/data.pkl) of the other archive")
+    parser.add_argument("--destination", type=Path, help="Destination folder of the other archive, default: the one in its data file")
+    parser.add_argument("--local", type=Path, default=data_file, help="App data file of this archive")
+    direction = parser.add_mutually_exclusive_group()
+    direction.add_argument("--pull-only", action="store_true", help="Only add the runs of the other archive to this one")
+    direction.add_argument("--push-only", action="store_true", help="Only add the runs of this archive to the other one")
+    args = parser.parse_args()
+
+    for file in (args.local, args.other):
+        if not file.exists():
+            print(f"Nothing to sync, {file} is not created yet.")
+            sys.exit(1)
+    local_source, local_destination, local_data = load(args.local)
+    other_source, other_destination, other_data = load(args.other)
+    # The data file keeps the path the other PC sees its destination under
+    other_path = args.destination or other_destination
+    if not local_destination or not other_path:
+        print("Both archives need a destination folder.")
+        sys.exit(1)
+
+    try:
+        local = ArchivePeer(Path(local_destination), local_data)
+        other = ArchivePeer(Path(other_path), other_data)
+    except SyncError as e:
+        print(f"{e}, open the app on the older one to migrate it first.")
+        sys.exit(1)
+    try:
+        result = sync_archives(local, other, push=not args.pull_only, pull=not args.push_only)
+    finally:
+        # Even after a failure: the maps already saved refer to the players added to the app data
+        save((local_source, local_destination, local_data), args.local)
+        save((other_source, other_destination, other_data), args.other)
+    print(f"{result['maps']} maps differed: {result['pulled']} runs added here, {result['pushed']} runs added there")
+    print(f"{result['bytes_sent'] / 1024:.1f} KB sent to the other archive, {result['bytes_received'] / 1024:.1f} KB received")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,73 @@
+import hashlib
+import random
+
+import archive_sync
+from archive_sync import ArchivePeer, sync_archives
+from data_handler import save, load
+from gbx_generator import build_replay
+from leaderboards import new_leaderboards
+from migrations import SCHEMA_VERSION
+from players import PlayerTable
+from run_record import PLAYER, make_run
+from storage import map_folder_path, replay_path, name_folder_path
+
+MAP_UID = "u" * 27
+
+
+def make_archive(destination, logins: list, seed: int, file_names: bool = True, **data) -> ArchivePeer:
+    rng = random.Random(seed)
+    map_folder = map_folder_path(destination, MAP_UID)
+    map_folder.mkdir(parents=True)
+    players = PlayerTable()
+    runs = {}
+    for index, login in enumerate(logins):
+        replay = build_replay(MAP_UID, login, 30_000 + index, body_size=2000, rng=rng)
+        file_digest = hashlib.md5(replay).digest()
+        replay_path(map_folder, file_digest).write_bytes(replay)
+        runs[file_digest] = make_run(players.get_id(login, login), 30_000 + index, 0, 0, seed * 1000 + index, f"{login}.Replay.Gbx" if file_names else None)
+    save({"uid": MAP_UID, "name": "Map", "runs": runs, "schema": SCHEMA_VERSION}, map_folder / "data.pkl")
+    data_dict = {"map_uids": {MAP_UID: "Map"}, "map_names": {"Map": [MAP_UID]}, "players": players, "schema": SCHEMA_VERSION, **data}
+    return ArchivePeer(destination, data_dict)
+
+
+def test_sync_in_bounded_batches(tmp_path, monkeypatch):
+    monkeypatch.setattr(archive_sync, "BATCH_BYTES", 5000)
+    local = make_archive(tmp_path / "local", ["a"] * 3, seed=1, leaderboards=new_leaderboards(), map_index={})
+    remote = make_archive(tmp_path / "remote", ["b"] * 7, seed=2)
+    exports = []
+    export = ArchivePeer.export_runs
+    monkeypatch.setattr(ArchivePeer, "export_runs", lambda self, *args: exports.append(export(self, *args)) or exports[-1])
+
+    result = sync_archives(local, remote)
+    assert (result["pulled"], result["pushed"]) == (7, 3)
+    # About 2 KB replays in 5000 bytes batches
+    assert max(len(exported) for _, exported, _ in exports) == 2
+    for peer in (local, remote):
+        runs = load(map_folder_path(peer.destination, MAP_UID) / "data.pkl")["runs"]
+        assert len(runs) == 10
+        assert all(replay_path(map_folder_path(peer.destination, MAP_UID), file_digest).exists() for file_digest in runs)
+
+    # The archive that had leaderboards and a map index keeps them up to date, the other isn't given partial ones
+    assert local.data_dict["leaderboards"]["maps"][MAP_UID]["runs"] == 10
+    assert local.data_dict["map_index"][MAP_UID]
+    assert "leaderboards" not in remote.data_dict and "map_index" not in remote.data_dict
+    assert sync_archives(local, remote)["maps"] == 0
+
+
+
+def test_sync_runs_without_file_name(tmp_path):
+    # Runs migrated from an archive that didn't keep the file names
+    local = make_archive(tmp_path / "local", ["a"] * 2, seed=1, file_names=False)
+    remote = make_archive(tmp_path / "remote", ["b"] * 2, seed=2, file_names=False)
+    local_digests = set(load(map_folder_path(local.destination, MAP_UID) / "data.pkl")["runs"])
+    result = sync_archives(local, remote)
+    assert (result["pulled"], result["pushed"]) == (2, 2)
+    for peer, imported in ((local, "b"), (remote, "a")):
+        map_folder = map_folder_path(peer.destination, MAP_UID)
+        runs = load(map_folder / "data.pkl")["runs"]
+        assert len(runs) == 4
+        assert {peer.data_dict["players"].login(run[PLAYER]) for run in runs.values()} == {"a", "b"}
+        # The imported replays are linked under their stored name
+        links = {link.name for link in name_folder_path(peer.destination, "Map", MAP_UID).iterdir()}
+        assert links == {replay_path(map_folder, file_digest).name for file_digest, run in runs.items()
+                         if (file_digest in local_digests) == (imported == "a")}
@@ -0,0 +1,64 @@
+import hashlib
+import random
+
+import pytest
+
+from cold_archive import PACK_NAME, archive_map, extract_replay, read_replay, restore_map
+from data_handler import save, load
+from gbx_generator import build_replay
+from players import PlayerTable
+from run_record import make_run
+from storage import map_folder_path, replay_path, name_folder_path, link_by_name
+
+MAP_UID = "c" * 27
+
+
+def make_map(destination, file_names: bool) -> tuple:
+    """Map with 2 runs of a player, the slower one is archived, by-name links like the ingest makes"""
+    rng = random.Random(1)
+    map_folder = map_folder_path(destination, MAP_UID)
+    map_folder.mkdir(parents=True)
+    players = PlayerTable()
+    runs = {}
+    replays = {}
+    for index, time_ms in enumerate((30_000, 31_000)):
+        replay = build_replay(MAP_UID, "a", time_ms, body_size=2000, rng=rng)
+        file_digest = hashlib.md5(replay).digest()
+        stored = replay_path(map_folder, file_digest)
+        stored.write_bytes(replay)
+        file_name = f"run{index}.Replay.Gbx" if file_names else None
+        link_by_name(stored, destination, "Map", MAP_UID, file_name or stored.name)
+        runs[file_digest] = make_run(players.get_id("a", "a"), time_ms, 0, 0, 1000 + index, file_name)
+        replays[time_ms] = file_digest, replay
+    save({"uid": MAP_UID, "name": "Map", "runs": runs}, map_folder / "data.pkl")
+    return map_folder, replays
+
+
+@pytest.mark.parametrize("file_names", [True, False])
+def test_archive_and_extract(tmp_path, file_names):
+    destination = tmp_path / "replays"
+    map_folder, replays = make_map(destination, file_names)
+    slow_digest, slow_replay = replays[31_000]
+    pb_digest, _ = replays[30_000]
+
+    assert archive_map(destination, MAP_UID)[0] == 1
+    map_data = load(map_folder / "data.pkl")
+    assert list(map_data["cold"]) == [slow_digest]
+    assert not replay_path(map_folder, slow_digest).exists()
+    assert replay_path(map_folder, pb_digest).exists()
+    # Only the PB is left in by-name
+    links = list(name_folder_path(destination, "Map", MAP_UID).iterdir())
+    assert len(links) == 1 and links[0].samefile(replay_path(map_folder, pb_digest))
+    assert read_replay(map_folder, map_data, slow_digest) == slow_replay
+    assert archive_map(destination, MAP_UID) == (0, 0)
+
+    output = tmp_path / "out"
+    output.mkdir()
+    extracted = extract_replay(map_folder, map_data, slow_digest, output)
+    assert extracted.name == ("run1.Replay.Gbx" if file_names else replay_path(map_folder, slow_digest).name)
+    assert extracted.read_bytes() == slow_replay
+
+    restore_map(map_folder, map_data)
+    assert replay_path(map_folder, slow_digest).read_bytes() == slow_replay
+    assert not (map_folder / PACK_NAME).exists()
+    assert "cold" not in load(map_folder / "data.pkl")
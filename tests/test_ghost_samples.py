@@ -0,0 +1,54 @@
+import random
+
+import numpy as np
+import pytest
+
+from gbx_generator import build_ghost_data, build_replay
+from replay_body import GBXBodyError, positions_at, replay_ghost
+
+SAMPLES = [(float(i), 9.5, -2.0 * i, speed) for i, speed in enumerate([0, 1, 10, 55.5, 120, 300])]
+
+
+def ghost_replay(ghost: bytes, compression: str = "U") -> bytes:
+    return build_replay("uid", "login", 500, checkpoints=[250, 500], body_size=200, ghost=ghost,
+                        body_compression=compression, rng=random.Random(0))
+
+
+def check_samples(ghost, samples):
+    np.testing.assert_array_equal(ghost.position, np.array([sample[:3] for sample in samples], dtype=np.float32))
+    # Speeds are stored as round(1000 * log(speed)), 0 when stopped
+    np.testing.assert_allclose(ghost.speed, [sample[3] for sample in samples], rtol=1e-3)
+
+
+@pytest.mark.parametrize("compression", ["U", "C"])
+def test_fixed_size_samples(compression):
+    ghost = replay_ghost(ghost_replay(build_ghost_data(SAMPLES, sample_period_ms=100), compression))
+    assert ghost.sample_period_ms == 100
+    np.testing.assert_array_equal(ghost.time_ms, [0, 100, 200, 300, 400, 500])
+    check_samples(ghost, SAMPLES)
+    assert ghost.speed[0] == 0
+
+
+def test_variable_size_samples_and_times():
+    times = [0, 90, 210, 300, 420, 500]
+    data = build_ghost_data(SAMPLES, times=times, sample_sizes=[22, 40, 30, 22, 64, 22], replaying=True)
+    ghost = replay_ghost(ghost_replay(data))
+    np.testing.assert_array_equal(ghost.time_ms, times)
+    check_samples(ghost, SAMPLES)
+
+
+def test_max_samples_keeps_the_ends():
+    samples = [(float(i), 0.0, 0.0, 50.0) for i in range(1001)]
+    ghost = replay_ghost(ghost_replay(build_ghost_data(samples, sample_period_ms=50)), max_samples=11)
+    np.testing.assert_array_equal(ghost.time_ms, np.arange(0, 50_001, 5000))
+    np.testing.assert_array_equal(ghost.position[:, 0], np.arange(0, 1001, 100))
+
+
+def test_positions_at():
+    ghost = replay_ghost(ghost_replay(build_ghost_data(SAMPLES)))
+    np.testing.assert_allclose(positions_at(ghost, [50, 500]), [[0.5, 9.5, -1.0], [5.0, 9.5, -10.0]])
+
+
+def test_no_ghost():
+    with pytest.raises(GBXBodyError):
+        replay_ghost(build_replay("uid", "login", 500, checkpoints=[500], rng=random.Random(0)))
@@ -0,0 +1,56 @@
+import live_plot
+import treat_files
+from data_handler import save, load
+from live_plot import LivePlot
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.figure import Figure
+from players import PlayerTable
+from run_record import make_run
+from sessions import update_analysis
+
+MAP_UID = "u" * 27
+
+
+def add_run(map_data: dict, index: int, player: int, time_ms: int) -> bytes:
+    file_digest = index.to_bytes(16, "big")
+    map_data["runs"][file_digest] = make_run(player, time_ms, 0, 0, 1_700_000_000 + index * 60)
+    update_analysis(map_data)
+    return file_digest
+
+
+def test_runs_saved_while_opening_are_drawn_once(tmp_path, monkeypatch):
+    map_folder = tmp_path / MAP_UID
+    map_folder.mkdir()
+    players = PlayerTable()
+    player = players.get_id("login", "login")
+    map_data = {"uid": MAP_UID, "name": "Map", "runs": {}}
+    for index in range(3):
+        add_run(map_data, index, player, 20_000 - index)
+    save(map_data, map_folder / "data.pkl")
+
+    def ingest_while_loading(data_file):
+        # A run saved and announced by the ingestion while the plot loads the map
+        file_digest = add_run(map_data, 3, player, 19_000)
+        save(map_data, data_file)
+        for listener in list(treat_files.RUN_LISTENERS):
+            listener(MAP_UID, map_data, file_digest)
+        return load(data_file)
+    monkeypatch.setattr(live_plot, "load", ingest_while_loading)
+
+    figure = Figure()
+    FigureCanvasAgg(figure)
+    plot = LivePlot(figure, map_folder, lambda: players)
+    try:
+        figure.canvas.draw()
+        assert plot.poll() == 1
+        assert plot.series[player].size == 4
+
+        # Runs announced after the load are added
+        file_digest = add_run(map_data, 4, player, 18_000)
+        plot.on_run(MAP_UID, map_data, file_digest)
+        plot.poll()
+        assert plot.series[player].size == 5
+        assert plot.series[player].pbs[-1][1] == 18_000
+    finally:
+        plot.close()
+    assert plot.on_run not in treat_files.RUN_LISTENERS
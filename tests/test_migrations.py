@@ -0,0 +1,30 @@
+import hashlib
+
+import migrations
+from migrations import content_addressed_files
+from run_record import make_run
+from storage import replay_path, name_folder_path
+
+
+def test_content_addressed_files_only_hashes_unknown_files(tmp_path, monkeypatch):
+    map_folder = tmp_path / "uid"
+    map_folder.mkdir()
+    replays = {name: name.encode() * 10 for name in ("named.Replay.Gbx", "unnamed.Replay.Gbx", "stranger.Replay.Gbx")}
+    for name, data in replays.items():
+        (map_folder / name).write_bytes(data)
+    digest = {name: hashlib.md5(data).digest() for name, data in replays.items()}
+    map_data = {"uid": "uid", "name": "Map", "runs": {
+        digest["named.Replay.Gbx"]: make_run(0, 1000, 0, 0, 0, "named.Replay.Gbx"),
+        digest["unnamed.Replay.Gbx"]: make_run(0, 2000, 0, 0, 0, None),
+    }}
+    hashed = []
+    monkeypatch.setattr(migrations, "get_file_digest", lambda file: hashed.append(file.name) or digest[file.name])
+
+    content_addressed_files(map_data, {}, map_folder)
+
+    assert sorted(hashed) == ["stranger.Replay.Gbx", "unnamed.Replay.Gbx"]
+    for name in ("named.Replay.Gbx", "unnamed.Replay.Gbx"):
+        assert replay_path(map_folder, digest[name]).read_bytes() == replays[name]
+    assert (map_folder / "stranger.Replay.Gbx").exists()
+    links = sorted(file.name for file in name_folder_path(tmp_path, "Map", "uid").iterdir())
+    assert links == ["named.Replay.Gbx", "unnamed.Replay.Gbx"]
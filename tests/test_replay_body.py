@@ -0,0 +1,58 @@
+import random
+
+import pytest
+
+from gbx_generator import build_replay, lzo_compress, make_checkpoints
+from replay_body import GBXBodyError, extract_body, lzo1x_decompress, replay_splits
+
+rng = random.Random(0)
+BLOCK = rng.randbytes(500)
+LZO_SAMPLES = {
+    "empty": b"",
+    "short literal": b"ab",
+    "run": bytes(5000), # overlapping copies and extended match lengths
+    "near repeats": b"".join(rng.choice([b"Stadium", b"Race", rng.randbytes(5), bytes(40)]) for _ in range(3000)),
+    "far repeats": BLOCK + rng.randbytes(20000) + BLOCK + rng.randbytes(20000) + BLOCK, # M3 and M4 distances
+    "incompressible": rng.randbytes(1000), # long literal runs
+}
+
+
+@pytest.mark.parametrize("name", LZO_SAMPLES)
+def test_lzo_round_trip(name):
+    data = LZO_SAMPLES[name]
+    compressed = lzo_compress(data)
+    assert lzo1x_decompress(compressed, len(data)) == data
+
+
+def test_lzo_compresses():
+    assert len(lzo_compress(LZO_SAMPLES["near repeats"])) < len(LZO_SAMPLES["near repeats"]) // 2
+
+
+def test_lzo_short_matches():
+    # M1 instructions, only emitted by real encoders: a 2 bytes match after 3 literals, then a literal
+    assert lzo1x_decompress(bytes([20]) + b"abc" + bytes([0x05, 0x00]) + b"d" + b"\x11\x00\x00") == b"abcbcd"
+    # and a 3 bytes match 2049 to 3072 bytes back after a long literal run
+    literals = rng.randbytes(2100)
+    distance = 2049 + 5
+    stream = b"\x00" + bytes(8) + bytes([2100 - 3 - 15 - 8 * 255]) + literals + bytes([(5 & 3) << 2, 5 >> 2]) + b"\x11\x00\x00"
+    assert lzo1x_decompress(stream) == literals + literals[-distance:-distance + 3]
+
+
+def test_lzo_size_mismatch():
+    with pytest.raises(GBXBodyError):
+        lzo1x_decompress(lzo_compress(b"abcabcabc"), 10)
+
+
+@pytest.mark.parametrize("compression", ["U", "C"])
+def test_replay_splits(compression):
+    checkpoints = make_checkpoints(45_678, 6, random.Random(1))
+    data = build_replay("uid", "login", 45_678, checkpoints=checkpoints, body_size=3000,
+                        body_compression=compression, rng=random.Random(2))
+    assert replay_splits(data) == checkpoints
+
+
+def test_compressed_body_matches_uncompressed():
+    checkpoints = [1000, 2000, 3000]
+    plain = build_replay("uid", "login", 3000, checkpoints=checkpoints, body_size=100, rng=random.Random(3))
+    packed = build_replay("uid", "login", 3000, checkpoints=checkpoints, body_size=100, body_compression="C", rng=random.Random(3))
+    assert extract_body(packed) == extract_body(plain)
@@ -0,0 +1,57 @@
+import csv
+from datetime import datetime, timezone
+
+from data_handler import save, load
+from players import PlayerTable
+from run_export import export_runs
+from run_record import make_run
+from storage import map_folder_path
+
+MAP_UID = "u" * 27
+DAY = 24 * 60 * 60
+START = datetime(2024, 1, 1, tzinfo=timezone.utc)
+
+
+def add_runs(destination, data_dict, runs):
+    map_folder = map_folder_path(destination, MAP_UID)
+    map_folder.mkdir(exist_ok=True)
+    data_file = map_folder / "data.pkl"
+    map_data = {"uid": MAP_UID, "name": "Map", "runs": {}}
+    if data_file.exists():
+        map_data = load(data_file)
+    for login, day in runs:
+        player = data_dict["players"].get_id(login, login)
+        file_digest = len(map_data["runs"]).to_bytes(16, "big")
+        map_data["runs"][file_digest] = make_run(player, 10_000 + day, 0, 0, int(START.timestamp()) + day * DAY)
+    save(map_data, data_file)
+
+
+def exported(output):
+    with open(output, encoding="utf-8") as file:
+        return sorted((row["login"], int(row["time_ms"]) - 10_000) for row in csv.DictReader(file))
+
+
+def test_filters(tmp_path):
+    data_dict = {"map_uids": {MAP_UID: "Map"}, "players": PlayerTable()}
+    add_runs(tmp_path, data_dict, [("a", 0), ("b", 1), ("a", 2), ("b", 3), ("a", 4)])
+    output = tmp_path / "runs.csv"
+    export_runs(tmp_path, data_dict, output, logins=["a"], since=datetime(2024, 1, 2, tzinfo=timezone.utc))
+    assert exported(output) == [("a", 2), ("a", 4)]
+    export_runs(tmp_path, data_dict, output, until=datetime(2024, 1, 3, tzinfo=timezone.utc))
+    assert exported(output) == [("a", 0), ("b", 1)]
+    assert export_runs(tmp_path, data_dict, output, logins=["nobody"]) == 0
+
+
+def test_cursors_per_filter(tmp_path):
+    data_dict = {"map_uids": {MAP_UID: "Map"}, "players": PlayerTable()}
+    state = tmp_path / "state.json"
+    output = tmp_path / "runs.csv"
+    add_runs(tmp_path, data_dict, [("a", 0), ("b", 1)])
+    assert export_runs(tmp_path, data_dict, output, logins=["a"], state_file=state) == 1
+    add_runs(tmp_path, data_dict, [("a", 2), ("b", 3)])
+    assert export_runs(tmp_path, data_dict, output, logins=["a"], state_file=state) == 1
+    assert exported(output) == [("a", 2)]
+    # The runs of b left out above are still new for another filter
+    export_runs(tmp_path, data_dict, output, logins=["b"], state_file=state)
+    assert exported(output) == [("b", 1), ("b", 3)]
+    assert export_runs(tmp_path, data_dict, output, logins=["b"], state_file=state) == 0
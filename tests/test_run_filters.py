@@ -0,0 +1,46 @@
+import random
+
+import index_cache
+from run_filters import RunFilter, filter_runs
+from run_record import make_run, PLAYER, RESPAWNS, TIMESTAMP
+
+
+def add_runs(runs: dict, count: int, rng: random.Random):
+    for _ in range(count):
+        runs[rng.randbytes(16)] = make_run(rng.randrange(6), rng.randint(10_000, 20_000), rng.choice((0, 0, 1)), 0, rng.randrange(1000))
+
+
+def brute_force(runs: dict, run_filter: RunFilter) -> set:
+    return {
+        file_digest for file_digest, run in runs.items()
+        if (run_filter.since is None or run[TIMESTAMP] >= run_filter.since)
+        and (run_filter.until is None or run[TIMESTAMP] < run_filter.until)
+        and (not run_filter.players or run[PLAYER] in run_filter.players)
+        and (not run_filter.clean_only or run[RESPAWNS] == 0)
+    }
+
+
+FILTERS = [
+    RunFilter(since=200), RunFilter(until=500), RunFilter(since=100, until=900, players=(1,)),
+    RunFilter(players=(2, 4), clean_only=True), RunFilter(since=300, clean_only=True), RunFilter(players=(99,)),
+]
+
+
+def test_filters_match_a_full_scan():
+    index_cache.clear()
+    rng = random.Random(0)
+    map_data = {"uid": "a", "runs": {}}
+    for _ in range(3):
+        # New runs between the filters go through the incremental update of the index
+        add_runs(map_data["runs"], 300, rng)
+        for run_filter in FILTERS:
+            matching = filter_runs(map_data, run_filter)
+            assert set(matching) == brute_force(map_data["runs"], run_filter)
+            assert [run[TIMESTAMP] for run in matching.values()] == sorted(run[TIMESTAMP] for run in matching.values())
+    assert "run_index" not in map_data
+
+
+def test_no_filter_keeps_every_run():
+    map_data = {"uid": "b", "runs": {}}
+    add_runs(map_data["runs"], 10, random.Random(1))
+    assert filter_runs(map_data, RunFilter()) is map_data["runs"]
@@ -0,0 +1,52 @@
+import json
+import urllib.request
+
+import stats_server
+from data_handler import save
+from data_store import DataStore
+from players import PlayerTable
+from run_record import make_run
+from stats_server import StatsCache, StatsServer
+from storage import map_folder_path
+
+MAP_UID = "u" * 27
+
+
+def make_archive(tmp_path) -> DataStore:
+    players = PlayerTable()
+    player = players.get_id("login", "Old name")
+    map_folder = map_folder_path(tmp_path, MAP_UID)
+    map_folder.mkdir()
+    save({"uid": MAP_UID, "name": "Map", "runs": {bytes(16): make_run(player, 1234, 0, 0, 1)}}, map_folder / "data.pkl")
+    return DataStore({"map_uids": {MAP_UID: "Map"}, "players": players})
+
+
+def test_new_nickname_rebuilds_the_responses(tmp_path):
+    store = make_archive(tmp_path)
+    cache = StatsCache(tmp_path, store)
+    assert json.loads(cache.map_response(MAP_UID, "pbs")[1])[0]["name"] == "Old name"
+    with store.write() as draft:
+        draft["players"], _ = draft["players"].with_player("login", "New name")
+    assert json.loads(cache.map_response(MAP_UID, "pbs")[1])[0]["name"] == "New name"
+
+
+def test_responses_per_map_are_bounded(tmp_path, monkeypatch):
+    monkeypatch.setattr(stats_server, "MAX_RESPONSES", 3)
+    cache = StatsCache(tmp_path, make_archive(tmp_path))
+    for index in range(10):
+        cache.map_response(MAP_UID, "runs", f"login{index}")
+    cache.map_response(MAP_UID, "runs", "login7")
+    cache.map_response(MAP_UID, "runs", "login10")
+    assert list(cache.maps[MAP_UID][1]) == [("runs", "login9"), ("runs", "login7"), ("runs", "login10")]
+
+
+def test_allowed_origin(tmp_path):
+    store = make_archive(tmp_path)
+    for allowed_origin in (None, "http://localhost:8080"):
+        server = StatsServer(tmp_path, store, port=0, allowed_origin=allowed_origin)
+        server.start()
+        try:
+            with urllib.request.urlopen(f"{server.url}/maps") as response:
+                assert response.headers.get("Access-Control-Allow-Origin") == allowed_origin
+        finally:
+            server.stop()
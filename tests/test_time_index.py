@@ -0,0 +1,46 @@
+import random
+
+import index_cache
+from run_record import make_run
+from time_index import update_time_index
+
+
+def make_map(uid: str, count: int, rng: random.Random) -> dict:
+    runs = {rng.randbytes(16): make_run(rng.randrange(5), rng.randint(10_000, 20_000), 0, 0, i) for i in range(count)}
+    return {"uid": uid, "runs": runs}
+
+
+def expected(map_data: dict) -> dict:
+    players = {}
+    for run in map_data["runs"].values():
+        players.setdefault(run[0], []).append(run[1])
+    return {"all": sorted(run[1] for run in map_data["runs"].values()), "players": {p: sorted(t) for p, t in players.items()}}
+
+
+def test_index_kept_in_memory_and_updated():
+    index_cache.clear()
+    rng = random.Random(0)
+    map_data = make_map("a", 200, rng)
+    map_data["time_index"] = {"stale": True}
+    first = update_time_index(map_data)
+    assert "time_index" not in map_data
+
+    # Another load of the same map with new runs updates the index in memory
+    reloaded = {"uid": "a", "runs": dict(map_data["runs"])}
+    reloaded["runs"].update(make_map("a", 50, rng)["runs"])
+    index = update_time_index(reloaded)
+    assert index is first
+    assert {key: index[key] for key in ("all", "players")} == expected(reloaded)
+
+    # An older copy doesn't fit the cursor: rebuilt
+    index = update_time_index(map_data)
+    assert index["runs"] == 200 and {key: index[key] for key in ("all", "players")} == expected(map_data)
+
+
+def test_cache_is_bounded(monkeypatch):
+    index_cache.clear()
+    monkeypatch.setattr(index_cache, "MAX_INDEXES", 3)
+    rng = random.Random(1)
+    for uid in "abcde":
+        update_time_index(make_map(uid, 10, rng))
+    assert [uid for _, uid in index_cache._indexes] == ["c", "d", "e"]
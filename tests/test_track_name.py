@@ -0,0 +1,27 @@
+import pytest
+
+import track_name
+
+A01 = "BeySZdnfuSh4nHY5xztiXLmlrXe"
+ONLINE = {"name": "A01-Race online", "section": "White", "author": "Nadeo", "environment": "Stadium", "type": "Race", "mood": "Day"}
+
+
+def test_blank_official_fields_completed_online(monkeypatch):
+    monkeypatch.setattr(track_name, "fetch_tmnf_map_info", lambda uid: dict(ONLINE))
+    map_info = track_name.get_tmnf_map_info(A01)
+    # The bundled values are kept, only the blank ones come from the lookup
+    assert map_info == {**ONLINE, "name": "A01-Race"}
+
+
+def test_partial_official_entry_offline(monkeypatch):
+    def offline(uid):
+        raise ConnectionError("offline")
+    monkeypatch.setattr(track_name, "fetch_tmnf_map_info", offline)
+    map_info = track_name.get_tmnf_map_info(A01)
+    assert map_info["name"] == "A01-Race" and map_info["section"] == ""
+
+
+def test_complete_entry_not_looked_up(monkeypatch):
+    monkeypatch.setattr(track_name, "find_official_map", lambda uid: dict(ONLINE))
+    monkeypatch.setattr(track_name, "fetch_tmnf_map_info", lambda uid: pytest.fail("looked up online"))
+    assert track_name.get_tmnf_map_info(A01) == ONLINE
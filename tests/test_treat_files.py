@@ -0,0 +1,95 @@
+import hashlib
+import random
+
+import pytest
+
+import treat_files
+from data_handler import save, load
+from gbx_generator import build_replay
+from players import PlayerTable
+from run_record import make_run, SPLITS
+from storage import map_folder_path, replay_path
+from watcher import make_source
+
+MAP_UID = "u" * 27
+
+
+def make_archive(tmp_path, checkpoints):
+    destination = tmp_path / "destination"
+    map_folder = map_folder_path(destination, MAP_UID)
+    map_folder.mkdir(parents=True)
+    players = PlayerTable()
+    runs = {}
+    for i, splits in enumerate(checkpoints):
+        data = build_replay(MAP_UID, f"p{i}", splits[-1], checkpoints=splits, rng=random.Random(i))
+        file_digest = hashlib.md5(data).digest()
+        replay_path(map_folder, file_digest).write_bytes(data)
+        runs[file_digest] = make_run(players.get_id(f"p{i}", f"p{i}"), splits[-1], 0, 0, i)
+    save({"uid": MAP_UID, "name": "Map", "runs": runs}, map_folder / "data.pkl")
+    data_dict = {"map_uids": {MAP_UID: "Map"}, "map_names": {"Map": [MAP_UID]}, "players": players}
+    return destination, map_folder, data_dict
+
+
+def new_replay(tmp_path, login: str, time_ms: int):
+    file = tmp_path / f"{login}.Replay.Gbx"
+    file.write_bytes(build_replay(MAP_UID, login, time_ms, rng=random.Random(time_ms)))
+    return file
+
+
+def test_splits_merged_with_runs_saved_meanwhile(tmp_path, monkeypatch):
+    destination, map_folder, data_dict = make_archive(tmp_path, [[1000, 2000], [1500, 2500]])
+    decode = treat_files.replay_splits
+
+    def ingest_while_decoding(data):
+        # A run saved by the ingestion between the load and the save of get_map_splits
+        if len(load(map_folder / "data.pkl")["runs"]) == 2:
+            treat_files.treat_new_file(new_replay(tmp_path, "new", 3000), destination, data_dict)
+        return decode(data)
+    monkeypatch.setattr(treat_files, "replay_splits", ingest_while_decoding)
+
+    splits = treat_files.get_map_splits(map_folder)
+    assert sorted(splits.values()) == [[1000, 2000], [1500, 2500]]
+    runs = load(map_folder / "data.pkl")["runs"]
+    assert len(runs) == 3
+    assert sorted(run[SPLITS] for run in runs.values() if run[SPLITS]) == [[1000, 2000], [1500, 2500]]
+
+
+def test_analysis_merged_with_runs_saved_meanwhile(tmp_path, monkeypatch):
+    destination, map_folder, data_dict = make_archive(tmp_path, [[2000], [2500]])
+    update = treat_files.update_analysis
+    calls = []
+
+    def ingest_after_first_analysis(map_data):
+        calls.append(len(map_data["runs"]))
+        if len(calls) == 1:
+            treat_files.treat_new_file(new_replay(tmp_path, "new", 3000), destination, data_dict)
+        return update(map_data)
+    monkeypatch.setattr(treat_files, "update_analysis", ingest_after_first_analysis)
+
+    analysis = treat_files.get_map_analysis(map_folder)
+    assert analysis["runs"] == 3
+    assert load(map_folder / "data.pkl")["analysis"]["runs"] == 3
+
+
+def test_failed_ingest_saves_nothing(tmp_path, monkeypatch):
+    destination, map_folder, data_dict = make_archive(tmp_path, [[2000]])
+    before = (map_folder / "data.pkl").read_bytes()
+
+    def fail(*args):
+        raise RuntimeError("map index")
+    monkeypatch.setattr(treat_files, "update_map_entry", fail)
+    with pytest.raises(RuntimeError):
+        treat_files.treat_new_file(new_replay(tmp_path, "new", 3000), destination, data_dict)
+    assert (map_folder / "data.pkl").read_bytes() == before
+
+
+def test_sanitise_keeps_settings(tmp_path, monkeypatch):
+    destination, map_folder, data_dict = make_archive(tmp_path, [[2000], [2500]])
+    sources = [make_source("C:/Replays", exclude=["autosaves/*"]), make_source("D:/More", recursive=False)]
+    data_dict["sources"] = sources
+    monkeypatch.setattr(treat_files, "get_tmnf_map_info", lambda uid: {"name": "Map"})
+
+    treat_files.sanitise_replays(destination, data_dict)
+    assert data_dict["sources"] == sources
+    assert data_dict["map_uids"] == {MAP_UID: "Map"}
+    assert len(load(map_folder / "data.pkl")["runs"]) == 2
@@ -56,7 +56,7 @@ def check_for_update():
         download_and_extract_zip()
         with open("version.txt", "w") as f:
             f.write(remote_version)
-        subprocess.run([sys.executable, Path(__file__).resolve().parent / "sanitise.py"])
+        subprocess.run([sys.executable, Path(__file__).resolve().parent / "migrate.py"])
     else:
         print("You already have the latest version.")
 